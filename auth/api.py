@@ -1,6 +1,8 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Response
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from sqlalchemy.exc import IntegrityError
 
@@ -8,25 +10,45 @@ from jwt import (
     create_access_token,
     get_current_user,
     get_current_active_user,
+    get_token_payload,
+    role_claims,
+    token_roles,
+    token_scopes,
+    user_roles,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from password import verify_password, validate_password
+from password import (
+    validate_password,
+    get_password_hash_async,
+    verify_password_async,
+    verify_and_update_password
+)
 from models import AuthUser
 from schemas import (
     AuthUserCreate,
     AuthUser as AuthUserSchema,
     Token,
     PasswordReset,
+    PasswordResetConfirm,
     PasswordChange
 )
-from database import get_db_session
+from database import engine, get_db_session, warm_pool, pool_monitor, pool_status
+from rate_limit import enforce_login_rate_limit, enforce_password_reset_rate_limit, refund_login_attempt
+from metrics import render_latest
+from query_profile import QueryProfileMiddleware, instrument
 from crud import (
     get_user_by_email,
     create_user,
     blacklist_token,
     update_password,
-    update_last_login
+    get_valid_reset_token,
+    consume_reset_token
 )
+from last_login import last_login_buffer, password_rehash_buffer
+from provisioning import provisioning_worker, PROVISIONING_ENABLED
+from jobs import job_scheduler, JOBS_ENABLED
+from mailer import deliver_mail
+from password_reset import issue_reset_token, hash_reset_token
 
 # Create router for auth endpoints first
 router = APIRouter(
@@ -78,15 +100,46 @@ async def logout(
 @router.post("/password-reset", response_model=dict)
 async def request_password_reset(
     reset_request: PasswordReset,
+    request: Request,
     db: AsyncSession = Depends(get_db_session)
 ):
     """Request a password reset."""
+    await enforce_password_reset_rate_limit(request, reset_request.email)
     user = await get_user_by_email(db, email=reset_request.email)
-    if user:
-        # In a real application, send password reset email here
-        pass
+    if user and user.is_active:
+        await issue_reset_token(db, user)
+        # Send in the background now rather than on the next mail poll
+        job_scheduler.once(deliver_mail, name="deliver_mail_now")
     return {"message": "If the email exists, a reset link has been sent"}
 
+@router.post("/password-reset/confirm", response_model=dict)
+async def confirm_password_reset(
+    reset_confirm: PasswordResetConfirm,
+    db: AsyncSession = Depends(get_db_session)
+):
+    """Set a new password using a password reset token."""
+    token = await get_valid_reset_token(db, hash_reset_token(reset_confirm.token))
+    if not token:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid or expired reset token"
+        )
+    
+    # Validate new password
+    if error_msg := validate_password(reset_confirm.new_password):
+        raise HTTPException(
+            status_code=400,
+            detail=error_msg
+        )
+    
+    hashed_password = await get_password_hash_async(reset_confirm.new_password)
+    if not await consume_reset_token(db, token, hashed_password):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid or expired reset token"
+        )
+    return {"message": "Password has been reset"}
+
 @router.post("/change-password")
 async def change_password(
     password_change: PasswordChange,
@@ -94,7 +147,7 @@ async def change_password(
     db: AsyncSession = Depends(get_db_session)
 ):
     """Change user password."""
-    if not verify_password(password_change.current_password, current_user.hashed_password):
+    if not await verify_password_async(password_change.current_password, current_user.hashed_password):
         raise HTTPException(
             status_code=400,
             detail="Incorrect password"
@@ -112,6 +165,7 @@ async def change_password(
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
+    account_key: str = Depends(enforce_login_rate_limit),
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db_session)
 ):
@@ -125,13 +179,15 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verify password
-    if not verify_password(form_data.password, user.hashed_password):
+    # Verify password, rehashing it if the hashing policy changed since it was stored
+    valid, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    await refund_login_attempt(account_key)
     
     # Check if user is active
     if not user.is_active:
@@ -141,14 +197,16 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Create access token with user_id
+    # Create access token with user_id, roles and scopes
     access_token = create_access_token(
-        data={"sub": user.email},
+        data={"sub": user.email, **role_claims(user_roles(user))},
         user_id=user.id
     )
     
-    # Update last login timestamp
-    await update_last_login(db, user.id)
+    # Record last login timestamp and any upgraded hash; flushed in batches off the request path
+    last_login_buffer.record(user.id)
+    if new_hash:
+        password_rehash_buffer.record(user.id, user.hashed_password, new_hash)
     
     return {
         "access_token": access_token,
@@ -158,14 +216,38 @@ async def login_for_access_token(
 @router.get("/verify")
 async def verify_token(
     current_user: AuthUser = Depends(get_current_active_user),
+    payload: dict = Depends(get_token_payload),
     response: Response = None
 ):
-    """Verify token and return user information for routing."""
+    """Verify token and return user information for routing and authorization."""
+    roles = token_roles(payload)
+    scopes = token_scopes(payload)
     response.headers["X-User-Id"] = str(current_user.id)
-    return {"valid": True, "user_id": current_user.id} 
+    response.headers["X-User-Roles"] = ",".join(roles)
+    response.headers["X-User-Scopes"] = " ".join(scopes)
+    return {"valid": True, "user_id": current_user.id, "roles": roles, "scopes": scopes} 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background tasks on startup and drain them on shutdown."""
+    await warm_pool()
+    pool_monitor.start()
+    last_login_buffer.start()
+    password_rehash_buffer.start()
+    if PROVISIONING_ENABLED:
+        provisioning_worker.start()
+    if JOBS_ENABLED:
+        job_scheduler.start()
+    yield
+    await job_scheduler.stop()
+    await provisioning_worker.stop()
+    await password_rehash_buffer.stop()
+    await last_login_buffer.stop()
+    await pool_monitor.stop()
 
 # Create FastAPI app instance after defining all router endpoints
 app = FastAPI(
+    lifespan=lifespan,
     title="Auth API",
     description="Authentication service with JWT tokens",
     version="1.0.0",
@@ -173,10 +255,21 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+app.add_middleware(QueryProfileMiddleware)
+instrument(engine)
+
 # Add ping endpoint
 @app.get("/ping", tags=["health"])
 def ping():
     return {"message": "pong"}
 
+@app.get("/health/db", tags=["health"])
+def health_db():
+    return pool_status()
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+def metrics():
+    return render_latest()
+
 # Include the router in the app
 app.include_router(router) 
\ No newline at end of file
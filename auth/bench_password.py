@@ -0,0 +1,70 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from passlib.hash import argon2
+
+from password import CALIBRATION_PASSWORD, HashingPolicy, hashing
+
+# Throughput of password hashing policies, in hashes per second per core.
+# A login costs one verify, which costs the same as one hash, so this is
+# also the ceiling on logins per second per core. Runs hashes in parallel
+# processes so contention (memory bandwidth for argon2) shows up.
+
+
+def hash_for(policy: HashingPolicy, seconds: float) -> int:
+    """Hash with policy's preferred scheme for about seconds; returns the hash count."""
+    context = policy.context()
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        context.hash(CALIBRATION_PASSWORD)
+        count += 1
+    return count
+
+
+def measure(policy: HashingPolicy, processes: int, seconds: float) -> Tuple[float, float]:
+    """
+    Returns:
+        Hashes per second per core and milliseconds per hash
+    """
+    with ProcessPoolExecutor(processes) as pool:
+        # Warm the processes up so their start-up is not timed
+        list(pool.map(hash_for, [policy] * processes, [0.0] * processes))
+        started = time.perf_counter()
+        counts = list(pool.map(hash_for, [policy] * processes, [seconds] * processes))
+        elapsed = time.perf_counter() - started
+    per_core = sum(counts) / elapsed / processes
+    return per_core, 1000 / per_core
+
+
+def policies(bcrypt_rounds: List[int], argon2_time_costs: List[int]) -> List[Tuple[str, HashingPolicy]]:
+    candidates = [("configured", hashing)]
+    candidates += [(f"bcrypt rounds={rounds}", HashingPolicy(["bcrypt"], bcrypt_rounds=rounds)) for rounds in bcrypt_rounds]
+    if argon2.has_backend():
+        candidates += [
+            (f"argon2 t={time_cost}", HashingPolicy(["argon2"], argon2_time_cost=time_cost))
+            for time_cost in argon2_time_costs
+        ]
+    else:
+        print("argon2-cffi is not installed; skipping argon2 policies")
+    return candidates
+
+
+def main(args):
+    print(f"Configured policy: {hashing.describe()}")
+    print(f"Processes: {args.processes}, {args.seconds:g}s per policy")
+    for label, policy in policies(args.bcrypt_rounds, args.argon2_time_costs):
+        per_core, ms_per_hash = measure(policy, args.processes, args.seconds)
+        print(f"{label:<22} {policy.describe():<48} {per_core:8.1f} hashes/s/core {ms_per_hash:8.1f} ms/hash")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure password hashing throughput per core for each policy.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Hashing processes, one per core")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Measurement time per policy")
+    parser.add_argument("--bcrypt-rounds", type=int, nargs="*", default=[10, 12])
+    parser.add_argument("--argon2-time-costs", type=int, nargs="*", default=[2, 3])
+    main(parser.parse_args())
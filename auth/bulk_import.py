@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from database import AsyncSessionLocal
+from crud import get_existing_emails, bulk_create_users
+from password import get_password_hash, validate_password
+from schemas import AuthUserCreate
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def iter_records(path: str, fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    Stream records from a CSV or NDJSON file.
+
+    Args:
+        path: Input file path
+        fmt: "csv" or "ndjson"
+
+    Yields:
+        Tuple of (1-based record number, record dict)
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(f), start=1):
+                yield number, row
+        else:
+            for number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield number, {"_error": f"Invalid JSON: {exc}"}
+                    continue
+                if isinstance(record, dict):
+                    yield number, record
+                else:
+                    yield number, {"_error": "Record is not a JSON object"}
+
+
+def load_checkpoint(path: str) -> Dict:
+    """Load the checkpoint written by a previous run, if any."""
+    if not os.path.exists(path):
+        return {"record": 0, "imported": 0, "rejected": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: Dict):
+    """Atomically replace the checkpoint file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def validate_record(record: Dict) -> Tuple[Optional[AuthUserCreate], Optional[str]]:
+    """
+    Validate one input record.
+
+    Emails are lowercased, so accounts that differ only in case are
+    deduplicated like MySQL's case-insensitive collation compares them.
+
+    Returns:
+        Tuple of (parsed user or None, error message or None)
+    """
+    if "_error" in record:
+        return None, record["_error"]
+    email = record.get("email")
+    try:
+        user = AuthUserCreate(
+            email=email.strip().lower() if isinstance(email, str) else email,
+            password=record.get("password") or "",
+            is_active=record.get("is_active", True) in (True, "true", "True", "1", 1),
+        )
+    except ValidationError as exc:
+        return None, "; ".join(err["msg"] for err in exc.errors())
+    if error_msg := validate_password(user.password):
+        return None, error_msg
+    return user, None
+
+
+class BulkImporter:
+    """
+    Import users from a file in batches.
+
+    Each batch is validated, deduplicated against itself and against existing
+    accounts, hashed across a process pool and inserted with one multi-row
+    INSERT. The checkpoint advances only after a batch commits, so a restarted
+    job resumes after the last committed record.
+    """
+
+    def __init__(self, pool: ProcessPoolExecutor, report, checkpoint_path: str, batch_size: int):
+        self.pool = pool
+        self.report = report
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.checkpoint = load_checkpoint(checkpoint_path)
+
+    def reject(self, number: int, email, error: str):
+        self.report.write(json.dumps({"record": number, "email": email, "error": error}) + "\n")
+        self.checkpoint["rejected"] += 1
+
+    async def hash_passwords(self, passwords: List[str]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(
+            loop.run_in_executor(self.pool, get_password_hash, password)
+            for password in passwords
+        ))
+
+    async def insert(self, db, rows: List[Tuple[int, Dict]]):
+        """Insert a batch, falling back to per-row inserts to isolate conflicts."""
+        try:
+            await bulk_create_users(db, [row for _, row in rows])
+            self.checkpoint["imported"] += len(rows)
+        except IntegrityError:
+            for number, row in rows:
+                try:
+                    await bulk_create_users(db, [row])
+                    self.checkpoint["imported"] += 1
+                except IntegrityError:
+                    self.reject(number, row["email"], "Email already registered")
+
+    async def process_batch(self, batch: List[Tuple[int, Dict]]):
+        users = {}
+        for number, record in batch:
+            user, error = validate_record(record)
+            if error:
+                self.reject(number, record.get("email"), error)
+            elif user.email in users:
+                self.reject(number, user.email, "Duplicate email in input")
+            else:
+                users[user.email] = (number, user)
+
+        async with AsyncSessionLocal() as db:
+            # Matches come back in their stored casing
+            existing = await get_existing_emails(db, list(users))
+            for email in {email.lower() for email in existing}:
+                number, _ = users.pop(email, (None, None))
+                if number is not None:
+                    self.reject(number, email, "Email already registered")
+
+            pending = list(users.values())
+            hashes = await self.hash_passwords([user.password for _, user in pending])
+            rows = [
+                (number, {
+                    "email": user.email,
+                    "hashed_password": hashed_password,
+                    "is_active": user.is_active,
+                })
+                for (number, user), hashed_password in zip(pending, hashes)
+            ]
+            await self.insert(db, rows)
+
+        self.report.flush()
+        self.checkpoint["record"] = batch[-1][0]
+        save_checkpoint(self.checkpoint_path, self.checkpoint)
+
+    async def run(self, records: Iterator[Tuple[int, Dict]]):
+        batch = []
+        for number, record in records:
+            if number <= self.checkpoint["record"]:
+                continue
+            batch.append((number, record))
+            if len(batch) >= self.batch_size:
+                await self.process_batch(batch)
+                batch = []
+                print(f"Processed through record {self.checkpoint['record']}: "
+                      f"{self.checkpoint['imported']} imported, {self.checkpoint['rejected']} rejected")
+        if batch:
+            await self.process_batch(batch)
+
+
+async def bulk_import(path: str, fmt: str, batch_size: int, workers: int, checkpoint_path: str, report_path: str):
+    """Import users from path, resuming from checkpoint_path if it exists."""
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(report_path, "a", encoding="utf-8") as report:
+        importer = BulkImporter(pool, report, checkpoint_path, batch_size)
+        if importer.checkpoint["record"]:
+            print(f"Resuming after record {importer.checkpoint['record']}")
+        await importer.run(iter_records(path, fmt))
+    checkpoint = importer.checkpoint
+    print(f"Import finished in {time.perf_counter() - started:.1f}s: "
+          f"{checkpoint['imported']} imported, {checkpoint['rejected']} rejected "
+          f"(see {report_path})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import users from a CSV or NDJSON file.")
+    parser.add_argument("path", help="CSV (email,password[,is_active]) or NDJSON file")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Input format (default: from extension)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Password hashing processes")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.checkpoint)")
+    parser.add_argument("--report", help="Per-row error report (default: <path>.errors.ndjson)")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    asyncio.run(bulk_import(
+        args.path,
+        fmt,
+        args.batch_size,
+        args.workers,
+        args.checkpoint or f"{args.path}.checkpoint",
+        args.report or f"{args.path}.errors.ndjson",
+    ))
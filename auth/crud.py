@@ -1,11 +1,13 @@
+from sqlalchemy import case, delete, insert, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
 
-from models import AuthUser, BlacklistedToken
+from models import AuthUser, BlacklistedToken, MailOutbox, PasswordResetToken, ProvisioningOutbox
 from schemas import AuthUserCreate, AuthUserUpdate
-from password import get_password_hash
+from password import get_password_hash_async
 
 # User Management
 async def get_user_by_email(db: AsyncSession, email: str):
@@ -24,7 +26,7 @@ async def get_user(db: AsyncSession, user_id: int):
 
 async def create_user(db: AsyncSession, user: AuthUserCreate):
     """Create a new user."""
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = AuthUser(
         email=user.email,
         hashed_password=hashed_password,
@@ -32,6 +34,13 @@ async def create_user(db: AsyncSession, user: AuthUserCreate):
     )
     db.add(db_user)
     try:
+        # Queue shard provisioning in the same transaction as the insert
+        await db.flush()
+        db.add(ProvisioningOutbox(
+            user_id=db_user.id,
+            email=db_user.email,
+            is_active=db_user.is_active
+        ))
         await db.commit()
         await db.refresh(db_user)
         return db_user
@@ -39,13 +48,73 @@ async def create_user(db: AsyncSession, user: AuthUserCreate):
         await db.rollback()
         raise
 
-# Authentication Management
-async def update_last_login(db: AsyncSession, user_id: int):
-    """Update user's last login timestamp."""
-    db_user = await get_user(db, user_id)
-    if db_user:
-        db_user.last_login = datetime.utcnow()
+async def get_existing_emails(db: AsyncSession, emails: List[str], chunk_size: int = 500) -> Set[str]:
+    """Return the subset of emails already registered, querying in chunked IN lookups."""
+    existing = set()
+    for start in range(0, len(emails), chunk_size):
+        result = await db.execute(
+            select(AuthUser.email).filter(AuthUser.email.in_(emails[start:start + chunk_size]))
+        )
+        existing.update(result.scalars().all())
+    return existing
+
+async def bulk_create_users(db: AsyncSession, users: List[dict]):
+    """Insert already-hashed users with a single multi-row INSERT and queue their provisioning."""
+    if not users:
+        return
+    try:
+        await db.execute(insert(AuthUser).values(users))
+        await db.execute(
+            insert(ProvisioningOutbox).from_select(
+                ["user_id", "email", "is_active"],
+                select(AuthUser.id, AuthUser.email, AuthUser.is_active)
+                .filter(AuthUser.email.in_([user["email"] for user in users]))
+            )
+        )
         await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+
+# Authentication Management
+async def update_last_logins(db: AsyncSession, last_logins: Dict[int, datetime]):
+    """Update many users' last login timestamps in one UPDATE ... CASE statement."""
+    if not last_logins:
+        return
+    await db.execute(
+        update(AuthUser)
+        .where(AuthUser.id.in_(list(last_logins)))
+        .values(last_login=case(last_logins, value=AuthUser.id))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+async def update_password_hashes(db: AsyncSession, rehashes: Dict[int, Tuple[str, str]]) -> int:
+    """
+    Replace outdated password hashes in one UPDATE ... CASE statement.
+    
+    Each row is only updated while it still holds the old hash, so a
+    password changed after the login that produced the new hash is kept.
+    
+    Args:
+        rehashes: Maps user ids to (old hash, new hash)
+        
+    Returns:
+        int: Number of users updated
+    """
+    if not rehashes:
+        return 0
+    old_hashes = {user_id: old for user_id, (old, _) in rehashes.items()}
+    new_hashes = {user_id: new for user_id, (_, new) in rehashes.items()}
+    result = await db.execute(
+        update(AuthUser)
+        .where(AuthUser.id.in_(list(rehashes)))
+        .where(AuthUser.hashed_password == case(old_hashes, value=AuthUser.id))
+        .values(hashed_password=case(new_hashes, value=AuthUser.id))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
 
 async def blacklist_token(db: AsyncSession, token: str, expires_at: datetime, user_id: int):
     """Add a token to the blacklist."""
@@ -64,8 +133,270 @@ async def is_token_blacklisted(db: AsyncSession, token: str) -> bool:
     )
     return result.scalar_one_or_none() is not None
 
+async def purge_expired_tokens(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Delete one batch of blacklisted tokens that have expired anyway."""
+    result = await db.execute(
+        select(BlacklistedToken.id)
+        .filter(BlacklistedToken.expires_at < datetime.utcnow())
+        .limit(batch_size)
+    )
+    token_ids = result.scalars().all()
+    if token_ids:
+        await db.execute(delete(BlacklistedToken).where(BlacklistedToken.id.in_(token_ids)))
+    await db.commit()
+    return len(token_ids)
+
 # Password Management
 async def update_password(db: AsyncSession, user: AuthUser, new_password: str):
     """Update user's password."""
-    user.hashed_password = get_password_hash(new_password)
-    await db.commit() 
\ No newline at end of file
+    user.hashed_password = await get_password_hash_async(new_password)
+    await db.commit()
+
+# Password Reset Tokens
+async def create_password_reset_token(db: AsyncSession, user_id: int, token_hash: str, expires_at: datetime):
+    """Store a reset token digest in the caller's transaction, revoking the user's earlier unused tokens."""
+    now = datetime.utcnow()
+    await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.user_id == user_id)
+        .where(PasswordResetToken.used_at.is_(None))
+        .values(used_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.add(PasswordResetToken(token_hash=token_hash, user_id=user_id, expires_at=expires_at))
+
+async def get_valid_reset_token(db: AsyncSession, token_hash: str):
+    """Get an unused, unexpired reset token by digest; a single unique index lookup."""
+    result = await db.execute(
+        select(PasswordResetToken)
+        .filter(PasswordResetToken.token_hash == token_hash)
+        .filter(PasswordResetToken.used_at.is_(None))
+        .filter(PasswordResetToken.expires_at > datetime.utcnow())
+    )
+    return result.scalar_one_or_none()
+
+async def consume_reset_token(db: AsyncSession, token: PasswordResetToken, hashed_password: str) -> bool:
+    """
+    Mark a reset token used and set the user's new password hash in one transaction.
+    
+    The token is claimed with a conditional update, so when the same token is
+    submitted twice concurrently only one request changes the password.
+    
+    Returns:
+        bool: False if the token was used in the meantime
+    """
+    result = await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.id == token.id)
+        .where(PasswordResetToken.used_at.is_(None))
+        .values(used_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+    await db.execute(
+        update(AuthUser)
+        .where(AuthUser.id == token.user_id)
+        .values(hashed_password=hashed_password)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return True
+
+async def purge_expired_reset_tokens(db: AsyncSession, batch_size: int = 1000) -> int:
+    """Delete one batch of reset tokens past their expiry, used or not."""
+    result = await db.execute(
+        select(PasswordResetToken.id)
+        .filter(PasswordResetToken.expires_at < datetime.utcnow())
+        .limit(batch_size)
+    )
+    token_ids = result.scalars().all()
+    if token_ids:
+        await db.execute(delete(PasswordResetToken).where(PasswordResetToken.id.in_(token_ids)))
+    await db.commit()
+    return len(token_ids)
+
+# Shard Provisioning Outbox
+async def claim_pending_provisioning(
+    db: AsyncSession, limit: int = 500, max_attempts: int = 10, lease: timedelta = timedelta(minutes=5)
+) -> List[ProvisioningOutbox]:
+    """
+    Claim the oldest undelivered outbox rows that are due and commit.
+
+    Rows are locked with SKIP LOCKED only while they are claimed, not while
+    they are delivered. A claim pushes next_attempt_at out by lease, so rows
+    left by a worker that died become due again once it runs out. Rows that
+    failed max_attempts times are left for an operator.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(ProvisioningOutbox)
+        .filter(ProvisioningOutbox.delivered_at.is_(None))
+        .filter(ProvisioningOutbox.attempts < max_attempts)
+        .filter(or_(
+            ProvisioningOutbox.next_attempt_at.is_(None),
+            ProvisioningOutbox.next_attempt_at <= now
+        ))
+        .order_by(ProvisioningOutbox.attempts, ProvisioningOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    entries = result.scalars().all()
+    if entries:
+        await db.execute(
+            update(ProvisioningOutbox)
+            .where(ProvisioningOutbox.id.in_([entry.id for entry in entries]))
+            .values(next_attempt_at=now + lease)
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return entries
+
+async def mark_provisioning_delivered(db: AsyncSession, outbox_ids: List[int]):
+    """Mark outbox rows as delivered."""
+    await db.execute(
+        update(ProvisioningOutbox)
+        .where(ProvisioningOutbox.id.in_(outbox_ids))
+        .values(delivered_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+async def mark_provisioning_failed(
+    db: AsyncSession,
+    outbox_ids: List[int],
+    error: str,
+    next_attempt_at: Optional[datetime] = None,
+    attempts: Optional[int] = None
+):
+    """
+    Record a failed delivery attempt for outbox rows.
+
+    Args:
+        next_attempt_at: When the rows become due again
+        attempts: Attempt count to set instead of incrementing it, e.g. the
+            maximum for rows that retrying cannot fix
+    """
+    await db.execute(
+        update(ProvisioningOutbox)
+        .where(ProvisioningOutbox.id.in_(outbox_ids))
+        .values(
+            attempts=ProvisioningOutbox.attempts + 1 if attempts is None else attempts,
+            last_error=error[:500],
+            next_attempt_at=next_attempt_at
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+async def queue_provisioning(db: AsyncSession, user_ids: List[int]) -> int:
+    """Queue outbox rows for users that have no undelivered row yet."""
+    pending = await db.execute(
+        select(ProvisioningOutbox.user_id)
+        .filter(ProvisioningOutbox.user_id.in_(user_ids))
+        .filter(ProvisioningOutbox.delivered_at.is_(None))
+    )
+    missing = set(user_ids) - set(pending.scalars().all())
+    if missing:
+        await db.execute(
+            insert(ProvisioningOutbox).from_select(
+                ["user_id", "email", "is_active"],
+                select(AuthUser.id, AuthUser.email, AuthUser.is_active)
+                .filter(AuthUser.id.in_(missing))
+            )
+        )
+    await db.commit()
+    return len(missing)
+
+async def purge_delivered_provisioning(db: AsyncSession, older_than: timedelta, batch_size: int = 1000) -> int:
+    """Delete one batch of outbox rows delivered more than older_than ago."""
+    result = await db.execute(
+        select(ProvisioningOutbox.id)
+        .filter(ProvisioningOutbox.delivered_at < datetime.utcnow() - older_than)
+        .limit(batch_size)
+    )
+    outbox_ids = result.scalars().all()
+    if outbox_ids:
+        await db.execute(delete(ProvisioningOutbox).where(ProvisioningOutbox.id.in_(outbox_ids)))
+    await db.commit()
+    return len(outbox_ids)
+
+# Mail Outbox
+def queue_mail(db: AsyncSession, to_address: str, subject: str, body: str):
+    """Queue an email in the caller's transaction; the mail delivery job sends it."""
+    db.add(MailOutbox(to_address=to_address, subject=subject, body=body))
+
+async def claim_pending_mail(
+    db: AsyncSession, limit: int = 100, max_attempts: int = 5, claim_timeout: timedelta = timedelta(minutes=10)
+) -> List[MailOutbox]:
+    """
+    Claim the oldest unsent mail for one delivery run and commit.
+
+    Rows are locked with SKIP LOCKED only while they are claimed, not while
+    they are sent. Claims older than claim_timeout were left by a run that
+    died and are taken over.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(MailOutbox)
+        .filter(MailOutbox.sent_at.is_(None))
+        .filter(MailOutbox.attempts < max_attempts)
+        .filter(or_(MailOutbox.claimed_at.is_(None), MailOutbox.claimed_at < now - claim_timeout))
+        .order_by(MailOutbox.attempts, MailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    mail = result.scalars().all()
+    if mail:
+        await db.execute(
+            update(MailOutbox)
+            .where(MailOutbox.id.in_([item.id for item in mail]))
+            .values(claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return mail
+
+async def release_mail(db: AsyncSession, mail_ids: List[int]):
+    """Give up claims on mail that was not sent."""
+    await db.execute(
+        update(MailOutbox)
+        .where(MailOutbox.id.in_(mail_ids))
+        .values(claimed_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+async def mark_mail_sent(db: AsyncSession, mail_ids: List[int]):
+    """Mark mail as sent and drop its body, which may carry a reset link."""
+    await db.execute(
+        update(MailOutbox)
+        .where(MailOutbox.id.in_(mail_ids))
+        .values(sent_at=datetime.utcnow(), body="")
+        .execution_options(synchronize_session=False)
+    )
+
+async def mark_mail_failed(db: AsyncSession, mail_id: int, error: str, max_attempts: int = 5):
+    """Record a failed send attempt; the body is dropped once no attempts are left."""
+    await db.execute(
+        update(MailOutbox)
+        .where(MailOutbox.id == mail_id)
+        .values(
+            attempts=MailOutbox.attempts + 1,
+            last_error=error[:500],
+            claimed_at=None,
+            body=case((MailOutbox.attempts + 1 >= max_attempts, ""), else_=MailOutbox.body)
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+async def purge_sent_mail(db: AsyncSession, older_than: timedelta, batch_size: int = 1000) -> int:
+    """Delete one batch of mail sent more than older_than ago."""
+    result = await db.execute(
+        select(MailOutbox.id)
+        .filter(MailOutbox.sent_at < datetime.utcnow() - older_than)
+        .limit(batch_size)
+    )
+    mail_ids = result.scalars().all()
+    if mail_ids:
+        await db.execute(delete(MailOutbox).where(MailOutbox.id.in_(mail_ids)))
+    await db.commit()
+    return len(mail_ids)
@@ -0,0 +1,51 @@
+import gc
+import multiprocessing
+import os
+
+# Production server configuration: gunicorn manages uvicorn worker processes.
+# Used by scripts/entrypoint.sh when SERVER_MODE=production.
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# UvicornWorker picks uvloop and httptools automatically when they are installed
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master so workers share its pages copy-on-write
+preload_app = True
+
+# On SIGTERM, stop accepting connections and give in-flight requests and the
+# lifespan shutdown (buffer flushes, outbox drain) this long to finish
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+# Split the MySQL connection budget between workers. Each worker has its own
+# pool, so pool_size + max_overflow per worker must fit in
+# (max_connections - reserved) / workers. Explicit DB_POOL_SIZE and
+# DB_MAX_OVERFLOW settings are capped to that share. Runs before the app is
+# imported, so database.py picks the values up from the environment.
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "151"))  # MySQL default
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+
+per_worker = max(1, (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // workers)
+pool_size = min(int(os.getenv("DB_POOL_SIZE", "5")), per_worker)
+max_overflow = min(int(os.getenv("DB_MAX_OVERFLOW", "10")), per_worker - pool_size)
+os.environ["DB_POOL_SIZE"] = str(pool_size)
+os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+os.environ["DB_POOL_MIN"] = str(min(int(os.getenv("DB_POOL_MIN", "2")), pool_size))
+
+# The in-memory rate limiter keeps separate buckets in every worker; tell it
+# how many there are so it can split the login and reset budgets between them
+os.environ["RATE_LIMIT_WORKERS"] = str(workers)
+
+
+def when_ready(server):
+    server.log.info(
+        "Serving with %d workers, DB pool %d + %d overflow per worker",
+        workers, pool_size, max_overflow
+    )
+    # Move preloaded objects out of the collector's generations so garbage
+    # collection in the workers does not dirty the shared pages
+    gc.freeze()
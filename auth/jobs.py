@@ -0,0 +1,245 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database import AsyncSessionLocal, engine
+from crud import purge_delivered_provisioning, purge_expired_reset_tokens, purge_expired_tokens, purge_sent_mail
+from mailer import deliver_mail, MAIL_BATCH_SIZE
+from metrics import Counter, Gauge, Summary
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() == "true"
+JOBS_LOCK_NAME = os.getenv("JOBS_LOCK_NAME", "auth_jobs_leader")
+BLACKLIST_PURGE_SECONDS = float(os.getenv("BLACKLIST_PURGE_SECONDS", "3600"))
+STALE_CLEANUP_SECONDS = float(os.getenv("STALE_CLEANUP_SECONDS", "3600"))
+MAIL_POLL_SECONDS = float(os.getenv("MAIL_POLL_SECONDS", "5"))
+PROVISIONING_RETENTION_DAYS = float(os.getenv("PROVISIONING_RETENTION_DAYS", "7"))
+MAIL_RETENTION_DAYS = float(os.getenv("MAIL_RETENTION_DAYS", "7"))
+PURGE_BATCH_SIZE = 1000
+
+job_duration = Summary("auth_job_duration_seconds", "Background job run time by job")
+job_runs = Counter("auth_job_runs_total", "Background job runs by job and outcome")
+job_leader = Gauge("auth_job_leader", "1 if this worker holds the job leader lock")
+
+
+class LeaderLock:
+    """
+    Leadership among workers through a MySQL named lock (GET_LOCK).
+
+    The worker that gets the lock keeps it on a dedicated connection until
+    it stops or the connection drops; MySQL releases the lock when the
+    session ends, so a crashed leader is replaced on the next attempt.
+    """
+
+    def __init__(self, name: str = JOBS_LOCK_NAME):
+        self.name = name
+        self._conn: Optional[AsyncConnection] = None
+        self._mutex = asyncio.Lock()
+
+    async def _scalar(self, conn: AsyncConnection, sql: str):
+        value = (await conn.execute(text(sql), {"name": self.name})).scalar()
+        # Named locks belong to the session, so no transaction is kept open
+        await conn.commit()
+        return value
+
+    async def acquire(self) -> bool:
+        """Whether this worker is the leader, trying to become it if nobody is."""
+        async with self._mutex:
+            if self._conn is not None:
+                try:
+                    if await self._scalar(self._conn, "SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"):
+                        return True
+                except Exception as exc:
+                    logger.warning("Lost the job leader connection: %s", exc)
+                await self._close()
+
+            conn = await engine.connect()
+            try:
+                acquired = await self._scalar(conn, "SELECT GET_LOCK(:name, 0)") == 1
+            except BaseException:
+                await conn.close()
+                raise
+            if acquired:
+                self._conn = conn
+                logger.info("This worker is now the job leader")
+            else:
+                await conn.close()
+            job_leader.set(1 if acquired else 0)
+            return acquired
+
+    async def _close(self):
+        conn, self._conn = self._conn, None
+        job_leader.set(0)
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    async def release(self):
+        async with self._mutex:
+            if self._conn is None:
+                return
+            try:
+                await self._scalar(self._conn, "SELECT RELEASE_LOCK(:name)")
+            except Exception:
+                pass
+            await self._close()
+
+
+@dataclass
+class Job:
+    """A coroutine function run by the scheduler."""
+    name: str
+    func: Callable[[], Awaitable[Any]]
+    interval: Optional[float] = None  # None runs the job once
+    jitter: float = 0.1  # fraction of the interval
+    delay: float = 0.0
+    leader_only: bool = True
+
+
+class JobScheduler:
+    """
+    In-process asyncio scheduler for periodic and one-shot jobs.
+
+    Every worker runs the scheduler; jobs marked leader_only run only on the
+    worker holding the leader lock. Intervals are jittered so workers and
+    jobs do not wake in lockstep.
+    """
+
+    def __init__(self, leader: LeaderLock):
+        self.leader = leader
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._started = False
+
+    def every(self, interval: float, name: Optional[str] = None, jitter: float = 0.1, leader_only: bool = True):
+        """Register a periodic job; usable as a decorator."""
+        def register(func):
+            job = Job(name or func.__name__, func, interval=interval, jitter=jitter, leader_only=leader_only)
+            self.jobs[job.name] = job
+            return func
+        return register
+
+    def once(self, func: Callable[[], Awaitable[Any]], delay: float = 0.0, name: Optional[str] = None, leader_only: bool = False):
+        """Run a job once after delay seconds; starts right away if the scheduler is running."""
+        job = Job(name or func.__name__, func, delay=delay, leader_only=leader_only)
+        if self._started:
+            self._spawn(job)
+        else:
+            self.jobs[job.name] = job
+
+    async def run_job(self, job: Job) -> bool:
+        """
+        Run a job now.
+
+        Returns:
+            False if the job was skipped because this worker is not the leader
+        """
+        if job.leader_only and not await self.leader.acquire():
+            job_runs.inc(job=job.name, outcome="skipped")
+            return False
+        started = time.perf_counter()
+        try:
+            await job.func()
+            job_runs.inc(job=job.name, outcome="success")
+        except Exception:
+            logger.exception("Job %s failed", job.name)
+            job_runs.inc(job=job.name, outcome="failure")
+        finally:
+            job_duration.observe(time.perf_counter() - started, job=job.name)
+        return True
+
+    async def _loop(self, job: Job):
+        delay = job.delay
+        if job.interval is not None:
+            # Spread first runs so workers started together do not all wake at once
+            delay += random.uniform(0, job.interval * job.jitter)
+        await asyncio.sleep(delay)
+        while True:
+            try:
+                await self.run_job(job)
+            except Exception:
+                logger.exception("Could not run job %s", job.name)
+            if job.interval is None:
+                return
+            await asyncio.sleep(job.interval * random.uniform(1 - job.jitter, 1 + job.jitter))
+
+    def _spawn(self, job: Job):
+        # In a fresh context: a job scheduled by a request must not inherit
+        # its context variables, such as the request's query profile
+        task = contextvars.Context().run(asyncio.create_task, self._loop(job))
+        self._tasks.append(task)
+        task.add_done_callback(self._discard)
+
+    def _discard(self, task: asyncio.Task):
+        if task in self._tasks:
+            self._tasks.remove(task)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for name, job in list(self.jobs.items()):
+            if job.interval is None:
+                del self.jobs[name]
+            self._spawn(job)
+
+    async def stop(self):
+        """Cancel all jobs and give up leadership so another worker takes over at once."""
+        self._started = False
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.leader.release()
+
+
+job_scheduler = JobScheduler(LeaderLock())
+
+
+async def _purge_batches(purge) -> int:
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            purged = await purge(db)
+        total += purged
+        if purged < PURGE_BATCH_SIZE:
+            return total
+        # Let other queries in between batches
+        await asyncio.sleep(0)
+
+
+@job_scheduler.every(BLACKLIST_PURGE_SECONDS)
+async def purge_blacklisted_tokens():
+    """Delete blacklisted tokens past their expiry; an expired token is rejected anyway."""
+    purged = await _purge_batches(lambda db: purge_expired_tokens(db, PURGE_BATCH_SIZE))
+    if purged:
+        logger.info("Purged %d expired blacklisted tokens", purged)
+
+
+@job_scheduler.every(STALE_CLEANUP_SECONDS)
+async def cleanup_stale_rows():
+    """Delete expired reset tokens, and delivered provisioning outbox rows and sent mail past their retention."""
+    await _purge_batches(lambda db: purge_expired_reset_tokens(db, PURGE_BATCH_SIZE))
+    await _purge_batches(lambda db: purge_delivered_provisioning(
+        db, timedelta(days=PROVISIONING_RETENTION_DAYS), PURGE_BATCH_SIZE
+    ))
+    await _purge_batches(lambda db: purge_sent_mail(db, timedelta(days=MAIL_RETENTION_DAYS), PURGE_BATCH_SIZE))
+
+
+@job_scheduler.every(MAIL_POLL_SECONDS)
+async def deliver_queued_mail():
+    """Send queued mail until the outbox is drained."""
+    while await deliver_mail() >= MAIL_BATCH_SIZE:
+        pass
@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -13,8 +13,48 @@ SECRET_KEY = "your-secret-key-here"  # In production, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Scopes granted by each role. Roles and scopes are written into tokens at
+# issue time, so the router and the backend authorize requests from the
+# token alone; a role change takes effect on the user's next login.
+ROLE_SCOPES = {
+    "user": ["catalog:read", "orders:read", "orders:write"],
+    "admin": ["catalog:write", "orders:read:all", "users:read", "users:write"],
+}
+# Roles assumed for tokens issued before role claims existed
+DEFAULT_ROLES = ["user"]
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+def user_roles(user: AuthUser) -> List[str]:
+    """Roles of a user; every user has "user", admins also "admin"."""
+    roles = ["user"]
+    if user.is_admin:
+        roles.append("admin")
+    return roles
+
+def role_claims(roles: List[str]) -> dict:
+    """
+    Build the roles and scope claims for a token.
+    
+    Args:
+        roles: Roles of the user
+        
+    Returns:
+        Claims with the roles as a list and the scopes as a space-separated string
+    """
+    scopes = sorted({scope for role in roles for scope in ROLE_SCOPES.get(role, [])})
+    return {"roles": roles, "scope": " ".join(scopes)}
+
+def token_roles(payload: dict) -> List[str]:
+    """Roles claimed by a decoded token."""
+    return payload.get("roles") or DEFAULT_ROLES
+
+def token_scopes(payload: dict) -> List[str]:
+    """Scopes claimed by a decoded token."""
+    if "scope" in payload:
+        return payload["scope"].split()
+    return role_claims(token_roles(payload))["scope"].split()
+
 def create_access_token(data: dict, user_id: int, expires_delta: Optional[timedelta] = None) -> str:
     """
     Create a JWT access token.
@@ -44,41 +84,56 @@ def create_access_token(data: dict, user_id: int, expires_delta: Optional[timede
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_token_payload(token: str = Depends(oauth2_scheme)) -> dict:
+    """
+    Validate and decode the JWT token of the request.
+    
+    Args:
+        token: JWT token from request
+        
+    Returns:
+        Decoded token claims
+        
+    Raises:
+        HTTPException: If token is invalid
+    """
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception()
+
 async def get_current_user(
-    token: str = Depends(oauth2_scheme),
+    payload: dict = Depends(get_token_payload),
     db: AsyncSession = Depends(get_db_session)
 ) -> AuthUser:
     """
-    Validate and decode JWT token to get current user.
+    Get the user a validated JWT token was issued to.
     
     Args:
-        token: JWT token from request
+        payload: Decoded token claims
         
     Returns:
-        Decoded token data
+        User the token was issued to
         
     Raises:
         HTTPException: If token is invalid
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+    email: str = payload.get("sub")
+    if email is None:
+        raise credentials_exception()
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
+    user = await get_user_by_email(db, email)
+    if user is None:
+        raise credentials_exception()
         
-        user = await get_user_by_email(db, email)
-        if user is None:
-            raise credentials_exception
-            
-        return user
-    except JWTError:
-        raise credentials_exception
+    return user
 
 async def get_current_active_user(
     current_user: AuthUser = Depends(get_current_user)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from database import AsyncSessionLocal
+from crud import update_last_logins, update_password_hashes
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv("LAST_LOGIN_FLUSH_SECONDS", "5"))
+
+
+class LastLoginBuffer:
+    """
+    Write-behind buffer for last_login timestamps.
+
+    Logins record a timestamp in memory and return immediately. A background
+    task flushes everything recorded since the previous flush as a single
+    batched UPDATE, and a final flush runs on shutdown. Repeated logins by the
+    same user between flushes collapse into one row update.
+    """
+
+    description = "last_login timestamps"
+
+    def __init__(self, session_factory=AsyncSessionLocal, interval: float = LAST_LOGIN_FLUSH_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._pending: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: int, when: Optional[datetime] = None):
+        """Record a login for user_id without touching the database."""
+        self._pending[user_id] = when or datetime.utcnow()
+
+    async def write(self, db, batch: Dict):
+        await update_last_logins(db, batch)
+
+    async def flush(self) -> int:
+        """
+        Write everything pending.
+
+        Returns:
+            Number of users updated
+        """
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        try:
+            async with self.session_factory() as db:
+                await self.write(db, batch)
+        except BaseException:
+            # Put the batch back, keeping anything newer recorded meanwhile
+            for user_id, value in batch.items():
+                self._pending.setdefault(user_id, value)
+            raise
+        return len(batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush %s", self.description)
+
+    def start(self):
+        """Start the periodic flush task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic flush task and flush what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+class PasswordRehashBuffer(LastLoginBuffer):
+    """
+    Write-behind buffer for password hashes upgraded on login.
+
+    A login whose hash no longer matches the hashing policy records the new
+    hash here instead of writing it before responding; flushes store the
+    batch with one compare-and-set UPDATE.
+    """
+
+    description = "rehashed passwords"
+
+    def record(self, user_id: int, old_hash: str, new_hash: str):
+        """Record a new hash for user_id, replacing old_hash, without touching the database."""
+        self._pending[user_id] = (old_hash, new_hash)
+
+    async def write(self, db, batch: Dict[int, Tuple[str, str]]):
+        await update_password_hashes(db, batch)
+
+
+last_login_buffer = LastLoginBuffer()
+password_rehash_buffer = PasswordRehashBuffer()
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+import os
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from database import AsyncSessionLocal
+from crud import claim_pending_mail, mark_mail_failed, mark_mail_sent, release_mail
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MAIL_BACKEND = os.getenv("MAIL_BACKEND", "file")  # "file", "smtp" or "log"
+MAIL_FILE_PATH = os.getenv("MAIL_FILE_PATH", "data/outbox.ndjson")
+MAIL_FROM = os.getenv("MAIL_FROM", "no-reply@example.com")
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "100"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+# Claimed mail not sent within this long is taken over by another run
+MAIL_CLAIM_TIMEOUT_SECONDS = float(os.getenv("MAIL_CLAIM_TIMEOUT_SECONDS", "600"))
+
+mail_deliveries = Counter("auth_mail_deliveries_total", "Outbound emails by outcome")
+
+
+class FileMailSender:
+    """
+    Appends each email as a JSON line to a file; for development and tests.
+
+    Bodies are written as sent, reset links included, so the file is created
+    readable by its owner only.
+    """
+
+    def __init__(self, path: str = MAIL_FILE_PATH):
+        self.path = path
+
+    def send(self, to_address: str, subject: str, body: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "a") as f:
+            f.write(json.dumps({
+                "from": MAIL_FROM,
+                "to": to_address,
+                "subject": subject,
+                "body": body,
+                "sent_at": datetime.utcnow().isoformat()
+            }) + "\n")
+
+
+class LogMailSender:
+    """Logs the recipient and subject only."""
+
+    def send(self, to_address: str, subject: str, body: str):
+        logger.info("Mail to %s: %s", to_address, subject)
+
+
+class SMTPMailSender:
+    """Sends through an SMTP relay."""
+
+    def send(self, to_address: str, subject: str, body: str):
+        message = EmailMessage()
+        message["From"] = MAIL_FROM
+        message["To"] = to_address
+        message["Subject"] = subject
+        message.set_content(body)
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+            if SMTP_STARTTLS:
+                smtp.starttls()
+            if SMTP_USER:
+                smtp.login(SMTP_USER, SMTP_PASSWORD)
+            smtp.send_message(message)
+
+
+MAIL_SENDERS = {
+    "file": FileMailSender,
+    "log": LogMailSender,
+    "smtp": SMTPMailSender,
+}
+
+
+def create_mail_sender(backend: str = MAIL_BACKEND):
+    """Create the sender selected by MAIL_BACKEND."""
+    return MAIL_SENDERS[backend]()
+
+
+mail_sender = create_mail_sender()
+
+
+async def deliver_mail(limit: int = MAIL_BATCH_SIZE) -> int:
+    """
+    Send one batch of queued mail.
+
+    The batch is claimed in a short transaction, so concurrent deliveries
+    never send the same email and no row lock is held while mail is sent.
+    Each email is marked sent or failed in its own transaction as soon as
+    its send returns. Senders are blocking and run on a thread. A failed
+    email is retried on later runs up to MAIL_MAX_ATTEMPTS. Mail still
+    unsent halfway through MAIL_CLAIM_TIMEOUT_SECONDS is handed back before
+    another run could take its claim over.
+
+    Returns:
+        Number of emails sent
+    """
+    claim_timeout = timedelta(seconds=MAIL_CLAIM_TIMEOUT_SECONDS)
+    deadline = time.monotonic() + MAIL_CLAIM_TIMEOUT_SECONDS / 2
+    sent = 0
+    async with AsyncSessionLocal() as db:
+        claimed = await claim_pending_mail(db, limit, MAIL_MAX_ATTEMPTS, claim_timeout)
+        for position, mail in enumerate(claimed):
+            if time.monotonic() > deadline:
+                await release_mail(db, [unsent.id for unsent in claimed[position:]])
+                await db.commit()
+                break
+            try:
+                await asyncio.to_thread(mail_sender.send, mail.to_address, mail.subject, mail.body)
+            except Exception as exc:
+                logger.warning("Sending mail %s failed: %s", mail.id, exc)
+                await mark_mail_failed(db, mail.id, str(exc), MAIL_MAX_ATTEMPTS)
+                await db.commit()
+                mail_deliveries.inc(outcome="failed")
+                continue
+            await mark_mail_sent(db, [mail.id])
+            await db.commit()
+            sent += 1
+            mail_deliveries.inc(outcome="sent")
+    return sent
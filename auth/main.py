@@ -1,5 +1,12 @@
+import os
 from api import app
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # Auto-reload is for local development only; production runs gunicorn
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=os.getenv("SERVER_MODE") == "development"
+    )
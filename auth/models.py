@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -30,4 +30,45 @@ class BlacklistedToken(Base):
     blacklisted_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Define relationship to AuthUser
-    user = relationship("AuthUser", back_populates="tokens") 
\ No newline at end of file
+    user = relationship("AuthUser", back_populates="tokens") 
+
+class ProvisioningOutbox(Base):
+    """Model for user changes waiting to be delivered to the backend shards."""
+    __tablename__ = "provisioning_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("auth_users.id"), index=True)
+    email = Column(String(255))
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    delivered_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String(500), nullable=True)
+    # Failed rows are retried with exponential backoff
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+
+class MailOutbox(Base):
+    """Model for outbound email waiting to be sent by the mail delivery job."""
+    __tablename__ = "mail_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_address = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    # Set while a delivery run is sending the mail
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String(500), nullable=True)
+
+class PasswordResetToken(Base):
+    """Model for single-use password reset tokens; only the SHA-256 digest of a token is stored."""
+    __tablename__ = "password_reset_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("auth_users.id"), index=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    used_at = Column(DateTime(timezone=True), nullable=True)
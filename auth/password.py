@@ -1,8 +1,164 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
 from passlib.context import CryptContext
-from typing import Optional
 
-# Password hashing configuration
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Schemes in order of preference: new hashes use the first one, and hashes in
+# the others are replaced on the user's next successful login. "argon2"
+# requires the argon2-cffi package.
+PASSWORD_SCHEMES = [scheme.strip() for scheme in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if scheme.strip()]
+# Time one hash or verify should take on this machine; the cost of each
+# scheme is calibrated to it at startup unless pinned below. 0 disables calibration.
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")  # pins the bcrypt cost
+# Floor for the calibrated bcrypt cost: a slow machine gets slower hashes, not weaker ones
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "12"))
+ARGON2_TIME_COST = os.getenv("ARGON2_TIME_COST")  # pins the argon2 cost
+ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+BCRYPT_DEFAULT_ROUNDS = 12
+BCRYPT_MAX_ROUNDS = 16
+BCRYPT_CALIBRATION_ROUNDS = 8
+ARGON2_DEFAULT_TIME_COST = 3
+ARGON2_MIN_TIME_COST = 2
+ARGON2_MAX_TIME_COST = 20
+CALIBRATION_PASSWORD = "Calibration-password-1"
+
+
+def _best_time(context: CryptContext, samples: int = 3) -> float:
+    """Fastest of a few hashes in seconds; the minimum filters out scheduling noise."""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash(CALIBRATION_PASSWORD)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def calibrate_bcrypt_rounds(target_ms: float) -> int:
+    """
+    Find the highest bcrypt cost whose hash time stays within target_ms.
+    
+    Each extra round doubles the work, so one timing at a cheap cost is
+    scaled by powers of two instead of timing expensive hashes.
+    
+    Args:
+        target_ms (float): Time budget for one hash in milliseconds
+        
+    Returns:
+        int: bcrypt rounds, at least BCRYPT_MIN_ROUNDS
+    """
+    seconds = _best_time(CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_CALIBRATION_ROUNDS))
+    rounds = BCRYPT_CALIBRATION_ROUNDS + math.floor(math.log2(target_ms / 1000 / seconds))
+    return min(max(rounds, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+
+def calibrate_argon2_time_cost(target_ms: float, memory_kib: int = ARGON2_MEMORY_KIB, parallelism: int = ARGON2_PARALLELISM) -> int:
+    """
+    Find the highest argon2 time cost whose hash time stays within target_ms.
+    
+    Memory cost is fixed by configuration; hash time grows linearly with
+    the number of passes over that memory.
+    
+    Args:
+        target_ms (float): Time budget for one hash in milliseconds
+        memory_kib (int): Memory cost in KiB
+        parallelism (int): Lanes per hash
+        
+    Returns:
+        int: argon2 time cost, at least ARGON2_MIN_TIME_COST
+    """
+    seconds = _best_time(CryptContext(
+        schemes=["argon2"], argon2__time_cost=1, argon2__memory_cost=memory_kib, argon2__parallelism=parallelism
+    ))
+    time_cost = math.floor(target_ms / 1000 / seconds)
+    return min(max(time_cost, ARGON2_MIN_TIME_COST), ARGON2_MAX_TIME_COST)
+
+@dataclass
+class HashingPolicy:
+    """Password schemes and their cost parameters."""
+    schemes: List[str]
+    bcrypt_rounds: int = BCRYPT_DEFAULT_ROUNDS
+    argon2_time_cost: int = ARGON2_DEFAULT_TIME_COST
+    argon2_memory_kib: int = ARGON2_MEMORY_KIB
+    argon2_parallelism: int = ARGON2_PARALLELISM
+
+    def context(self) -> CryptContext:
+        """
+        Build the passlib context for this policy.
+        
+        Hashes in any scheme but the first, or made with a lower bcrypt cost
+        or other argon2 parameters, report needs_update. bcrypt hashes above
+        the policy are kept: they are no weaker, and workers calibrating a
+        step apart then converge on the higher cost instead of rehashing
+        each other's hashes back and forth.
+        """
+        settings = {}
+        if "bcrypt" in self.schemes:
+            settings.update(
+                bcrypt__default_rounds=self.bcrypt_rounds,
+                bcrypt__min_rounds=self.bcrypt_rounds
+            )
+        if "argon2" in self.schemes:
+            settings.update(
+                argon2__time_cost=self.argon2_time_cost,
+                argon2__memory_cost=self.argon2_memory_kib,
+                argon2__parallelism=self.argon2_parallelism
+            )
+        return CryptContext(schemes=self.schemes, deprecated="auto", **settings)
+
+    def describe(self) -> str:
+        parts = []
+        for scheme in self.schemes:
+            if scheme == "bcrypt":
+                parts.append(f"bcrypt(rounds={self.bcrypt_rounds})")
+            elif scheme == "argon2":
+                parts.append(
+                    f"argon2(t={self.argon2_time_cost}, m={self.argon2_memory_kib}KiB, p={self.argon2_parallelism})"
+                )
+            else:
+                parts.append(scheme)
+        return ", ".join(parts)
+
+def hashing_policy(schemes: List[str] = PASSWORD_SCHEMES, target_ms: float = PASSWORD_HASH_TARGET_MS) -> HashingPolicy:
+    """
+    Resolve the hashing policy from configuration, calibrating costs that are not pinned.
+    
+    Args:
+        schemes (List[str]): Schemes in order of preference
+        target_ms (float): Time budget for one hash in milliseconds; 0 keeps default costs
+        
+    Returns:
+        HashingPolicy: The policy
+    """
+    policy = HashingPolicy(schemes=list(schemes))
+    if "bcrypt" in schemes:
+        if BCRYPT_ROUNDS:
+            policy.bcrypt_rounds = int(BCRYPT_ROUNDS)
+        elif target_ms > 0:
+            policy.bcrypt_rounds = calibrate_bcrypt_rounds(target_ms)
+    if "argon2" in schemes:
+        from passlib.hash import argon2
+        if not argon2.has_backend():
+            raise RuntimeError("PASSWORD_SCHEMES includes argon2, which requires the 'argon2-cffi' package")
+        if ARGON2_TIME_COST:
+            policy.argon2_time_cost = int(ARGON2_TIME_COST)
+        elif target_ms > 0:
+            policy.argon2_time_cost = calibrate_argon2_time_cost(target_ms)
+    return policy
+
+# Password hashing configuration, calibrated once per process; under
+# gunicorn's preload_app that is once in the master, before workers fork
+hashing = hashing_policy()
+pwd_context = hashing.context()
+logger.info("Password hashing policy: %s", hashing.describe())
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -29,6 +185,48 @@ def get_password_hash(password: str) -> str:
     """
     return pwd_context.hash(password)
 
+async def get_password_hash_async(password: str) -> str:
+    """
+    Hash a password on a worker thread so bcrypt does not block the event loop.
+    
+    Args:
+        password (str): The plain text password to hash
+        
+    Returns:
+        str: The hashed password
+    """
+    return await asyncio.to_thread(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a password on a worker thread so the hash does not block the event loop.
+    
+    Args:
+        plain_password (str): The plain text password to verify
+        hashed_password (str): The hashed password to check against
+        
+    Returns:
+        bool: True if password matches, False otherwise
+    """
+    return await asyncio.to_thread(pwd_context.verify, plain_password, hashed_password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password on a worker thread and rehash it if its hash is outdated.
+    
+    A hash is outdated when it uses a scheme other than the preferred one or
+    cost parameters other than the current policy's.
+    
+    Args:
+        plain_password (str): The plain text password to verify
+        hashed_password (str): The hashed password to check against
+        
+    Returns:
+        Tuple[bool, Optional[str]]: Whether the password matches, and a new
+            hash to store when it matches and the old hash is outdated
+    """
+    return await asyncio.to_thread(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def validate_password(password: str) -> Optional[str]:
     """
     Validate password strength.
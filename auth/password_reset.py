@@ -0,0 +1,56 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud import create_password_reset_token, queue_mail
+from models import AuthUser
+
+# Configuration
+PASSWORD_RESET_TOKEN_TTL_MINUTES = float(os.getenv("PASSWORD_RESET_TOKEN_TTL_MINUTES", "30"))
+PASSWORD_RESET_URL = os.getenv("PASSWORD_RESET_URL", "http://localhost/reset-password")
+
+
+def hash_reset_token(token: str) -> str:
+    """
+    Digest a reset token for storage and lookup.
+
+    Tokens carry 256 random bits, so a plain SHA-256 is enough; unlike
+    passwords they need no slow hash, and the digest can be looked up
+    directly through a unique index.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def reset_email(token: str) -> tuple:
+    """Subject and body of the password reset email."""
+    return (
+        "Reset your password",
+        f"Someone asked to reset the password for this account.\n\n"
+        f"Use this link within {PASSWORD_RESET_TOKEN_TTL_MINUTES:g} minutes to choose a new password:\n"
+        f"{PASSWORD_RESET_URL}?token={token}\n\n"
+        f"If this was not you, ignore this email; your password has not changed.\n"
+    )
+
+
+async def issue_reset_token(db: AsyncSession, user: AuthUser) -> str:
+    """
+    Create a reset token for a user and queue the email that carries it.
+
+    The token digest and the email are written in one transaction; the mail
+    delivery job sends the email, so no mail I/O happens on the request path.
+    The raw token exists only in the queued email, whose body is dropped
+    once it is sent or gives up.
+
+    Returns:
+        str: The raw token
+    """
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.utcnow() + timedelta(minutes=PASSWORD_RESET_TOKEN_TTL_MINUTES)
+    await create_password_reset_token(db, user.id, hash_reset_token(token), expires_at)
+    subject, body = reset_email(token)
+    queue_mail(db, user.email, subject, body)
+    await db.commit()
+    return token
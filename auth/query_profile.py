@@ -0,0 +1,162 @@
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from metrics import Counter, Summary
+
+logger = logging.getLogger(__name__)
+
+# This module is copied as is between the auth service and the shards, which
+# are built from their own directories like metrics.py; only METRIC_PREFIX
+# differs. Each service instruments its own engines with instrument().
+METRIC_PREFIX = "auth"
+
+# Configuration
+# Count and time the SQL statements each request runs
+QUERY_PROFILE_ENABLED = os.getenv("QUERY_PROFILE_ENABLED", "true").lower() == "true"
+# Report them to clients in a Server-Timing response header; it reveals how
+# much database work a route does, so keep it off where clients are untrusted
+QUERY_PROFILE_SERVER_TIMING = os.getenv("QUERY_PROFILE_SERVER_TIMING", "false").lower() == "true"
+# Log a warning for requests running more statements than this; 0 disables
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))
+QUERY_PROFILE_STATEMENT_CHARS = int(os.getenv("QUERY_PROFILE_STATEMENT_CHARS", "200"))
+
+request_statements = Summary(f"{METRIC_PREFIX}_request_db_statements", "SQL statements per request by route")
+request_db_seconds = Summary(f"{METRIC_PREFIX}_request_db_seconds", "Database time per request by route")
+request_slowest_statement = Summary(
+    f"{METRIC_PREFIX}_request_db_slowest_statement_seconds",
+    "Duration of the slowest SQL statement of each request by route"
+)
+query_budget_exceeded = Counter(
+    f"{METRIC_PREFIX}_query_budget_exceeded_total",
+    "Requests that ran more than QUERY_BUDGET statements by route"
+)
+
+
+@dataclass
+class RequestQueries:
+    """SQL statements run on behalf of one request."""
+    count: int = 0
+    seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: Optional[str] = None
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.seconds * 1000:.2f};desc="{self.count} statements", '
+            f"db-slowest;dur={self.slowest_seconds * 1000:.2f}"
+        )
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def current_queries() -> Optional[RequestQueries]:
+    """The statements recorded so far for the request being served, if any."""
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    queries = _current.get()
+    if queries is not None:
+        queries.record(statement, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection and exception_context.connection.info.get("query_started")
+    if started:
+        started.pop()
+
+
+def instrument(*async_engines: AsyncEngine):
+    """
+    Time every statement run on the engines; they are attributed to the current request.
+
+    Does nothing unless QUERY_PROFILE_ENABLED.
+    """
+    if not QUERY_PROFILE_ENABLED:
+        return
+    for async_engine in async_engines:
+        sync_engine = async_engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def _short(statement: Optional[str]) -> str:
+    statement = re.sub(r"\s+", " ", statement or "").strip()
+    if len(statement) > QUERY_PROFILE_STATEMENT_CHARS:
+        return statement[:QUERY_PROFILE_STATEMENT_CHARS] + "..."
+    return statement
+
+
+def record_request(route: str, method: str, queries: RequestQueries):
+    """Aggregate a finished request's statements per route and enforce QUERY_BUDGET."""
+    request_statements.observe(queries.count, route=route, method=method)
+    request_db_seconds.observe(queries.seconds, route=route, method=method)
+    if queries.count:
+        request_slowest_statement.observe(queries.slowest_seconds, route=route, method=method)
+    if QUERY_BUDGET and queries.count > QUERY_BUDGET:
+        query_budget_exceeded.inc(route=route, method=method)
+        logger.warning(
+            "%s %s ran %d SQL statements (budget %d) in %.1f ms; slowest %.1f ms: %s",
+            method, route, queries.count, QUERY_BUDGET, queries.seconds * 1000,
+            queries.slowest_seconds * 1000, _short(queries.slowest_statement)
+        )
+
+
+class QueryProfileMiddleware:
+    """
+    ASGI middleware collecting the SQL statements of each request.
+
+    Statements are attributed to the request through a context variable, so
+    only statements run by the request's own task and the tasks it starts
+    are counted; background workers are not, and jobs a request schedules
+    must be spawned in a fresh context (see jobs.py). Totals are aggregated per
+    route template, which keeps the number of metric series fixed. The
+    Server-Timing header is written when the response starts, so it leaves
+    out statements run while the body streams; the aggregates include them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_PROFILE_ENABLED:
+            return await self.app(scope, receive, send)
+        queries = RequestQueries()
+        token = _current.set(queries)
+
+        async def profiling_send(message):
+            if message["type"] == "http.response.start" and QUERY_PROFILE_SERVER_TIMING:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", queries.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, profiling_send)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            record_request(route, scope["method"], queries)
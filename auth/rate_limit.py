@@ -0,0 +1,289 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from metrics import Counter, register_collector
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" or "redis"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Worker processes sharing the budgets below with the memory backend; set by
+# gunicorn.conf.py. Each worker enforces its share of every rate and burst,
+# so the service as a whole allows about the configured budget
+RATE_LIMIT_WORKERS = max(1, int(os.getenv("RATE_LIMIT_WORKERS", "1")))
+
+# Token bucket parameters: refill rate in tokens per second and bucket size
+LOGIN_IP_RATE = float(os.getenv("LOGIN_IP_RATE", "1.0"))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_ACCOUNT_RATE = float(os.getenv("LOGIN_ACCOUNT_RATE", "0.1"))
+LOGIN_ACCOUNT_BURST = int(os.getenv("LOGIN_ACCOUNT_BURST", "5"))
+PASSWORD_RESET_IP_RATE = float(os.getenv("PASSWORD_RESET_IP_RATE", "0.05"))
+PASSWORD_RESET_IP_BURST = int(os.getenv("PASSWORD_RESET_IP_BURST", "10"))
+PASSWORD_RESET_EMAIL_RATE = float(os.getenv("PASSWORD_RESET_EMAIL_RATE", "0.001"))
+PASSWORD_RESET_EMAIL_BURST = int(os.getenv("PASSWORD_RESET_EMAIL_BURST", "3"))
+
+# Peers whose X-Real-IP header is trusted: comma-separated addresses,
+# networks or host names such as the router's service name. Host names are
+# re-resolved every TRUSTED_PROXY_RESOLVE_SECONDS. Anyone else is keyed by
+# their own address, so a client cannot rotate the header to dodge the limit.
+TRUSTED_PROXIES = [entry.strip() for entry in os.getenv("TRUSTED_PROXIES", "").split(",") if entry.strip()]
+TRUSTED_PROXY_RESOLVE_SECONDS = float(os.getenv("TRUSTED_PROXY_RESOLVE_SECONDS", "30"))
+
+rate_limit_decisions = Counter(
+    "auth_rate_limit_decisions_total",
+    "Login and password reset rate limiter decisions by scope and outcome"
+)
+
+
+class MemoryRateLimitStore:
+    """
+    In-process token bucket store.
+
+    Kept identical in the auth service and the shards, which are built from
+    their own directories and share no code. Buckets live in an LRU-ordered dict.
+    Buckets that have refilled completely carry no state and are dropped on
+    access, and the least recently used buckets are evicted once max_keys is
+    reached, so memory stays bounded under a spray of distinct keys.
+
+    Requests are spread over the workers, so with workers > 1 each bucket
+    holds 1/workers of the rate and burst it is taken with.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, workers: int = RATE_LIMIT_WORKERS):
+        self.max_keys = max_keys
+        self.workers = workers
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Take tokens from a bucket.
+
+        Args:
+            key: Bucket key
+            rate: Refill rate in tokens per second
+            burst: Bucket capacity
+            cost: Number of tokens to take
+
+        Returns:
+            Tuple of (allowed, seconds until enough tokens are available)
+        """
+        rate, burst = rate / self.workers, max(cost, burst / self.workers)
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+
+        if tokens >= cost:
+            tokens -= cost
+            allowed, retry_after = True, 0.0
+        else:
+            allowed, retry_after = False, (cost - tokens) / rate
+
+        if tokens < burst:
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+# Atomic token bucket update executed server-side so every auth worker shares
+# the same bucket. KEYS[1] = bucket key, ARGV = rate, burst, now, cost.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisRateLimitStore:
+    """
+    Shared token bucket store backed by Redis.
+
+    Any client implementing the redis-py asyncio ``eval`` API can be passed in,
+    which lets a local fake (e.g. fakeredis) stand in for a real server.
+    """
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, retry_after = await self.client.eval(
+            _TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, burst, time.time(), cost
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    def size(self) -> int:
+        return -1
+
+
+def create_store():
+    """Create the rate limit store selected by RATE_LIMIT_BACKEND."""
+    if RATE_LIMIT_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "RATE_LIMIT_BACKEND=redis requires the 'redis' package"
+            ) from exc
+        return RedisRateLimitStore(redis.from_url(RATE_LIMIT_REDIS_URL))
+    return MemoryRateLimitStore()
+
+
+store = create_store()
+
+
+@register_collector
+def _store_samples():
+    yield "auth_rate_limit_tracked_keys", {"backend": RATE_LIMIT_BACKEND}, store.size()
+
+
+class TrustedProxies:
+    """Matches peer addresses against TRUSTED_PROXIES."""
+
+    def __init__(self, entries: List[str], resolve_interval: float = TRUSTED_PROXY_RESOLVE_SECONDS):
+        self.networks = []
+        self.hostnames = []
+        for entry in entries:
+            try:
+                self.networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                self.hostnames.append(entry)
+        self.resolve_interval = resolve_interval
+        self._resolved: Set[str] = set()
+        self._resolved_at = float("-inf")
+
+    async def _resolve(self):
+        loop = asyncio.get_running_loop()
+        addresses = set()
+        for hostname in self.hostnames:
+            try:
+                for *_, sockaddr in await loop.getaddrinfo(hostname, None):
+                    addresses.add(sockaddr[0])
+            except OSError as exc:
+                logger.warning("Could not resolve trusted proxy %s: %s", hostname, exc)
+        self._resolved = addresses
+        self._resolved_at = time.monotonic()
+
+    async def contains(self, host: str) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        if any(address in network for network in self.networks):
+            return True
+        if not self.hostnames:
+            return False
+        if time.monotonic() - self._resolved_at > self.resolve_interval:
+            await self._resolve()
+        return host in self._resolved
+
+
+trusted_proxies = TrustedProxies(TRUSTED_PROXIES)
+
+
+async def get_client_ip(request: Request) -> str:
+    """Get the client address, taking the X-Real-IP header only from a trusted proxy."""
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-real-ip")
+    if forwarded and await trusted_proxies.contains(peer):
+        return forwarded
+    return peer
+
+
+async def _check(scope: str, key: str, rate: float, burst: int) -> Optional[float]:
+    allowed, retry_after = await store.take(f"{scope}:{key}", rate, burst)
+    rate_limit_decisions.inc(scope=scope, outcome="allowed" if allowed else "rejected")
+    return None if allowed else retry_after
+
+
+def _too_many(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+    )
+
+
+async def enforce_login_rate_limit(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends()
+) -> str:
+    """
+    Reject login attempts that exceed the per-IP or per-account budget.
+
+    Runs as a dependency ahead of the database session and bcrypt verification,
+    so throttled requests cost a dictionary lookup. The account bucket is
+    keyed by the account alone, so guesses spread over many addresses share
+    one budget. Failed attempts from anywhere can throttle the account's
+    owner until it refills; a successful login hands its token back (see
+    refund_login_attempt).
+
+    Returns:
+        str: Account bucket key for refund_login_attempt
+
+    Raises:
+        HTTPException: 429 with Retry-After if either bucket is empty
+    """
+    ip = await get_client_ip(request)
+    account_key = form_data.username.strip().lower()
+    retry_after = await _check("ip", ip, LOGIN_IP_RATE, LOGIN_IP_BURST)
+    if retry_after is None:
+        retry_after = await _check("account", account_key, LOGIN_ACCOUNT_RATE, LOGIN_ACCOUNT_BURST)
+    if retry_after is not None:
+        raise _too_many("Too many login attempts", retry_after)
+    return account_key
+
+
+async def refund_login_attempt(account_key: str):
+    """Return the account token taken for a login that succeeded; only failed attempts count."""
+    await store.take(f"account:{account_key}", LOGIN_ACCOUNT_RATE, LOGIN_ACCOUNT_BURST, cost=-1.0)
+
+
+async def enforce_password_reset_rate_limit(request: Request, email: str):
+    """
+    Reject password reset requests that exceed the per-IP or per-email budget.
+
+    The email bucket is charged whether or not the account exists, so the
+    limit reveals nothing about registered addresses and cannot be used to
+    flood an inbox.
+
+    Raises:
+        HTTPException: 429 with Retry-After if either bucket is empty
+    """
+    ip = await get_client_ip(request)
+    retry_after = await _check("reset_ip", ip, PASSWORD_RESET_IP_RATE, PASSWORD_RESET_IP_BURST)
+    if retry_after is None:
+        retry_after = await _check(
+            "reset_email", email.strip().lower(), PASSWORD_RESET_EMAIL_RATE, PASSWORD_RESET_EMAIL_BURST
+        )
+    if retry_after is not None:
+        raise _too_many("Too many password reset requests", retry_after)
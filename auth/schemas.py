@@ -43,6 +43,11 @@ class PasswordReset(BaseModel):
     """Schema for password reset request."""
     email: EmailStr
 
+class PasswordResetConfirm(BaseModel):
+    """Schema for completing a password reset with the emailed token."""
+    token: str
+    new_password: str
+
 class PasswordChange(BaseModel):
     """Schema for password change request."""
     current_password: str
@@ -14,4 +14,8 @@ python init_db.py
 
 # Start the FastAPI application
 echo "Starting FastAPI application..."
-uvicorn main:app --host 0.0.0.0 --port 8000 
\ No newline at end of file
+if [ "${SERVER_MODE:-production}" = "development" ]; then
+  exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+else
+  exec gunicorn -c gunicorn.conf.py main:app
+fi
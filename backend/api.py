@@ -1,28 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
 from database import get_db_session
 from schemas import (
-    Product, ProductCreate,
-    Order, OrderCreate,
+    Product, ProductCreate, ProductSearchResult,
+    Order, OrderCreate, QueuedOrder,
     OrderItem, OrderItemCreate,
     ProductCategory, ProductCategoryCreate,
-    User, UserCreate
+    User, UserCreate, UserOrderSummary
 )
 import crud
+from search import search_index
+from order_queue import order_queue, ORDER_INGEST_MODE
+from http_cache import conditional_get
+from authorization import can_access
+from serialization import FAST_JSON_LISTS, rows_response
+import order_stats
 
 router = APIRouter()
 
+async def get_current_user_id(x_user_id: Optional[int] = Header(None)) -> int:
+    """Get the authenticated user id that the router forwards in X-User-Id."""
+    if x_user_id is None:
+        raise HTTPException(status_code=401, detail="Missing X-User-Id header")
+    return x_user_id
+
+def queued_order(entry: dict) -> dict:
+    """Build the queued order response from a queue entry."""
+    return QueuedOrder(
+        reference=entry["ref"],
+        status=entry["status"],
+        order_id=entry["order_id"],
+        error=entry["error"]
+    ).model_dump()
+
 # Product Category endpoints
 @router.get("/categories", response_model=List[ProductCategory])
 async def get_categories(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     db: AsyncSession = Depends(get_db_session)
 ):
     """Get list of product categories."""
-    return await crud.get_categories(db, skip=skip, limit=limit)
+    not_modified = await conditional_get(request, response, db, ["product_categories"])
+    if not_modified:
+        return not_modified
+    return await crud.get_product_categories(db, skip=skip, limit=limit)
 
 @router.post("/categories", response_model=ProductCategory)
 async def create_category(
@@ -30,15 +57,20 @@ async def create_category(
     db: AsyncSession = Depends(get_db_session)
 ):
     """Create a new product category."""
-    return await crud.create_category(db, category)
+    return await crud.create_product_category(db, category)
 
 @router.get("/categories/{category_id}", response_model=ProductCategory)
 async def get_category(
     category_id: int,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db_session)
 ):
     """Get a specific product category by ID."""
-    category = await crud.get_category(db, category_id)
+    not_modified = await conditional_get(request, response, db, ["product_categories"])
+    if not_modified:
+        return not_modified
+    category = await crud.get_product_category(db, category_id)
     if category is None:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
@@ -46,11 +78,18 @@ async def get_category(
 # Product endpoints
 @router.get("/products", response_model=List[Product])
 async def get_products(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     db: AsyncSession = Depends(get_db_session)
 ):
     """Get list of products."""
+    not_modified = await conditional_get(request, response, db, ["products", "product_categories"])
+    if not_modified:
+        return not_modified
+    if FAST_JSON_LISTS:
+        return rows_response(Product, await crud.get_product_rows(db, skip=skip, limit=limit), headers=dict(response.headers))
     return await crud.get_products(db, skip=skip, limit=limit)
 
 @router.post("/products", response_model=Product)
@@ -61,12 +100,36 @@ async def create_product(
     """Create a new product."""
     return await crud.create_product(db, product)
 
+@router.get("/products/search", response_model=List[ProductSearchResult])
+async def search_products(
+    q: str,
+    category_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Search products by name and description from the in-memory index."""
+    return [
+        ProductSearchResult(
+            id=product.id,
+            name=product.name,
+            description=product.description,
+            price=product.price,
+            category_id=product.category_id,
+            score=score
+        )
+        for product, score in search_index.search(q, category_id=category_id, limit=limit)
+    ]
+
 @router.get("/products/{product_id}", response_model=Product)
 async def get_product(
     product_id: int,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db_session)
 ):
     """Get a specific product by ID."""
+    not_modified = await conditional_get(request, response, db, ["products", "product_categories"])
+    if not_modified:
+        return not_modified
     product = await crud.get_product(db, product_id)
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -80,24 +143,51 @@ async def get_orders(
     db: AsyncSession = Depends(get_db_session)
 ):
     """Get list of orders."""
+    if FAST_JSON_LISTS:
+        return rows_response(Order, await crud.get_order_rows(db, skip=skip, limit=limit))
     return await crud.get_orders(db, skip=skip, limit=limit)
 
-@router.post("/orders", response_model=Order)
+@router.post("/orders", response_model=Order, responses={202: {"model": QueuedOrder}})
 async def create_order(
     order: OrderCreate,
+    user_id: int = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_db_session)
 ):
-    """Create a new order."""
-    return await crud.create_order(db, order)
+    """
+    Create a new order.
+
+    With ORDER_INGEST_MODE=async the order is queued durably and a 202 with a
+    reference is returned; a worker writes it to the shard master in batches.
+    """
+    if ORDER_INGEST_MODE == "async":
+        entry = await order_queue.enqueue(user_id, order.model_dump(mode="json"), idempotency_key)
+        if entry is None:
+            raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+        return JSONResponse(status_code=202, content=queued_order(entry))
+    return await crud.create_order(db, order, user_id)
+
+@router.get("/orders/queued/{reference}", response_model=QueuedOrder)
+async def get_queued_order(
+    reference: str,
+    user_id: int = Depends(get_current_user_id)
+):
+    """Get the status of a queued order."""
+    entry = await order_queue.get(reference, user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Queued order not found")
+    return queued_order(entry)
 
 @router.get("/orders/{order_id}", response_model=Order)
 async def get_order(
     order_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db_session)
 ):
-    """Get a specific order by ID."""
+    """Get a specific order by ID; other users' orders need orders:read:all."""
     order = await crud.get_order(db, order_id)
-    if order is None:
+    # Someone else's order looks the same as a missing one
+    if order is None or not can_access(request, order.user_id, "orders:read:all"):
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
@@ -106,10 +196,14 @@ async def get_order(
 async def create_order_item(
     order_id: int,
     item: OrderItemCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db_session)
 ):
-    """Add an item to an order."""
-    return await crud.create_order_item(db, order_id, item)
+    """Add an item to one of the caller's orders."""
+    owner_id = await order_stats.order_user_id(db, order_id)
+    if owner_id is None or not can_access(request, owner_id):
+        raise HTTPException(status_code=404, detail="Order not found")
+    return await crud.create_order_item(db, item, order_id)
 
 # User endpoints
 @router.get("/users", response_model=List[User])
@@ -119,6 +213,8 @@ async def get_users(
     db: AsyncSession = Depends(get_db_session)
 ):
     """Get list of users."""
+    if FAST_JSON_LISTS:
+        return rows_response(User, await crud.get_user_rows(db, skip=skip, limit=limit))
     return await crud.get_users(db, skip=skip, limit=limit)
 
 @router.get("/users/{user_id}", response_model=User)
@@ -142,6 +238,14 @@ async def get_user_orders(
     """Get orders for a specific user."""
     return await crud.get_user_orders(db, user_id, skip=skip, limit=limit)
 
+@router.get("/users/{user_id}/summary", response_model=UserOrderSummary)
+async def get_user_summary(
+    user_id: int,
+    db: AsyncSession = Depends(get_db_session)
+):
+    """Get a user's order count, lifetime spend and last order status."""
+    return await order_stats.get_summary(db, user_id)
+
 @router.post("/users", response_model=User)
 async def create_user(
     user: UserCreate,
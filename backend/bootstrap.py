@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, List
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, UniqueConstraint, func, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from database import DB_NAME, SHARD, engine, replica_engine
+from models import Base
+from replication import configure_replica
+
+# Configuration
+BOOTSTRAP_TIMEOUT = float(os.getenv("BOOTSTRAP_TIMEOUT", "60"))
+BOOTSTRAP_PROBE_TIMEOUT = float(os.getenv("BOOTSTRAP_PROBE_TIMEOUT", "3"))
+# Account the auth service provisions users with (SHARD_DB_USER there)
+PROVISIONER_DB_USER = os.getenv("PROVISIONER_DB_USER", "provisioner")
+PROVISIONER_DB_PASSWORD = os.getenv("PROVISIONER_DB_PASSWORD", "provisionerpassword")
+
+# Kept outside Base.metadata so it does not feed its own fingerprint
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("applied_at", DateTime, server_default=func.now(), onupdate=func.now()),
+)
+
+
+class StartupTimer:
+    """Records how long each bootstrap phase takes."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    async def measure(self, name: str, coro):
+        phase_started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.phases[name] = time.perf_counter() - phase_started
+
+    def report(self) -> str:
+        parts = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases.items())
+        return f"total={time.perf_counter() - self.started:.2f}s ({parts})"
+
+
+async def wait_until_ready(db_engine: AsyncEngine, name: str, timeout: float = BOOTSTRAP_TIMEOUT):
+    """
+    Wait until a database accepts queries.
+
+    Probes with SELECT 1 and retries with exponential backoff (0.1s doubling
+    up to 2s) until timeout.
+
+    Raises:
+        TimeoutError: If the database is not ready in time
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        try:
+            async with db_engine.connect() as conn:
+                await asyncio.wait_for(conn.execute(text("SELECT 1")), BOOTSTRAP_PROBE_TIMEOUT)
+            return
+        except Exception as exc:
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"{name} not ready after {timeout:.0f}s: {exc}") from exc
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+def schema_fingerprint() -> str:
+    """Hash the DDL of every model table and index."""
+    dialect = engine.dialect
+    digest = hashlib.sha256()
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return digest.hexdigest()
+
+
+def upgrade_tables(sync_conn) -> List[str]:
+    """
+    Add the columns, unique constraints and indexes that tables created by an
+    older version of the models are missing.
+
+    create_all only creates tables that do not exist yet. Columns are added
+    nullable or with their server default as the model declares them; unique
+    constraints on added columns become unique indexes.
+
+    Returns:
+        The DDL statements run
+    """
+    inspector = inspect(sync_conn)
+    existing = set(inspector.get_table_names())
+    preparer = sync_conn.dialect.identifier_preparer
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        table_name = preparer.format_table(table)
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        added = {column.name for column in table.columns if column.name not in present}
+        for column in table.columns:
+            if column.name in added:
+                statements.append(
+                    f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(dialect=sync_conn.dialect)}"
+                )
+        for constraint in table.constraints:
+            columns = [column.name for column in constraint.columns]
+            if isinstance(constraint, UniqueConstraint) and added.intersection(columns):
+                name = constraint.name or f"uq_{table.name}_{'_'.join(columns)}"
+                statements.append(
+                    f"CREATE UNIQUE INDEX {preparer.quote(name)} ON {table_name} "
+                    f"({', '.join(preparer.quote(column) for column in columns)})"
+                )
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                statements.append(str(CreateIndex(index).compile(dialect=sync_conn.dialect)))
+    for statement in statements:
+        sync_conn.execute(text(statement))
+    return statements
+
+
+async def ensure_schema() -> bool:
+    """
+    Create tables and add missing columns and indexes, only when the model
+    schema changed since the last bootstrap.
+
+    Returns:
+        True if create_all ran, False if the stored fingerprint matched
+    """
+    fingerprint = schema_fingerprint()
+    async with engine.begin() as conn:
+        await conn.run_sync(schema_version.metadata.create_all)
+        stored = (await conn.execute(
+            select(schema_version.c.fingerprint).where(schema_version.c.id == 1)
+        )).scalar_one_or_none()
+        if stored == fingerprint:
+            return False
+
+        await conn.run_sync(Base.metadata.create_all)
+        for statement in await conn.run_sync(upgrade_tables):
+            print(f"Schema upgrade: {statement}")
+        if stored is None:
+            await conn.execute(schema_version.insert().values(id=1, fingerprint=fingerprint))
+        else:
+            await conn.execute(
+                schema_version.update().where(schema_version.c.id == 1).values(fingerprint=fingerprint)
+            )
+        return True
+
+
+async def ensure_provisioner():
+    """
+    Create the account the auth service provisions users with.
+
+    It may only read and write the users table, so the auth service's shard
+    credentials cannot touch orders or anything else on the shard. Created
+    on the master; the replica gets it through replication.
+    """
+    async with engine.begin() as conn:
+        account = {"user": PROVISIONER_DB_USER, "password": PROVISIONER_DB_PASSWORD}
+        await conn.execute(text("CREATE USER IF NOT EXISTS :user@'%' IDENTIFIED BY :password"), account)
+        await conn.execute(text("ALTER USER :user@'%' IDENTIFIED BY :password"), account)
+        await conn.execute(
+            text(f"GRANT SELECT, INSERT, UPDATE ON `{DB_NAME}`.`users` TO :user@'%'"),
+            {"user": PROVISIONER_DB_USER}
+        )
+
+
+async def bootstrap():
+    """Wait for the shard databases, bring the schema up to date and start replication."""
+    timer = StartupTimer()
+    await asyncio.gather(
+        timer.measure("master_ready", wait_until_ready(engine, f"mysql-master-{SHARD}")),
+        timer.measure("replica_ready", wait_until_ready(replica_engine, f"mysql-replica-{SHARD}")),
+    )
+    changed, _ = await asyncio.gather(
+        timer.measure("schema", ensure_schema()),
+        timer.measure("replication", configure_replica()),
+    )
+    print(f"Schema {'updated' if changed else 'unchanged'} on shard {SHARD}")
+    await timer.measure("provisioner", ensure_provisioner())
+    await asyncio.gather(engine.dispose(), replica_engine.dispose())
+    print(f"Bootstrap finished: {timer.report()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(bootstrap())
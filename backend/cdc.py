@@ -0,0 +1,470 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from database import SHARD, DB_HOST, DB_NAME, DB_PASSWORD, DB_USER
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CDC_SOURCE = os.getenv("CDC_SOURCE", "binlog")  # "binlog" or "file:<path>"
+CDC_SINK = os.getenv("CDC_SINK", "file:data/cdc_events.ndjson")  # "file:<path>", "webhook:<url>" or "queue"
+CDC_CHECKPOINT_PATH = os.getenv("CDC_CHECKPOINT_PATH", "data/cdc_checkpoint.json")
+CDC_BATCH_SIZE = int(os.getenv("CDC_BATCH_SIZE", "500"))
+CDC_FLUSH_SECONDS = float(os.getenv("CDC_FLUSH_SECONDS", "1"))
+# Must differ from every MySQL server id and every other binlog reader
+CDC_SERVER_ID = int(os.getenv("CDC_SERVER_ID", str(100 + ord(SHARD[0]))))
+
+CDC_TABLES = ["orders", "order_items", "users"]
+# Never published, whatever the sink
+EXCLUDED_COLUMNS = {"users": {"hashed_password"}}
+
+cdc_events = Counter("cdc_events_total", "Change events published by table and operation")
+cdc_last_commit = Gauge("cdc_last_commit_timestamp", "Commit time of the last published transaction")
+
+
+@dataclass
+class ChangeEvent:
+    """One row change. (gtid, seq) is unique and ordered within a shard."""
+    shard: str
+    gtid: str
+    seq: int
+    table: str
+    op: str  # "insert", "update" or "delete"
+    committed_at: float
+    before: Optional[dict] = None
+    after: Optional[dict] = None
+
+
+@dataclass
+class Transaction:
+    """Row changes committed together under one GTID."""
+    gtid: str
+    committed_at: float
+    events: List[ChangeEvent] = field(default_factory=list)
+
+
+class GtidSet:
+    """A MySQL GTID set such as "uuid:1-5:7", as far as a single reader needs it."""
+
+    def __init__(self, text: str = ""):
+        self.intervals: Dict[str, List[List[int]]] = {}
+        for member in text.replace("\n", "").split(","):
+            member = member.strip()
+            if not member:
+                continue
+            uuid, *ranges = member.split(":")
+            for interval in ranges:
+                start, _, end = interval.partition("-")
+                self.intervals.setdefault(uuid, []).append([int(start), int(end or start)])
+        for uuid in self.intervals:
+            self._merge(uuid)
+
+    def _merge(self, uuid: str):
+        merged = []
+        for start, end in sorted(self.intervals[uuid]):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.intervals[uuid] = merged
+
+    def __contains__(self, gtid: str) -> bool:
+        uuid, _, number = gtid.rpartition(":")
+        return any(start <= int(number) <= end for start, end in self.intervals.get(uuid, []))
+
+    def add(self, gtid: str):
+        uuid, _, number = gtid.rpartition(":")
+        self.intervals.setdefault(uuid, []).append([int(number), int(number)])
+        self._merge(uuid)
+
+    def __str__(self) -> str:
+        return ",".join(
+            uuid + "".join(f":{start}" if start == end else f":{start}-{end}" for start, end in ranges)
+            for uuid, ranges in sorted(self.intervals.items())
+        )
+
+
+def _clean(table: str, row: Optional[dict]) -> Optional[dict]:
+    if row is None:
+        return None
+    excluded = EXCLUDED_COLUMNS.get(table, ())
+    return {column: value for column, value in row.items() if column not in excluded}
+
+
+#######################
+# Sources
+#######################
+
+class BinlogSource:
+    """
+    Tails the shard master's row-based binlog with GTID auto-positioning.
+
+    The reader registers as a replica, so it resumes from any GTID set the
+    master still has binlogs for. python-mysql-replication is synchronous;
+    it runs on a thread and hands finished transactions to the event loop.
+    """
+
+    def __init__(self, server_id: int = CDC_SERVER_ID, tables: List[str] = CDC_TABLES):
+        self.server_id = server_id
+        self.tables = tables
+
+    def _read(self, executed: str, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stopping):
+        from pymysqlreplication import BinLogStreamReader
+        from pymysqlreplication.event import GtidEvent, XidEvent
+        from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+
+        stream = BinLogStreamReader(
+            connection_settings={"host": DB_HOST, "port": 3306, "user": DB_USER, "passwd": DB_PASSWORD},
+            server_id=self.server_id,
+            blocking=True,
+            auto_position=executed or None,
+            only_schemas=[DB_NAME],
+            only_tables=self.tables,
+            only_events=[GtidEvent, XidEvent, WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent],
+        )
+        def hand_over(item) -> bool:
+            # Blocks while the queue is full, but gives up once the consumer stopped
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stopping.is_set():
+                try:
+                    future.result(timeout=1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    continue
+            future.cancel()
+            return False
+
+        transaction = None
+        try:
+            for event in stream:
+                if stopping.is_set():
+                    break
+                # Transactions are handed over even without changes to the
+                # CDC tables, so every GTID reaches the checkpoint
+                if isinstance(event, GtidEvent):
+                    # A transaction with no Xid, such as DDL, ends where the next one starts
+                    if transaction is not None and not hand_over(transaction):
+                        break
+                    transaction = Transaction(gtid=event.gtid, committed_at=float(event.timestamp))
+                elif isinstance(event, XidEvent):
+                    if transaction is not None and not hand_over(transaction):
+                        break
+                    transaction = None
+                elif transaction is not None:
+                    for row in event.rows:
+                        if isinstance(event, WriteRowsEvent):
+                            op, before, after = "insert", None, row["values"]
+                        elif isinstance(event, UpdateRowsEvent):
+                            op, before, after = "update", row["before_values"], row["after_values"]
+                        else:
+                            op, before, after = "delete", row["values"], None
+                        transaction.events.append(ChangeEvent(
+                            shard=SHARD,
+                            gtid=transaction.gtid,
+                            seq=len(transaction.events),
+                            table=event.table,
+                            op=op,
+                            committed_at=transaction.committed_at,
+                            before=_clean(event.table, before),
+                            after=_clean(event.table, after)
+                        ))
+        finally:
+            stream.close()
+            hand_over(None)
+
+    async def transactions(self, executed: GtidSet) -> AsyncIterator[Transaction]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        stopping = threading.Event()
+        reader = loop.run_in_executor(None, self._read, str(executed), loop, queue, stopping)
+        try:
+            while True:
+                transaction = await queue.get()
+                if transaction is None:
+                    await reader  # re-raises the reader's error, if any
+                    return
+                yield transaction
+        finally:
+            # The reader thread exits when it sees its next binlog event
+            stopping.set()
+
+
+class FileSource:
+    """
+    Stand-in for the binlog: reads transactions from an NDJSON file.
+
+    Each line is {"gtid": "uuid:n", "committed_at": ts, "rows": [{"table",
+    "op", "before", "after"}]}. The file is tailed like a binlog, so tests
+    and local runs can append transactions while the reader runs.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.2, follow: bool = True):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.follow = follow
+
+    async def transactions(self, executed: GtidSet) -> AsyncIterator[Transaction]:
+        while not os.path.exists(self.path):
+            if not self.follow:
+                return
+            await asyncio.sleep(self.poll_interval)
+        with open(self.path, "rb") as f:
+            while True:
+                position = f.tell()
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    # End of file, or a line that is still being written
+                    if not self.follow:
+                        return
+                    f.seek(position)
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                record = json.loads(line)
+                if record["gtid"] in executed:
+                    continue
+                transaction = Transaction(gtid=record["gtid"], committed_at=record.get("committed_at", time.time()))
+                for row in record["rows"]:
+                    if row["table"] not in CDC_TABLES:
+                        continue
+                    transaction.events.append(ChangeEvent(
+                        shard=SHARD,
+                        gtid=transaction.gtid,
+                        seq=len(transaction.events),
+                        table=row["table"],
+                        op=row["op"],
+                        committed_at=transaction.committed_at,
+                        before=_clean(row["table"], row.get("before")),
+                        after=_clean(row["table"], row.get("after"))
+                    ))
+                yield transaction
+
+
+#######################
+# Sinks
+#######################
+
+class FileSink:
+    """Appends events to an NDJSON file, fsynced per batch."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: List[str]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def publish(self, events: List[ChangeEvent]):
+        lines = [json.dumps(asdict(event), default=str) + "\n" for event in events]
+        await asyncio.to_thread(self._write, lines)
+
+
+class QueueSink:
+    """Puts events on an asyncio.Queue for consumers in the same process."""
+
+    def __init__(self, queue: Optional[asyncio.Queue] = None, maxsize: int = 10000):
+        self.queue = queue if queue is not None else asyncio.Queue(maxsize=maxsize)
+
+    async def publish(self, events: List[ChangeEvent]):
+        for event in events:
+            await self.queue.put(event)
+
+
+class WebhookSink:
+    """POSTs each batch as {"events": [...]} to a URL; any non-2xx response fails the batch."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, body: bytes):
+        request = urllib.request.Request(
+            self.url, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def publish(self, events: List[ChangeEvent]):
+        body = json.dumps({"events": [asdict(event) for event in events]}, default=str).encode()
+        await asyncio.to_thread(self._post, body)
+
+
+SINKS: Dict[str, Callable] = {
+    "file": FileSink,
+    "queue": lambda _: QueueSink(),
+    "webhook": WebhookSink,
+}
+
+
+def register_sink(scheme: str, factory: Callable):
+    """Make a sink available to create_sink as "<scheme>:<target>"."""
+    SINKS[scheme] = factory
+
+
+def create_sink(spec: str = CDC_SINK):
+    """Create a sink from a spec such as "file:data/cdc.ndjson" or "webhook:http://host/hook"."""
+    scheme, _, target = spec.partition(":")
+    return SINKS[scheme](target)
+
+
+def create_source(spec: str = CDC_SOURCE):
+    """Create a source from "binlog" or "file:<path>"."""
+    if spec == "binlog":
+        return BinlogSource()
+    scheme, _, path = spec.partition(":")
+    if scheme != "file":
+        raise ValueError(f"Unknown CDC source {spec!r}")
+    return FileSource(path)
+
+
+#######################
+# Reader
+#######################
+
+def load_checkpoint(path: str) -> Dict:
+    """Load the checkpoint written by a previous run, if any."""
+    if not os.path.exists(path):
+        return {"gtid_set": "", "events": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: Dict):
+    """Atomically replace the checkpoint file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CDCReader:
+    """
+    Publishes committed row changes in commit order, at least once.
+
+    Whole transactions are batched up to batch_size events or flush_interval
+    seconds. The checkpoint (the GTID set of every transaction read, including
+    those that changed no CDC table, so the set has no gaps) is saved only
+    after the sink accepted a batch, so after a crash the last batch may
+    be published again; consumers dedupe on (shard, gtid, seq).
+    """
+
+    def __init__(
+        self,
+        source,
+        sink,
+        checkpoint_path: str = CDC_CHECKPOINT_PATH,
+        batch_size: int = CDC_BATCH_SIZE,
+        flush_interval: float = CDC_FLUSH_SECONDS
+    ):
+        self.source = source
+        self.sink = sink
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _publish(self, batch: List[Transaction], executed: GtidSet, checkpoint: Dict):
+        events = [event for transaction in batch for event in transaction.events]
+        if events:
+            await self.sink.publish(events)
+        for transaction in batch:
+            executed.add(transaction.gtid)
+        checkpoint["gtid_set"] = str(executed)
+        checkpoint["events"] += len(events)
+        await asyncio.to_thread(save_checkpoint, self.checkpoint_path, checkpoint)
+        for event in events:
+            cdc_events.inc(table=event.table, op=event.op)
+        cdc_last_commit.set(batch[-1].committed_at, shard=SHARD)
+
+    async def run(self):
+        """Read and publish until the source ends or the task is cancelled."""
+        checkpoint = load_checkpoint(self.checkpoint_path)
+        executed = GtidSet(checkpoint["gtid_set"])
+        transactions = self.source.transactions(executed)
+        batch: List[Transaction] = []
+        size = 0
+        next_item = None
+        try:
+            while True:
+                if next_item is None:
+                    next_item = asyncio.ensure_future(transactions.__anext__())
+                timeout = self.flush_interval if batch else None
+                done, _ = await asyncio.wait({next_item}, timeout=timeout)
+                if not done:
+                    # Source is idle; do not hold a partial batch back
+                    await self._publish(batch, executed, checkpoint)
+                    batch, size = [], 0
+                    continue
+                finished, next_item = next_item, None
+                try:
+                    transaction = finished.result()
+                except StopAsyncIteration:
+                    break
+                batch.append(transaction)
+                # Transactions without events still count, so a run of them is checkpointed too
+                size += max(1, len(transaction.events))
+                if size >= self.batch_size:
+                    await self._publish(batch, executed, checkpoint)
+                    batch, size = [], 0
+            if batch:
+                await self._publish(batch, executed, checkpoint)
+        finally:
+            if next_item is not None:
+                next_item.cancel()
+                await asyncio.gather(next_item, return_exceptions=True)
+            await transactions.aclose()
+
+    async def _run_forever(self):
+        delay = 1.0
+        while True:
+            try:
+                await self.run()
+                delay = 1.0
+            except Exception:
+                logger.exception("CDC reader failed; resuming from the last checkpoint in %.0fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish row changes from this shard's binlog.")
+    parser.add_argument("--source", default=CDC_SOURCE, help='"binlog" or "file:<path>"')
+    parser.add_argument("--sink", default=CDC_SINK, help='"file:<path>" or "webhook:<url>"')
+    parser.add_argument("--checkpoint", default=CDC_CHECKPOINT_PATH)
+    parser.add_argument("--once", action="store_true", help="Stop at the end of a file source instead of tailing it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    source = create_source(args.source)
+    if args.once and isinstance(source, FileSource):
+        source.follow = False
+    reader = CDCReader(source, create_sink(args.sink), args.checkpoint)
+    asyncio.run(reader.run() if args.once else reader._run_forever())
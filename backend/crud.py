@@ -1,7 +1,11 @@
-from sqlalchemy import select
+from sqlalchemy import delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 import models, schemas
 from typing import List, Optional
+from search import search_index
+from http_cache import bump_version
+from order_stats import order_user_id, record_change, refresh_last_order, spend
 
 #######################
 # Product Categories
@@ -19,7 +23,7 @@ async def get_product_category(db: AsyncSession, category_id: int):
         models.ProductCategory: The product category object if found, else None.
     """
     result = await db.execute(
-        db.query(models.ProductCategory)
+        select(models.ProductCategory)
         .filter(models.ProductCategory.id == category_id)
     )
     return result.scalar_one_or_none()
@@ -38,7 +42,8 @@ async def get_product_categories(db: AsyncSession, skip: int = 0, limit: int = 1
         List[models.ProductCategory]: A list of product category objects.
     """
     result = await db.execute(
-        db.query(models.ProductCategory)
+        select(models.ProductCategory)
+        .order_by(models.ProductCategory.id)
         .offset(skip)
         .limit(limit)
     )
@@ -58,6 +63,7 @@ async def create_product_category(db: AsyncSession, category: schemas.ProductCat
     """
     db_category = models.ProductCategory(name=category.name)
     db.add(db_category)
+    await bump_version(db, "product_categories")
     await db.commit()
     await db.refresh(db_category)
     return db_category
@@ -79,6 +85,7 @@ async def update_product_category(db: AsyncSession, category_id: int, category:
     if db_category:
         for key, value in category.dict(exclude_unset=True).items():
             setattr(db_category, key, value)
+        await bump_version(db, "product_categories")
         await db.commit()
         await db.refresh(db_category)
     return db_category
@@ -98,6 +105,7 @@ async def delete_product_category(db: AsyncSession, category_id: int):
     db_category = await get_product_category(db, category_id)
     if db_category:
         await db.delete(db_category)
+        await bump_version(db, "product_categories")
         await db.commit()
         return True
     return False
@@ -119,7 +127,8 @@ async def get_product(db: AsyncSession, product_id: int):
         models.Product: The product object if found, else None.
     """
     result = await db.execute(
-        db.query(models.Product)
+        select(models.Product)
+        .options(selectinload(models.Product.category))
         .filter(models.Product.id == product_id)
     )
     return result.scalar_one_or_none()
@@ -138,13 +147,55 @@ async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100):
         List[models.Product]: A list of product objects.
     """
     result = await db.execute(
-        db.query(models.Product)
+        select(models.Product)
+        .options(selectinload(models.Product.category))
+        .order_by(models.Product.id)
         .offset(skip)
         .limit(limit)
     )
     return result.scalars().all()
 
 
+async def get_product_rows(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[dict]:
+    """
+    Retrieve a page of products as plain dicts shaped like schemas.Product.
+
+    Selects only the response columns with the category outer joined, so no
+    ORM objects are built and the page holds the same products as
+    get_products, including any whose category is missing.
+
+    Args:
+        db (AsyncSession): The database session.
+        skip (int, optional): Number of records to skip. Defaults to 0.
+        limit (int, optional): Maximum number of records to return. Defaults to 100.
+
+    Returns:
+        List[dict]: Product rows with a nested category.
+    """
+    result = await db.execute(
+        select(
+            models.Product.id,
+            models.Product.name,
+            models.Product.description,
+            models.Product.price,
+            models.Product.category_id,
+            models.ProductCategory.name.label("category_name")
+        )
+        .outerjoin(models.ProductCategory, models.Product.category_id == models.ProductCategory.id)
+        .order_by(models.Product.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return [
+        {
+            "id": id, "name": name, "description": description, "price": price,
+            "category_id": category_id,
+            "category": {"id": category_id, "name": category_name} if category_name is not None else None
+        }
+        for id, name, description, price, category_id, category_name in result.all()
+    ]
+
+
 async def create_product(db: AsyncSession, product: schemas.ProductCreate):
     """
     Create a new product.
@@ -158,8 +209,11 @@ async def create_product(db: AsyncSession, product: schemas.ProductCreate):
     """
     db_product = models.Product(**product.dict())
     db.add(db_product)
+    await bump_version(db, "products")
     await db.commit()
-    await db.refresh(db_product)
+    # Reloaded with its category, which the response includes
+    db_product = await get_product(db, db_product.id)
+    search_index.product_saved(db_product)
     return db_product
 
 
@@ -179,8 +233,10 @@ async def update_product(db: AsyncSession, product_id: int, product: schemas.Pro
     if db_product:
         for key, value in product.dict(exclude_unset=True).items():
             setattr(db_product, key, value)
+        await bump_version(db, "products")
         await db.commit()
         await db.refresh(db_product)
+        search_index.product_saved(db_product)
     return db_product
 
 
@@ -198,7 +254,9 @@ async def delete_product(db: AsyncSession, product_id: int):
     db_product = await get_product(db, product_id)
     if db_product:
         await db.delete(db_product)
+        await bump_version(db, "products")
         await db.commit()
+        search_index.product_deleted(product_id)
         return True
     return False
 
@@ -216,6 +274,22 @@ async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[m
     )
     return result.scalars().all()
 
+async def get_user_rows(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[dict]:
+    """Get a page of users as plain dicts shaped like schemas.User."""
+    result = await db.execute(
+        select(
+            models.User.id,
+            models.User.email,
+            models.User.is_active,
+            models.User.created_at,
+            models.User.last_login
+        )
+        .order_by(models.User.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return [dict(row) for row in result.mappings()]
+
 async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
     """Get a specific user by ID."""
     result = await db.execute(
@@ -250,6 +324,7 @@ async def delete_user(db: AsyncSession, user_id: int):
     """Delete user from this shard"""
     db_user = await get_user(db, user_id)
     if db_user:
+        await db.execute(delete(models.UserOrderStats).where(models.UserOrderStats.user_id == user_id))
         await db.delete(db_user)
         await db.commit()
         return True
@@ -260,23 +335,41 @@ async def delete_user(db: AsyncSession, user_id: int):
 # Orders
 #######################
 
+def select_orders_with_items():
+    """
+    Select orders with their items, products and categories eagerly loaded.
+
+    Async sessions cannot lazy load, so orders serialized as schemas.Order
+    must be loaded through this query.
+    """
+    return select(models.Order).options(
+        selectinload(models.Order.order_items)
+        .selectinload(models.OrderItem.product)
+        .selectinload(models.Product.category)
+    )
+
+
 async def create_order(db: AsyncSession, order: schemas.OrderCreate, user_id: int):
     """Create a new order."""
+    # Stats row first: it is the lock that orders the user's writes
+    await record_change(db, user_id, orders=1, spent=spend(order.status, order.total_amount))
     db_order = models.Order(
         user_id=user_id,
         status=order.status,
         total_amount=order.total_amount
     )
     db.add(db_order)
+    await db.flush()
+    await refresh_last_order(db, user_id)
     await db.commit()
-    await db.refresh(db_order)
-    return db_order
+    result = await db.execute(select_orders_with_items().filter(models.Order.id == db_order.id))
+    return result.scalar_one()
 
 
 async def get_order(db: AsyncSession, order_id: int):
     """Retrieve an order by its ID."""
     result = await db.execute(
-        db.query(models.Order)
+        select_orders_with_items()
         .filter(models.Order.id == order_id)
     )
     return result.scalar_one_or_none()
@@ -285,8 +378,9 @@ async def get_order(db: AsyncSession, order_id: int):
 async def get_user_orders(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100):
     """Retrieve all orders for a specific user."""
     result = await db.execute(
-        db.query(models.Order)
+        select_orders_with_items()
         .filter(models.Order.user_id == user_id)
+        .order_by(models.Order.id)
         .offset(skip)
         .limit(limit)
     )
@@ -297,9 +391,13 @@ async def update_order_status(db: AsyncSession, order_id: int, status: str):
     """Update the status of an order."""
     db_order = await get_order(db, order_id)
     if db_order:
+        old_spend = spend(db_order.status, db_order.total_amount)
+        await record_change(db, db_order.user_id, spent=spend(status, db_order.total_amount) - old_spend)
         db_order.status = status
+        await db.flush()
+        await refresh_last_order(db, db_order.user_id)
         await db.commit()
-        await db.refresh(db_order)
+        db_order = await get_order(db, order_id)
     return db_order
 
 
@@ -316,13 +414,80 @@ async def get_orders(db: AsyncSession, skip: int = 0, limit: int = 100):
         List[models.Order]: A list of order objects.
     """
     result = await db.execute(
-        db.query(models.Order)
+        select_orders_with_items()
+        .order_by(models.Order.id)
         .offset(skip)
         .limit(limit)
     )
     return result.scalars().all()
 
 
+async def get_order_rows(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[dict]:
+    """
+    Retrieve a page of orders as plain dicts shaped like schemas.Order.
+
+    Uses two queries, one for the page of orders and one for all of their
+    items with product and category joined, instead of lazy loads per order.
+
+    Args:
+        db (AsyncSession): The database session.
+        skip (int, optional): Number of records to skip. Defaults to 0.
+        limit (int, optional): Maximum number of records to return. Defaults to 100.
+
+    Returns:
+        List[dict]: Order rows with nested order items.
+    """
+    result = await db.execute(
+        select(
+            models.Order.id,
+            models.Order.user_id,
+            models.Order.total_amount,
+            models.Order.status
+        )
+        .order_by(models.Order.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    orders = {
+        id: {"id": id, "user_id": user_id, "total_amount": total_amount, "status": status, "order_items": []}
+        for id, user_id, total_amount, status in result.all()
+    }
+    if not orders:
+        return []
+
+    result = await db.execute(
+        select(
+            models.OrderItem.id,
+            models.OrderItem.order_id,
+            models.OrderItem.product_id,
+            models.OrderItem.quantity,
+            models.OrderItem.price,
+            models.Product.name,
+            models.Product.description,
+            models.Product.price,
+            models.Product.category_id,
+            models.ProductCategory.name
+        )
+        .outerjoin(models.Product, models.OrderItem.product_id == models.Product.id)
+        .outerjoin(models.ProductCategory, models.Product.category_id == models.ProductCategory.id)
+        .filter(models.OrderItem.order_id.in_(list(orders)))
+        .order_by(models.OrderItem.id)
+    )
+    for (
+        id, order_id, product_id, quantity, price,
+        product_name, product_description, product_price, category_id, category_name
+    ) in result.all():
+        orders[order_id]["order_items"].append({
+            "id": id, "order_id": order_id, "product_id": product_id, "quantity": quantity, "price": price,
+            "product": {
+                "id": product_id, "name": product_name, "description": product_description,
+                "price": product_price, "category_id": category_id,
+                "category": {"id": category_id, "name": category_name} if category_name is not None else None
+            } if product_name is not None else None
+        })
+    return list(orders.values())
+
+
 async def update_order(db: AsyncSession, order_id: int, order: schemas.OrderUpdate):
     """
     Update an order.
@@ -337,10 +502,16 @@ async def update_order(db: AsyncSession, order_id: int, order: schemas.OrderUpda
     """
     db_order = await get_order(db, order_id)
     if db_order:
-        for key, value in order.dict(exclude_unset=True).items():
+        changes = order.dict(exclude_unset=True)
+        old_spend = spend(db_order.status, db_order.total_amount)
+        new_spend = spend(changes.get("status", db_order.status), changes.get("total_amount", db_order.total_amount))
+        await record_change(db, db_order.user_id, spent=new_spend - old_spend)
+        for key, value in changes.items():
             setattr(db_order, key, value)
+        await db.flush()
+        await refresh_last_order(db, db_order.user_id)
         await db.commit()
-        await db.refresh(db_order)
+        db_order = await get_order(db, order_id)
     return db_order
 
 
@@ -357,7 +528,16 @@ async def delete_order(db: AsyncSession, order_id: int):
     """
     db_order = await get_order(db, order_id)
     if db_order:
+        quantity = (await db.execute(
+            select(func.coalesce(func.sum(models.OrderItem.quantity), 0))
+            .filter(models.OrderItem.order_id == order_id)
+        )).scalar()
+        await record_change(
+            db, db_order.user_id, orders=-1, spent=-spend(db_order.status, db_order.total_amount), items=-quantity
+        )
         await db.delete(db_order)
+        await db.flush()
+        await refresh_last_order(db, db_order.user_id)
         await db.commit()
         return True
     return False
@@ -376,16 +556,21 @@ async def create_order_item(db: AsyncSession, order_item: schemas.OrderItemCreat
         price=order_item.price
     )
     db.add(db_order_item)
+    user_id = await order_user_id(db, order_id)
+    if user_id is not None:
+        await record_change(db, user_id, items=order_item.quantity)
     await db.commit()
-    await db.refresh(db_order_item)
-    return db_order_item
+    # Reloaded with its product, which the response includes
+    return await get_order_item(db, order_id, db_order_item.id)
 
 
 async def get_order_items(db: AsyncSession, order_id: int):
     """Retrieve all items for a specific order."""
     result = await db.execute(
-        db.query(models.OrderItem)
+        select(models.OrderItem)
+        .options(selectinload(models.OrderItem.product).selectinload(models.Product.category))
         .filter(models.OrderItem.order_id == order_id)
+        .order_by(models.OrderItem.id)
     )
     return result.scalars().all()
 
@@ -403,7 +588,8 @@ async def get_order_item(db: AsyncSession, order_id: int, item_id: int):
         models.OrderItem: The order item object if found, else None.
     """
     result = await db.execute(
-        db.query(models.OrderItem)
+        select(models.OrderItem)
+        .options(selectinload(models.OrderItem.product).selectinload(models.Product.category))
         .filter(models.OrderItem.order_id == order_id)
         .filter(models.OrderItem.id == item_id)
     )
@@ -425,10 +611,14 @@ async def update_order_item(db: AsyncSession, order_id: int, item_id: int, item:
     """
     db_item = await get_order_item(db, order_id, item_id)
     if db_item:
+        old_quantity = db_item.quantity
         for key, value in item.dict(exclude_unset=True).items():
             setattr(db_item, key, value)
+        user_id = await order_user_id(db, order_id)
+        if user_id is not None and db_item.quantity != old_quantity:
+            await record_change(db, user_id, items=db_item.quantity - old_quantity)
         await db.commit()
-        await db.refresh(db_item)
+        db_item = await get_order_item(db, order_id, item_id)
     return db_item
 
 
@@ -447,6 +637,9 @@ async def delete_order_item(db: AsyncSession, order_id: int, item_id: int):
     db_item = await get_order_item(db, order_id, item_id)
     if db_item:
         await db.delete(db_item)
+        user_id = await order_user_id(db, order_id)
+        if user_id is not None:
+            await record_change(db, user_id, items=-db_item.quantity)
         await db.commit()
         return True
     return False
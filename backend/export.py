@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import enum
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import Boolean, DateTime, Enum, Float, Integer, func, select
+
+from database import SHARD, replica_engine
+from models import Base
+from replication import row_checksum
+
+# Configuration
+EXPORT_DIR = os.getenv("EXPORT_DIR", "data/export")
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "50000"))
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+
+EXPORT_TABLES = ["orders", "order_items", "products", "users"]
+# Never exported
+EXCLUDED_COLUMNS = {"users": {"hashed_password"}}
+
+
+def export_columns(table) -> list:
+    excluded = EXCLUDED_COLUMNS.get(table.name, ())
+    return [column for column in table.columns if column.name not in excluded]
+
+
+def arrow_schema(table):
+    """Map a table's exported columns to an Arrow schema."""
+    import pyarrow as pa
+
+    fields = []
+    for column in export_columns(table):
+        if isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, Enum):
+            arrow_type = pa.dictionary(pa.int8(), pa.string())
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=not column.primary_key))
+    return pa.schema(fields)
+
+
+def load_state(path: str) -> Dict:
+    """Load the high-water marks written by a previous run, if any."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: Dict):
+    """Atomically replace the state file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_chunk(path: str, schema, rows: List[dict], compression: str):
+    """Write one chunk as a Parquet file, replacing the previous version atomically."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), tmp_path, compression=compression)
+    os.replace(tmp_path, path)
+
+
+class ShardExporter:
+    """
+    Exports shard tables from the replica into a Parquet dataset.
+
+    Layout: <out>/<table>/shard=<shard>/chunk=<start>.parquet, one file per
+    fixed primary-key range of chunk_size ids. The state file keeps, per
+    table, the high-water id and the row count and checksum of every
+    exported range. Later runs compare those with a checksum computed on the
+    replica and rewrite only ranges that are new or changed, so the dataset
+    is always a full snapshot while a run reads only what moved.
+    """
+
+    def __init__(self, out_dir: str = EXPORT_DIR, chunk_size: int = EXPORT_CHUNK_SIZE, compression: str = EXPORT_COMPRESSION):
+        self.out_dir = out_dir
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.state_path = os.path.join(out_dir, "_state", f"shard={SHARD}.json")
+
+    def table_dir(self, table_name: str) -> str:
+        return os.path.join(self.out_dir, table_name, f"shard={SHARD}")
+
+    def chunk_path(self, table_name: str, start: int) -> str:
+        return os.path.join(self.table_dir(table_name), f"chunk={start:012d}.parquet")
+
+    async def export_table(self, table_name: str, state: Dict, full: bool = False) -> Dict[str, int]:
+        """
+        Export new and changed id ranges of one table.
+
+        Returns:
+            Counts of ranges written, removed and unchanged, and rows written
+        """
+        table = Base.metadata.tables[table_name]
+        table_state = state.setdefault(table_name, {"chunk_size": self.chunk_size, "high_water_id": 0, "chunks": {}})
+        if full or table_state["chunk_size"] != self.chunk_size:
+            # Files of the old ranges would otherwise stay in the dataset next to the new ones
+            await asyncio.to_thread(shutil.rmtree, self.table_dir(table_name), True)
+            table_state.update({"chunk_size": self.chunk_size, "high_water_id": 0, "chunks": {}})
+            await asyncio.to_thread(save_state, self.state_path, state)
+        chunks = table_state["chunks"]
+        schema = arrow_schema(table)
+        columns = export_columns(table)
+        stats = {"written": 0, "removed": 0, "unchanged": 0, "rows": 0}
+
+        async with replica_engine.connect() as conn:
+            max_id = (await conn.execute(select(func.max(table.c.id)))).scalar() or 0
+
+        starts = set(range(0, max_id + 1, self.chunk_size)) | {int(start) for start in chunks}
+        for start in sorted(starts):
+            in_range = (table.c.id >= start, table.c.id < start + self.chunk_size)
+            # One transaction per range: the checksum and the rows come from the same snapshot
+            async with replica_engine.connect() as conn:
+                count, checksum = (await conn.execute(
+                    select(func.count(), row_checksum(table)).where(*in_range)
+                )).one()
+                known = chunks.get(str(start))
+                if known == [int(count), int(checksum)]:
+                    stats["unchanged"] += 1
+                    continue
+                if count == 0:
+                    rows = None
+                else:
+                    result = await conn.stream(
+                        select(*columns).where(*in_range).order_by(table.c.id),
+                        execution_options={"yield_per": 5000}
+                    )
+                    rows = [
+                        {key: value.value if isinstance(value, enum.Enum) else value for key, value in row.items()}
+                        async for row in result.mappings()
+                    ]
+
+            path = self.chunk_path(table_name, start)
+            if rows is None:
+                if os.path.exists(path):
+                    await asyncio.to_thread(os.remove, path)
+                if chunks.pop(str(start), None) is not None:
+                    stats["removed"] += 1
+            else:
+                await asyncio.to_thread(write_chunk, path, schema, rows, self.compression)
+                chunks[str(start)] = [int(count), int(checksum)]
+                stats["written"] += 1
+                stats["rows"] += len(rows)
+            # Saved per range so an interrupted run resumes where it stopped
+            await asyncio.to_thread(save_state, self.state_path, state)
+        table_state["high_water_id"] = max_id
+        table_state["exported_at"] = time.time()
+        await asyncio.to_thread(save_state, self.state_path, state)
+        return stats
+
+    async def run(self, table_names: Optional[List[str]] = None, full: bool = False) -> Dict[str, Dict[str, int]]:
+        state = load_state(self.state_path)
+        return {
+            table_name: await self.export_table(table_name, state, full=full)
+            for table_name in (table_names or EXPORT_TABLES)
+        }
+
+
+async def main(args):
+    exporter = ShardExporter(args.out, args.chunk_size, args.compression)
+    try:
+        started = time.perf_counter()
+        results = await exporter.run(args.tables, full=args.full)
+        for table_name, stats in results.items():
+            print(
+                f"{table_name}: {stats['written']} ranges written ({stats['rows']} rows), "
+                f"{stats['removed']} removed, {stats['unchanged']} unchanged"
+            )
+        print(f"Exported shard {SHARD} in {time.perf_counter() - started:.1f}s")
+    finally:
+        await replica_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export this shard's tables from the replica to Parquet.")
+    parser.add_argument("--out", default=EXPORT_DIR)
+    parser.add_argument("--tables", nargs="+", choices=EXPORT_TABLES)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Primary-key ids per file")
+    parser.add_argument("--compression", default=EXPORT_COMPRESSION, help="Parquet codec: zstd, snappy, gzip or none")
+    parser.add_argument("--full", action="store_true", help="Ignore high-water marks and rewrite every range")
+    asyncio.run(main(parser.parse_args()))
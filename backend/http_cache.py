@@ -0,0 +1,83 @@
+import hashlib
+import os
+from typing import List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import upsert
+
+# Configuration
+# How long clients may reuse a catalog response before revalidating with the
+# ETag. Responses are private: only the router's micro-cache, which ignores
+# Cache-Control, shares them between users
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "1"))
+
+
+async def bump_version(db: AsyncSession, table_name: str):
+    """
+    Increment the version of a catalog table.
+
+    Runs in the caller's transaction, so the new version becomes visible
+    together with the write it describes.
+    """
+    await db.execute(upsert(
+        models.CatalogVersion,
+        {"table_name": table_name, "version": 1},
+        lambda inserted: {"version": models.CatalogVersion.version + 1}
+    ))
+
+
+async def catalog_etag(db: AsyncSession, table_names: List[str], *key) -> str:
+    """
+    Build a strong ETag from the versions of the tables a response reads.
+
+    Args:
+        db (AsyncSession): The database session.
+        table_names (List[str]): Tables the response is built from.
+        key: Values identifying the response, such as the path and paging.
+
+    Returns:
+        str: Quoted ETag value.
+    """
+    result = await db.execute(
+        select(models.CatalogVersion.table_name, models.CatalogVersion.version)
+        .filter(models.CatalogVersion.table_name.in_(table_names))
+    )
+    versions = dict(result.all())
+    parts = [f"{name}={versions.get(name, 0)}" for name in sorted(table_names)]
+    parts += [str(part) for part in key]
+    return '"' + hashlib.sha256("|".join(parts).encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match lists the ETag (weak comparison, as RFC 9110 requires)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+async def conditional_get(request: Request, response: Response, db: AsyncSession, table_names: List[str]) -> Optional[Response]:
+    """
+    Handle a conditional GET for a catalog endpoint.
+
+    Sets ETag and Cache-Control on the response. When the client already has
+    the current representation, returns a 304 that the endpoint should
+    return as is, skipping the query and serialization of the body.
+
+    Returns:
+        Optional[Response]: 304 response, or None if the body must be built.
+    """
+    etag = await catalog_etag(db, table_names, request.url.path, request.url.query)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={CATALOG_MAX_AGE}",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+
+import models
+from database import async_session
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", "65535"))
+# An in-flight claim older than this is treated as abandoned by a crashed worker
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = int(os.getenv("IDEMPOTENCY_IN_FLIGHT_TIMEOUT", "60"))
+IDEMPOTENCY_PURGE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "300"))
+
+# POST routes that honor the Idempotency-Key header
+IDEMPOTENT_ROUTES = [
+    re.compile(r"^/api/orders$"),
+    re.compile(r"^/api/orders/\d+/items$"),
+    re.compile(r"^/api/users$"),
+]
+
+IN_FLIGHT = "in_flight"
+
+
+@dataclass
+class StoredResponse:
+    """A completed response kept for replay."""
+    fingerprint: str
+    status_code: int
+    content_type: Optional[str]
+    # None when the response exceeded IDEMPOTENCY_MAX_BODY_BYTES
+    body: Optional[bytes]
+    expires_at: datetime
+
+
+class IdempotencyStore:
+    """
+    Stores responses in the idempotency_keys table with an LRU front cache.
+
+    The first request for a key inserts a claim row; concurrent retries see
+    the claim and get a 409 until the response is saved, after which retries
+    are replayed from the cache or with one primary-key lookup.
+    """
+
+    def __init__(self, session_factory=async_session, cache_size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.session_factory = session_factory
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def _remember(self, key_hash: str, stored: StoredResponse):
+        self._cache[key_hash] = stored
+        self._cache.move_to_end(key_hash)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def claim(self, key_hash: str, fingerprint: str) -> Union[None, str, StoredResponse]:
+        """
+        Claim a key for a new request.
+
+        Returns:
+            None if the caller should process the request, IN_FLIGHT if another
+            request holds the key, or the stored response to replay
+        """
+        now = datetime.utcnow()
+        stored = self._cache.get(key_hash)
+        if stored is not None and stored.expires_at > now:
+            self._cache.move_to_end(key_hash)
+            return stored
+
+        async with self.session_factory() as db:
+            db.add(models.IdempotencyRecord(
+                key_hash=key_hash,
+                fingerprint=fingerprint,
+                created_at=now,
+                expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+            ))
+            try:
+                await db.commit()
+                return None
+            except IntegrityError:
+                await db.rollback()
+
+            record = (await db.execute(
+                select(models.IdempotencyRecord).filter(models.IdempotencyRecord.key_hash == key_hash)
+            )).scalar_one_or_none()
+            if record is None:
+                return IN_FLIGHT
+            if record.expires_at <= now:
+                # Not purged yet, but expired keys are free to be claimed again
+                result = await db.execute(
+                    update(models.IdempotencyRecord)
+                    .where(
+                        models.IdempotencyRecord.key_hash == key_hash,
+                        models.IdempotencyRecord.expires_at <= now
+                    )
+                    .values(
+                        fingerprint=fingerprint,
+                        status_code=None,
+                        content_type=None,
+                        body=None,
+                        created_at=now,
+                        expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+                    )
+                )
+                await db.commit()
+                return None if result.rowcount else IN_FLIGHT
+            if record.status_code is not None:
+                stored = StoredResponse(
+                    fingerprint=record.fingerprint,
+                    status_code=record.status_code,
+                    content_type=record.content_type,
+                    body=record.body,
+                    expires_at=record.expires_at
+                )
+                self._remember(key_hash, stored)
+                return stored
+
+            # Take over a claim abandoned by a crashed request
+            stale_before = now - timedelta(seconds=IDEMPOTENCY_IN_FLIGHT_TIMEOUT)
+            result = await db.execute(
+                update(models.IdempotencyRecord)
+                .where(
+                    models.IdempotencyRecord.key_hash == key_hash,
+                    models.IdempotencyRecord.status_code.is_(None),
+                    models.IdempotencyRecord.created_at < stale_before
+                )
+                .values(fingerprint=fingerprint, created_at=now)
+            )
+            await db.commit()
+            return None if result.rowcount else IN_FLIGHT
+
+    async def save(self, key_hash: str, fingerprint: str, status_code: int, content_type: Optional[str], body: Optional[bytes]):
+        """Store the response of a claimed request; body is None if it was too large to keep."""
+        expires_at = datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        async with self.session_factory() as db:
+            await db.execute(
+                update(models.IdempotencyRecord)
+                .where(models.IdempotencyRecord.key_hash == key_hash)
+                .values(status_code=status_code, content_type=content_type, body=body, expires_at=expires_at)
+            )
+            await db.commit()
+        self._remember(key_hash, StoredResponse(fingerprint, status_code, content_type, body, expires_at))
+
+    async def release(self, key_hash: str):
+        """Drop a claim so the request can be retried."""
+        async with self.session_factory() as db:
+            await db.execute(
+                delete(models.IdempotencyRecord).where(models.IdempotencyRecord.key_hash == key_hash)
+            )
+            await db.commit()
+
+    async def purge_expired(self, batch_size: int = 1000) -> int:
+        """Delete expired keys in bounded batches."""
+        now = datetime.utcnow()
+        for key_hash in [key for key, stored in self._cache.items() if stored.expires_at <= now]:
+            del self._cache[key_hash]
+        purged = 0
+        while True:
+            async with self.session_factory() as db:
+                expired = (await db.execute(
+                    select(models.IdempotencyRecord.key_hash)
+                    .filter(models.IdempotencyRecord.expires_at < now)
+                    .limit(batch_size)
+                )).scalars().all()
+                if not expired:
+                    return purged
+                await db.execute(
+                    delete(models.IdempotencyRecord).where(models.IdempotencyRecord.key_hash.in_(expired))
+                )
+                await db.commit()
+                purged += len(expired)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_PURGE_SECONDS)
+            try:
+                await self.purge_expired()
+            except Exception:
+                logger.exception("Idempotency key purge failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+idempotency_store = IdempotencyStore()
+
+
+async def _send_json(send, status_code: int, content: dict):
+    body = json.dumps(content).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware replaying responses for retried POSTs.
+
+    Applies to IDEMPOTENT_ROUTES when an Idempotency-Key header is present.
+    Keys are scoped to the X-User-Id forwarded by the router. A retry with a
+    different body gets 422, and a retry while the first request is still
+    running gets 409. 5xx responses are not stored, so they can be retried.
+    A response larger than IDEMPOTENCY_MAX_BODY_BYTES is recorded without its
+    body, and retries of it get 409 rather than running the request again.
+    """
+
+    def __init__(self, app, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not any(route.match(scope["path"]) for route in IDEMPOTENT_ROUTES)
+        ):
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        key = headers.get("idempotency-key")
+        if not key:
+            return await self.app(scope, receive, send)
+
+        # Buffer the request body so it can be fingerprinted and replayed downstream
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+
+        key_hash = hashlib.sha256(f"{headers.get('x-user-id', '')}:{key}".encode()).hexdigest()
+        fingerprint = hashlib.sha256(
+            b"\n".join([scope["path"].encode(), scope.get("query_string", b""), body])
+        ).hexdigest()
+
+        outcome = await self.store.claim(key_hash, fingerprint)
+        if outcome == IN_FLIGHT:
+            return await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"})
+        if isinstance(outcome, StoredResponse):
+            if outcome.fingerprint != fingerprint:
+                return await _send_json(send, 422, {"detail": "Idempotency-Key reused with a different request"})
+            if outcome.body is None:
+                return await _send_json(send, 409, {
+                    "detail": "The request with this Idempotency-Key was already processed; "
+                              "its response is too large to replay"
+                })
+            response_headers = [(b"content-length", str(len(outcome.body)).encode()), (b"idempotent-replayed", b"true")]
+            if outcome.content_type:
+                response_headers.append((b"content-type", outcome.content_type.encode()))
+            await send({"type": "http.response.start", "status": outcome.status_code, "headers": response_headers})
+            await send({"type": "http.response.body", "body": outcome.body})
+            return
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": 500, "content_type": None, "body": [], "size": 0}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["content_type"] = Headers(raw=message.get("headers", [])).get("content-type")
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+                if response["size"] <= IDEMPOTENCY_MAX_BODY_BYTES:
+                    response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await self.store.release(key_hash)
+            raise
+
+        if response["status"] >= 500:
+            await self.store.release(key_hash)
+        else:
+            body = b"".join(response["body"]) if response["size"] <= IDEMPOTENCY_MAX_BODY_BYTES else None
+            await self.store.save(key_hash, fingerprint, response["status"], response["content_type"], body)
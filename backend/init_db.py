@@ -1,13 +1,11 @@
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine
-from database import MASTER_DB_URL
+from database import MASTER_DB_URL, engine
 from sqlalchemy.sql import text
 from models import Base
 
 async def init_db():
     """Initialize the database for this shard"""
     print(f"Initializing database with URL: {MASTER_DB_URL}")
-    engine = create_async_engine(MASTER_DB_URL, echo=True)
     
     async with engine.begin() as conn:
         # Test connection
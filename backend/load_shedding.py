@@ -0,0 +1,97 @@
+import json
+import os
+from typing import Optional
+
+from database import DB_MAX_OVERFLOW, DB_POOL_SIZE, pool_wait
+from metrics import Counter, register_collector
+
+# Configuration
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "true").lower() == "true"
+# Shedding starts when the average connection checkout wait passes this
+SHED_POOL_WAIT_MS = float(os.getenv("SHED_POOL_WAIT_MS", "100"))
+# While shedding, API requests beyond this many in flight are rejected. The
+# default admits as many as the pool has connections, so admitted requests
+# do not queue for one
+SHED_MAX_IN_FLIGHT = int(os.getenv("SHED_MAX_IN_FLIGHT", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+# Cap on in-flight API requests per worker at any time
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "256"))
+SHED_RETRY_AFTER_SECONDS = int(os.getenv("SHED_RETRY_AFTER_SECONDS", "1"))
+
+requests_shed = Counter("backend_requests_shed_total", "API requests rejected with 503 by reason")
+
+
+class LoadShedder:
+    """
+    Per-worker admission control for API requests.
+
+    Requests are counted while in flight. Normally up to MAX_IN_FLIGHT are
+    admitted; once the database pool is congested, as measured by the
+    average checkout wait, the limit drops to SHED_MAX_IN_FLIGHT and the
+    excess gets a fast 503 instead of queueing for a connection and timing
+    out. Admitted requests keep sampling the pool wait, so the limit lifts
+    as soon as the backlog drains.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+
+    def shedding(self) -> bool:
+        return pool_wait.value() * 1000 > SHED_POOL_WAIT_MS
+
+    def admit(self) -> Optional[str]:
+        """
+        Count a request in if there is room.
+
+        Returns:
+            None if admitted, otherwise the reason for rejecting it
+        """
+        if self.in_flight >= MAX_IN_FLIGHT:
+            return "max_in_flight"
+        if self.in_flight >= SHED_MAX_IN_FLIGHT and self.shedding():
+            return "pool_wait"
+        self.in_flight += 1
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+
+
+load_shedder = LoadShedder()
+
+
+@register_collector
+def _load_shedding_samples():
+    yield "backend_in_flight_requests", {}, load_shedder.in_flight
+    yield "backend_pool_wait_seconds", {}, pool_wait.value()
+    yield "backend_load_shedding", {}, 1 if load_shedder.shedding() else 0
+
+
+class LoadSheddingMiddleware:
+    """ASGI middleware applying load_shedder to /api routes."""
+
+    def __init__(self, app, shedder: LoadShedder = load_shedder):
+        self.app = app
+        self.shedder = shedder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not LOAD_SHEDDING_ENABLED or not scope["path"].startswith("/api/"):
+            return await self.app(scope, receive, send)
+        reason = self.shedder.admit()
+        if reason is None:
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                self.shedder.release()
+
+        requests_shed.inc(reason=reason)
+        body = json.dumps({"detail": "Service overloaded, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(SHED_RETRY_AFTER_SECONDS).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
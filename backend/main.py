@@ -1,9 +1,42 @@
 import os
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from api import router
+from database import async_session, engine, replica_engine, warm_pool, pool_monitor, pool_status, db_health
+from search import search_index
+from replication import replication_monitor
+from metrics import render_latest
+from order_queue import order_queue_worker, ORDER_INGEST_MODE
+from idempotency import IdempotencyMiddleware, idempotency_store
+from compression import CompressionMiddleware
+from rate_limit import RateLimitMiddleware
+from load_shedding import LoadSheddingMiddleware, load_shedder
+from authorization import authorize
+from query_profile import QueryProfileMiddleware, instrument
 import uvicorn
 
-app = FastAPI(title=f"FastAPI Shard {os.getenv('SHARD', 'unknown').upper()}")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the pool and build in-memory indexes on startup; stop background tasks on shutdown."""
+    await warm_pool()
+    pool_monitor.start()
+    await search_index.start(async_session)
+    replication_monitor.start()
+    if ORDER_INGEST_MODE == "async":
+        order_queue_worker.start()
+    idempotency_store.start()
+    yield
+    await idempotency_store.stop()
+    await order_queue_worker.stop()
+    await replication_monitor.stop()
+    await search_index.stop()
+    await pool_monitor.stop()
+
+app = FastAPI(
+    title=f"FastAPI Shard {os.getenv('SHARD', 'unknown').upper()}",
+    lifespan=lifespan
+)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -13,11 +46,52 @@ async def log_requests(request: Request, call_next):
     response = await call_next(request)
     return response
 
-app.include_router(router, prefix="/api")
+# Registered after log_requests so it runs outermost and replays skip the routers
+app.add_middleware(IdempotencyMiddleware)
+# Outside idempotency, so throttled requests never claim a key or touch the database
+app.add_middleware(RateLimitMiddleware)
+# Outside rate limiting, so an overloaded worker rejects before doing any other work
+app.add_middleware(LoadSheddingMiddleware)
+# Outside idempotency, so stored idempotent responses are kept uncompressed
+app.add_middleware(CompressionMiddleware)
+# Outermost, so the statements of every layer count towards the request
+app.add_middleware(QueryProfileMiddleware)
+instrument(engine, replica_engine)
+
+# Every API route is checked against the route-to-scope table
+app.include_router(router, prefix="/api", dependencies=[Depends(authorize)])
 
 @app.get("/")
 async def root():
     return {"message": "Backend API is running"}
 
+@app.get("/health")
+async def health(response: Response):
+    """Health check for the router and the container: 503 when the master cannot be reached in time."""
+    db = await db_health()
+    if not db["ok"]:
+        response.status_code = 503
+    return {
+        "status": "ok" if db["ok"] else "unavailable",
+        "db": db,
+        "shedding": load_shedder.shedding(),
+        "in_flight": load_shedder.in_flight,
+    }
+
+@app.get("/health/db")
+async def health_db():
+    return pool_status()
+
+@app.get("/health/replication")
+async def health_replication():
+    return {
+        **replication_monitor.latest,
+        "replica_fresh": replication_monitor.replica_is_fresh()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return render_latest()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,92 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Minimal in-process metrics registry rendered in the Prometheus text format.
+# Each worker process keeps its own values; scrape every worker or aggregate
+# downstream.
+
+Sample = Tuple[str, Dict[str, str], float]
+
+_metrics: List["Metric"] = []
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return "{" + body + "}"
+
+
+class Metric:
+    """Base class for a named metric with optional labels."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        _metrics.append(self)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, value in self._values.items():
+            yield self.name, dict(key), value
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        self._values[tuple(sorted(labels.items()))] = value
+
+
+class Summary(Metric):
+    """Tracks count, sum and max of observed values."""
+    kind = "summary"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._max: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._count: Dict[Tuple[Tuple[str, str], ...], int] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0.0) + value
+        self._count[key] = self._count.get(key, 0) + 1
+        self._max[key] = max(self._max.get(key, 0.0), value)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, total in self._values.items():
+            labels = dict(key)
+            yield f"{self.name}_count", labels, self._count[key]
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_max", labels, self._max[key]
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]):
+    """Register a callable that yields samples computed at scrape time."""
+    _collectors.append(collector)
+    return collector
+
+
+def render_latest() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    for collector in _collectors:
+        for name, labels, value in collector():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
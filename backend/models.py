@@ -7,6 +7,7 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     Enum,
+    LargeBinary,
 )
 from sqlalchemy.orm import relationship
 from database import Base
@@ -30,6 +31,8 @@ class Order(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     total_amount = Column(Float)
     status = Column(Enum(OrderStatus), default=OrderStatus.PENDING)
+    # Reference of the queued request this order was drained from, if any
+    ingest_ref = Column(String(32), unique=True, nullable=True)
 
     user = relationship("User", back_populates="orders")
     order_items = relationship("OrderItem", back_populates="order")
@@ -85,3 +88,43 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
 
     orders = relationship("Order", back_populates="user")
+
+
+class IdempotencyRecord(Base):
+    """Model storing the response to a request made with an Idempotency-Key."""
+    __tablename__ = "idempotency_keys"
+
+    # SHA-256 of the user id and the client's key
+    key_hash = Column(String(64), primary_key=True)
+    # SHA-256 of the path, query string and body of the first request
+    fingerprint = Column(String(64), nullable=False)
+    # NULL while the first request is still in flight
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String(100), nullable=True)
+    # NULL with a status code set when the response was too large to keep
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class CatalogVersion(Base):
+    """Model holding a version counter per catalog table, bumped on every write."""
+    __tablename__ = "catalog_versions"
+
+    table_name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class UserOrderStats(Base):
+    """Model holding per-user order aggregates, maintained with every order write."""
+    __tablename__ = "user_order_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    # Sum of total_amount over orders that are not cancelled
+    total_spent = Column(Float, nullable=False, default=0.0)
+    # Sum of item quantities over all orders
+    item_count = Column(Integer, nullable=False, default=0)
+    last_order_id = Column(Integer, nullable=True)
+    last_order_status = Column(Enum(OrderStatus), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import List, Optional
+
+from sqlalchemy import insert, select
+
+import models
+from database import async_session
+from metrics import Counter, register_collector
+from order_stats import record_change, refresh_last_order, spend
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ORDER_INGEST_MODE = os.getenv("ORDER_INGEST_MODE", "sync")  # "sync" or "async"
+ORDER_QUEUE_PATH = os.getenv("ORDER_QUEUE_PATH", "data/order_queue.db")
+ORDER_QUEUE_BATCH_SIZE = int(os.getenv("ORDER_QUEUE_BATCH_SIZE", "200"))
+ORDER_QUEUE_POLL_SECONDS = float(os.getenv("ORDER_QUEUE_POLL_SECONDS", "0.2"))
+# Claims older than this are assumed to belong to a crashed worker
+ORDER_QUEUE_CLAIM_TIMEOUT = float(os.getenv("ORDER_QUEUE_CLAIM_TIMEOUT", "60"))
+ORDER_QUEUE_RETENTION_SECONDS = float(os.getenv("ORDER_QUEUE_RETENTION_SECONDS", "86400"))
+
+orders_drained = Counter("order_queue_drained_total", "Queued orders written to MySQL by outcome")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_queue (
+    ref TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    idempotency_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    order_id INTEGER,
+    error TEXT,
+    claimed_by TEXT,
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_order_queue_idempotency
+    ON order_queue (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_order_queue_status ON order_queue (status, enqueued_at);
+"""
+
+
+class OrderQueue:
+    """
+    Durable local queue of validated orders waiting for the shard master.
+
+    Backed by a SQLite file in WAL mode with synchronous=FULL, so an order is
+    on disk before the client gets its 202. Every gunicorn worker shares the
+    file; workers claim batches in an immediate transaction, so a batch is
+    drained by exactly one of them. Each queued order carries a reference that
+    is stored in orders.ingest_ref, which makes redraining a batch after a
+    crash a no-op.
+    """
+
+    def __init__(self, path: str = ORDER_QUEUE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # The connection is shared by the threads asyncio.to_thread runs on
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _enqueue(self, user_id: int, payload: dict, idempotency_key: Optional[str]) -> dict:
+        conn = self._connection()
+        now = time.time()
+        ref = uuid.uuid4().hex
+        try:
+            conn.execute(
+                "INSERT INTO order_queue (ref, user_id, idempotency_key, payload, enqueued_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (ref, user_id, idempotency_key, json.dumps(payload), now, now)
+            )
+        except sqlite3.IntegrityError:
+            # Retry of a request already queued under this idempotency key
+            row = conn.execute(
+                "SELECT * FROM order_queue WHERE user_id = ? AND idempotency_key = ?",
+                (user_id, idempotency_key)
+            ).fetchone()
+            if json.loads(row["payload"]) != payload:
+                return None
+            return dict(row)
+        return {"ref": ref, "status": "queued", "order_id": None, "error": None}
+
+    def _get(self, ref: str, user_id: int) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT * FROM order_queue WHERE ref = ? AND user_id = ?", (ref, user_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def _claim(self, limit: int) -> List[dict]:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM order_queue WHERE status = 'queued' "
+                "OR (status = 'processing' AND updated_at < ?) "
+                "ORDER BY enqueued_at LIMIT ?",
+                (now - ORDER_QUEUE_CLAIM_TIMEOUT, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE order_queue SET status = 'processing', claimed_by = ?, updated_at = ? WHERE ref = ?",
+                [(str(os.getpid()), now, row["ref"]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [dict(row) for row in rows]
+
+    def _complete(self, done: dict, failed: dict):
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE order_queue SET status = 'done', order_id = ?, updated_at = ? WHERE ref = ?",
+            [(order_id, now, ref) for ref, order_id in done.items()]
+        )
+        conn.executemany(
+            "UPDATE order_queue SET status = 'failed', error = ?, updated_at = ? WHERE ref = ?",
+            [(error[:500], now, ref) for ref, error in failed.items()]
+        )
+        conn.execute("COMMIT")
+
+    def _release(self, refs: List[str]):
+        self._connection().executemany(
+            "UPDATE order_queue SET status = 'queued', claimed_by = NULL WHERE ref = ?",
+            [(ref,) for ref in refs]
+        )
+
+    def _purge(self, older_than: float) -> int:
+        return self._connection().execute(
+            "DELETE FROM order_queue WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (older_than,)
+        ).rowcount
+
+    def _depth(self) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM order_queue WHERE status IN ('queued', 'processing')"
+        ).fetchone()[0]
+
+    def _call(self, method, *args):
+        with self._lock:
+            return method(*args)
+
+    async def _run(self, method, *args):
+        return await asyncio.to_thread(self._call, method, *args)
+
+    def depth(self) -> int:
+        """Number of entries not yet written to MySQL."""
+        return self._call(self._depth)
+
+    async def enqueue(self, user_id: int, payload: dict, idempotency_key: Optional[str] = None) -> dict:
+        """
+        Durably queue an order.
+
+        Returns:
+            Queue entry; an existing entry if the idempotency key was seen before,
+            or None if that entry was queued with a different payload
+        """
+        return await self._run(self._enqueue, user_id, payload, idempotency_key)
+
+    async def get(self, ref: str, user_id: int) -> Optional[dict]:
+        """Get a queue entry owned by user_id."""
+        return await self._run(self._get, ref, user_id)
+
+    async def drain_batch(self, limit: int = ORDER_QUEUE_BATCH_SIZE) -> int:
+        """
+        Write one batch of queued orders to MySQL in a single transaction.
+
+        Returns:
+            Number of entries processed
+        """
+        entries = await self._run(self._claim, limit)
+        if not entries:
+            return 0
+
+        refs = [entry["ref"] for entry in entries]
+        rows = []
+        for entry in entries:
+            payload = json.loads(entry["payload"])
+            rows.append({
+                "user_id": entry["user_id"],
+                "total_amount": payload["total_amount"],
+                "status": models.OrderStatus(payload["status"]),
+                "ingest_ref": entry["ref"],
+            })
+        try:
+            async with async_session() as db:
+                written = set((await db.execute(
+                    select(models.Order.ingest_ref).filter(models.Order.ingest_ref.in_(refs))
+                )).scalars())
+                changes = defaultdict(lambda: [0, 0.0])
+                for row in rows:
+                    if row["ingest_ref"] not in written:
+                        changes[row["user_id"]][0] += 1
+                        changes[row["user_id"]][1] += spend(row["status"], row["total_amount"])
+                # Stats rows first, in user id order, so concurrent writers
+                # lock them consistently and before touching the users' orders
+                for user_id in sorted(changes):
+                    orders, spent = changes[user_id]
+                    await record_change(db, user_id, orders=orders, spent=spent)
+                # IGNORE skips orders already written by an earlier, interrupted drain
+                await db.execute(
+                    insert(models.Order)
+                    .prefix_with("IGNORE", dialect="mysql")
+                    .prefix_with("OR IGNORE", dialect="sqlite")
+                    .values(rows)
+                )
+                for user_id in sorted(changes):
+                    await refresh_last_order(db, user_id)
+                await db.commit()
+                result = await db.execute(
+                    select(models.Order.ingest_ref, models.Order.id)
+                    .filter(models.Order.ingest_ref.in_(refs))
+                )
+                order_ids = dict(result.all())
+        except Exception:
+            await self._run(self._release, refs)
+            raise
+
+        failed = {ref: "Order was not written" for ref in refs if ref not in order_ids}
+        await self._run(self._complete, order_ids, failed)
+        orders_drained.inc(len(order_ids), outcome="done")
+        if failed:
+            orders_drained.inc(len(failed), outcome="failed")
+        return len(entries)
+
+    async def purge(self, retention: float = ORDER_QUEUE_RETENTION_SECONDS) -> int:
+        """Delete finished entries older than retention seconds."""
+        return await self._run(self._purge, time.time() - retention)
+
+
+class OrderQueueWorker:
+    """Background task that drains the order queue into the shard master."""
+
+    def __init__(self, queue: "OrderQueue", batch_size: int = ORDER_QUEUE_BATCH_SIZE, poll_interval: float = ORDER_QUEUE_POLL_SECONDS):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        last_purge = time.monotonic()
+        while True:
+            try:
+                drained = await self.queue.drain_batch(self.batch_size)
+            except Exception:
+                logger.exception("Order queue drain failed")
+                drained = 0
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                await self.queue.purge()
+            # Keep draining without sleeping while batches come back full
+            if drained < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+order_queue = OrderQueue()
+order_queue_worker = OrderQueueWorker(order_queue)
+
+
+@register_collector
+def _queue_samples():
+    if ORDER_INGEST_MODE == "async":
+        yield "order_queue_depth", {}, order_queue.depth()
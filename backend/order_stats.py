@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+from datetime import datetime
+from typing import Optional, Union
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import async_session, engine, upsert
+
+REBUILD_CHUNK_SIZE = 1000
+
+
+def as_status(status: Union[str, models.OrderStatus, None]) -> Optional[models.OrderStatus]:
+    """Normalize an order status given as an enum, a value or a name."""
+    if status is None or isinstance(status, models.OrderStatus):
+        return status
+    try:
+        return models.OrderStatus(status)
+    except ValueError:
+        return models.OrderStatus[status]
+
+
+def spend(status, total_amount: Optional[float]) -> float:
+    """What an order contributes to total_spent; cancelled orders contribute nothing."""
+    if as_status(status) == models.OrderStatus.CANCELLED:
+        return 0.0
+    return total_amount or 0.0
+
+
+async def record_change(
+    db: AsyncSession,
+    user_id: int,
+    orders: int = 0,
+    spent: float = 0.0,
+    items: int = 0
+):
+    """
+    Apply a change to a user's order stats in the caller's transaction.
+
+    Call it before writing the user's orders: the upsert locks the user's
+    stats row until the caller commits, so concurrent order writes for the
+    same user serialize on it, and the stats commit or roll back together
+    with the order write. A writer that changed which order is the user's
+    latest calls refresh_last_order after its order write.
+
+    Args:
+        db (AsyncSession): The database session.
+        user_id (int): The user whose orders change.
+        orders (int, optional): Change in order count.
+        spent (float, optional): Change in total spent.
+        items (int, optional): Change in item quantity.
+    """
+    values = {
+        "user_id": user_id,
+        "order_count": orders,
+        "total_spent": spent,
+        "item_count": items,
+        "updated_at": datetime.utcnow(),
+    }
+    stats = models.UserOrderStats
+    await db.execute(upsert(stats, values, lambda inserted: {
+        "order_count": stats.order_count + orders,
+        "total_spent": stats.total_spent + spent,
+        "item_count": stats.item_count + items,
+        "updated_at": inserted.updated_at,
+    }))
+
+
+async def refresh_last_order(db: AsyncSession, user_id: int):
+    """
+    Re-read the user's latest order into their stats, after an order was
+    created, deleted or changed status.
+
+    Runs after record_change, with the stats row locked. The read is a
+    locking read, so it sees the newest committed orders rather than the
+    transaction's snapshot: every other writer for the user either committed
+    before the lock was granted or is still waiting for it.
+    """
+    # Newest order by id; an index range read on orders.user_id
+    last = (await db.execute(
+        select(models.Order.id, models.Order.status)
+        .filter(models.Order.user_id == user_id)
+        .order_by(models.Order.id.desc())
+        .limit(1)
+        .with_for_update(read=True)
+    )).first()
+    await db.execute(
+        update(models.UserOrderStats)
+        .where(models.UserOrderStats.user_id == user_id)
+        .values(last_order_id=last.id if last else None, last_order_status=last.status if last else None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def order_user_id(db: AsyncSession, order_id: int) -> Optional[int]:
+    """Get the user that owns an order."""
+    result = await db.execute(select(models.Order.user_id).filter(models.Order.id == order_id))
+    return result.scalar_one_or_none()
+
+
+async def get_summary(db: AsyncSession, user_id: int) -> dict:
+    """
+    Get a user's order summary from a single primary-key read.
+
+    Returns:
+        dict: Stats shaped like schemas.UserOrderSummary; zeros if the user has no orders.
+    """
+    stats = await db.get(models.UserOrderStats, user_id)
+    if stats is None:
+        return {"user_id": user_id, "order_count": 0, "total_spent": 0.0, "item_count": 0}
+    return {
+        "user_id": user_id,
+        "order_count": stats.order_count,
+        "total_spent": stats.total_spent,
+        "item_count": stats.item_count,
+        "last_order_id": stats.last_order_id,
+        "last_order_status": stats.last_order_status,
+        "updated_at": stats.updated_at,
+    }
+
+
+async def rebuild_range(db: AsyncSession, start: int, end: int) -> int:
+    """
+    Recompute the stats of users with ids in [start, end) from the orders tables.
+
+    Deleting the range first takes the locks that record_change needs, so
+    order writes for these users wait until the rebuilt rows are committed;
+    the aggregates then read every write committed before the delete.
+
+    Returns:
+        int: Number of users with orders in the range.
+    """
+    await db.execute(
+        delete(models.UserOrderStats)
+        .where(models.UserOrderStats.user_id >= start, models.UserOrderStats.user_id < end)
+    )
+    in_range = (models.Order.user_id >= start, models.Order.user_id < end)
+    orders = (await db.execute(
+        select(
+            models.Order.user_id,
+            func.count(models.Order.id),
+            func.coalesce(func.sum(case(
+                (models.Order.status == models.OrderStatus.CANCELLED, 0.0),
+                else_=models.Order.total_amount
+            )), 0.0),
+            func.max(models.Order.id)
+        )
+        .filter(*in_range)
+        .group_by(models.Order.user_id)
+    )).all()
+    if not orders:
+        return 0
+
+    items = dict((await db.execute(
+        select(models.Order.user_id, func.sum(models.OrderItem.quantity))
+        .join(models.OrderItem, models.OrderItem.order_id == models.Order.id)
+        .filter(*in_range)
+        .group_by(models.Order.user_id)
+    )).all())
+    last_ids = [last_order_id for _, _, _, last_order_id in orders]
+    statuses = dict((await db.execute(
+        select(models.Order.id, models.Order.status).filter(models.Order.id.in_(last_ids))
+    )).all())
+
+    now = datetime.utcnow()
+    db.add_all([
+        models.UserOrderStats(
+            user_id=user_id,
+            order_count=order_count,
+            total_spent=total_spent,
+            item_count=int(items.get(user_id) or 0),
+            last_order_id=last_order_id,
+            last_order_status=statuses.get(last_order_id),
+            updated_at=now
+        )
+        for user_id, order_count, total_spent, last_order_id in orders
+    ])
+    await db.flush()
+    return len(orders)
+
+
+async def rebuild(chunk_size: int = REBUILD_CHUNK_SIZE) -> int:
+    """
+    Backfill user_order_stats for every user, one committed id range at a time.
+
+    Returns:
+        int: Number of users with orders.
+    """
+    async with async_session() as db:
+        max_user_id = (await db.execute(select(func.max(models.Order.user_id)))).scalar() or 0
+        max_stats_id = (await db.execute(select(func.max(models.UserOrderStats.user_id)))).scalar() or 0
+        await db.commit()
+
+    total = 0
+    for start in range(0, max(max_user_id, max_stats_id) + 1, chunk_size):
+        async with async_session() as db:
+            total += await rebuild_range(db, start, start + chunk_size)
+            await db.commit()
+    return total
+
+
+async def main(chunk_size: int):
+    try:
+        users = await rebuild(chunk_size)
+        print(f"Rebuilt order stats for {users} users")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild user_order_stats on this shard from the orders tables.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--chunk-size", type=int, default=REBUILD_CHUNK_SIZE, help="User ids per transaction")
+    args = parser.parse_args()
+    asyncio.run(main(args.chunk_size))
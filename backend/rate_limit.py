@@ -0,0 +1,268 @@
+import heapq
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Pattern, Tuple
+
+from starlette.datastructures import Headers
+
+from metrics import Counter, register_collector
+
+# Configuration
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# With "memory" every worker process keeps its own buckets; "redis" shares
+# them between the workers of a shard but needs the redis package and server
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" or "redis"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Worker processes sharing the budgets below with the memory backend; set by
+# gunicorn.conf.py. Each worker enforces its share of every rate and burst,
+# so the shard as a whole allows about the configured budget
+RATE_LIMIT_WORKERS = max(1, int(os.getenv("RATE_LIMIT_WORKERS", "1")))
+# Users whose consumption is exported on /metrics, by request count
+RATE_LIMIT_EXPORT_TOP_USERS = int(os.getenv("RATE_LIMIT_EXPORT_TOP_USERS", "20"))
+
+# Token bucket parameters: sustained rate in requests per second and burst size.
+# Every user has the USER budget across all API routes, and the route
+# budgets below on top of it.
+USER_RATE = float(os.getenv("USER_RATE", "20"))
+USER_BURST = int(os.getenv("USER_BURST", "60"))
+ORDER_WRITE_RATE = float(os.getenv("ORDER_WRITE_RATE", "2"))
+ORDER_WRITE_BURST = int(os.getenv("ORDER_WRITE_BURST", "10"))
+SEARCH_RATE = float(os.getenv("SEARCH_RATE", "5"))
+SEARCH_BURST = int(os.getenv("SEARCH_BURST", "20"))
+
+
+@dataclass
+class RouteLimit:
+    """A per-user budget for the requests matching method and path."""
+    name: str
+    method: str
+    path: Pattern
+    rate: float
+    burst: int
+
+
+ROUTE_LIMITS = [
+    RouteLimit("order_write", "POST", re.compile(r"^/api/orders(/\d+/items)?$"), ORDER_WRITE_RATE, ORDER_WRITE_BURST),
+    RouteLimit("search", "GET", re.compile(r"^/api/products/search$"), SEARCH_RATE, SEARCH_BURST),
+]
+
+rate_limit_decisions = Counter(
+    "backend_rate_limit_decisions_total",
+    "Per-user rate limiter decisions by bucket and outcome"
+)
+
+
+class MemoryRateLimitStore:
+    """
+    In-process token bucket store.
+
+    Kept identical in the auth service and the shards, which are built from
+    their own directories and share no code. Buckets live in an LRU-ordered dict.
+    Buckets that have refilled completely carry no state and are dropped on
+    access, and the least recently used buckets are evicted once max_keys is
+    reached, so memory stays bounded under a spray of distinct keys.
+
+    Requests are spread over the workers, so with workers > 1 each bucket
+    holds 1/workers of the rate and burst it is taken with.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, workers: int = RATE_LIMIT_WORKERS):
+        self.max_keys = max_keys
+        self.workers = workers
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Take tokens from a bucket.
+
+        Args:
+            key: Bucket key
+            rate: Refill rate in tokens per second
+            burst: Bucket capacity
+            cost: Number of tokens to take
+
+        Returns:
+            Tuple of (allowed, seconds until enough tokens are available)
+        """
+        rate, burst = rate / self.workers, max(cost, burst / self.workers)
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+
+        if tokens >= cost:
+            tokens -= cost
+            allowed, retry_after = True, 0.0
+        else:
+            allowed, retry_after = False, (cost - tokens) / rate
+
+        if tokens < burst:
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+# Atomic token bucket update executed server-side so every worker shares
+# the same bucket. KEYS[1] = bucket key, ARGV = rate, burst, now, cost.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisRateLimitStore:
+    """
+    Shared token bucket store backed by Redis.
+
+    Any client implementing the redis-py asyncio ``eval`` API can be passed in,
+    which lets a local fake (e.g. fakeredis) stand in for a real server.
+    """
+
+    def __init__(self, client, prefix: str = f"ratelimit:{os.getenv('SHARD', 'unknown')}:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, retry_after = await self.client.eval(
+            _TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, burst, time.time(), cost
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    def size(self) -> int:
+        return -1
+
+
+def create_store():
+    """Create the rate limit store selected by RATE_LIMIT_BACKEND."""
+    if RATE_LIMIT_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "RATE_LIMIT_BACKEND=redis requires the 'redis' package"
+            ) from exc
+        return RedisRateLimitStore(redis.from_url(RATE_LIMIT_REDIS_URL))
+    return MemoryRateLimitStore()
+
+
+class UserUsage:
+    """
+    Request and rejection counts per user since startup.
+
+    Bounded like the memory store: the least recently active users are
+    dropped once max_keys is reached. Only the heaviest users are exported,
+    which keeps the number of metric series fixed.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._counts: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def record(self, key: str, rejected: bool):
+        counts = self._counts.pop(key, None) or [0, 0]
+        counts[0] += 1
+        if rejected:
+            counts[1] += 1
+        self._counts[key] = counts
+        if len(self._counts) > self.max_keys:
+            self._counts.popitem(last=False)
+
+    def top(self, count: int) -> List[Tuple[str, List[int]]]:
+        """The count keys with the most requests."""
+        return heapq.nlargest(count, self._counts.items(), key=lambda item: item[1][0])
+
+
+store = create_store()
+usage = UserUsage()
+
+
+@register_collector
+def _rate_limit_samples():
+    # Only the memory store knows how many buckets it holds
+    if store.size() >= 0:
+        yield "backend_rate_limit_tracked_keys", {"backend": RATE_LIMIT_BACKEND}, store.size()
+    for key, (requests, rejected) in usage.top(RATE_LIMIT_EXPORT_TOP_USERS):
+        yield "backend_user_requests_total", {"user": key}, requests
+        yield "backend_user_rejected_total", {"user": key}, rejected
+
+
+def client_key(headers: Headers, scope) -> str:
+    """Key requests by the user the router authenticated, or by address without one."""
+    user_id = headers.get("x-user-id")
+    if user_id:
+        return f"user:{user_id}"
+    client = scope.get("client")
+    return f"ip:{headers.get('x-real-ip') or (client[0] if client else 'unknown')}"
+
+
+async def _check(bucket: str, key: str, rate: float, burst: int) -> Optional[float]:
+    allowed, retry_after = await store.take(f"{bucket}:{key}", rate, burst)
+    rate_limit_decisions.inc(bucket=bucket, outcome="allowed" if allowed else "rejected")
+    return None if allowed else retry_after
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying per-user token buckets to /api routes.
+
+    Runs after the router's authentication, so requests are keyed by the
+    X-User-Id it forwards. A request takes a token from the user's overall
+    bucket and from the bucket of the first ROUTE_LIMITS entry it matches;
+    when either is empty it gets a 429 with Retry-After before reaching the
+    routers or the database.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED or not scope["path"].startswith("/api/"):
+            return await self.app(scope, receive, send)
+        key = client_key(Headers(scope=scope), scope)
+
+        retry_after = await _check("user", key, USER_RATE, USER_BURST)
+        if retry_after is None:
+            for limit in ROUTE_LIMITS:
+                if limit.method == scope["method"] and limit.path.match(scope["path"]):
+                    retry_after = await _check(limit.name, key, limit.rate, limit.burst)
+                    break
+        usage.record(key, rejected=retry_after is not None)
+        if retry_after is None:
+            return await self.app(scope, receive, send)
+
+        body = json.dumps({"detail": "Rate limit exceeded"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import CHAR, cast, func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database import SHARD, DB_USER, DB_PASSWORD, engine, replica_engine
+from models import Base
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MASTER_HOST = os.getenv("DB_HOST", f"mysql-master-{SHARD}")
+REPLICATION_SAMPLE_SECONDS = float(os.getenv("REPLICATION_SAMPLE_SECONDS", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_MAX_GTID_GAP = int(os.getenv("REPLICA_MAX_GTID_GAP", "100"))
+CHECKSUM_CHUNK_SIZE = int(os.getenv("CHECKSUM_CHUNK_SIZE", "10000"))
+
+replica_lag_seconds = Gauge("replica_lag_seconds", "Seconds_Behind_Source reported by the replica")
+replica_gtid_gap = Gauge("replica_gtid_gap", "Transactions executed on the master but not yet on the replica")
+replica_running = Gauge("replica_running", "1 if both replica IO and SQL threads are running")
+
+
+def gtid_count(gtid_set: str) -> int:
+    """
+    Count transactions in a GTID set such as "uuid:1-5:7,uuid2:1-3".
+
+    Returns:
+        Number of transactions in the set
+    """
+    total = 0
+    for member in gtid_set.replace("\n", "").split(","):
+        member = member.strip()
+        if not member:
+            continue
+        for interval in member.split(":")[1:]:
+            if "-" in interval:
+                start, end = interval.split("-")
+                total += int(end) - int(start) + 1
+            elif interval.isdigit():
+                total += 1
+    return total
+
+
+async def replica_status(conn) -> Optional[dict]:
+    """Return SHOW REPLICA STATUS as a dict, or None if replication is not configured."""
+    row = (await conn.execute(text("SHOW REPLICA STATUS"))).mappings().first()
+    return dict(row) if row else None
+
+
+async def configure_replica(force: bool = False):
+    """
+    Point the shard replica at its master using GTID auto-positioning.
+
+    With auto-positioning the replica asks the master for every transaction
+    missing from its own gtid_executed, so no binlog file or position has to
+    be scraped from SHOW MASTER STATUS. Leaves a replica that is already
+    auto-positioned and running untouched unless force is set.
+    """
+    async with replica_engine.connect() as conn:
+        status = await replica_status(conn)
+        if (
+            not force and status
+            and status.get("Auto_Position") == 1
+            and status.get("Replica_IO_Running") == "Yes"
+            and status.get("Replica_SQL_Running") == "Yes"
+        ):
+            return
+        await conn.execute(text("STOP REPLICA"))
+        await conn.execute(text(
+            "CHANGE REPLICATION SOURCE TO "
+            "SOURCE_HOST = :host, SOURCE_USER = :user, SOURCE_PASSWORD = :password, "
+            "SOURCE_AUTO_POSITION = 1, GET_SOURCE_PUBLIC_KEY = 1"
+        ), {"host": MASTER_HOST, "user": DB_USER, "password": DB_PASSWORD})
+        await conn.execute(text("START REPLICA"))
+    logger.info("Replica mysql-replica-%s configured with GTID auto-positioning", SHARD)
+
+
+async def sample() -> dict:
+    """Sample replica lag and the GTID gap between master and replica."""
+    async with replica_engine.connect() as conn:
+        status = await replica_status(conn)
+        replica_executed = (await conn.execute(text("SELECT @@GLOBAL.gtid_executed"))).scalar()
+    async with engine.connect() as conn:
+        missing = (await conn.execute(
+            text("SELECT GTID_SUBTRACT(@@GLOBAL.gtid_executed, :replica)"),
+            {"replica": replica_executed}
+        )).scalar()
+
+    running = bool(status) and status.get("Replica_IO_Running") == "Yes" and status.get("Replica_SQL_Running") == "Yes"
+    lag = status.get("Seconds_Behind_Source") if status else None
+    return {
+        "shard": SHARD,
+        "sampled_at": time.time(),
+        "running": running,
+        "lag_seconds": lag,
+        "gtid_gap": gtid_count(missing or ""),
+        "missing_gtids": missing or "",
+        "last_error": (status.get("Last_Error") or status.get("Last_IO_Error")) if status else "replication not configured",
+    }
+
+
+class ReplicationMonitor:
+    """
+    Periodically samples replica health for this shard.
+
+    Read-routing code calls replica_is_fresh() instead of querying MySQL; the
+    answer comes from the latest sample.
+    """
+
+    def __init__(self, interval: float = REPLICATION_SAMPLE_SECONDS):
+        self.interval = interval
+        self.latest: dict = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> dict:
+        self.latest = await sample()
+        replica_running.set(1 if self.latest["running"] else 0, shard=SHARD)
+        replica_gtid_gap.set(self.latest["gtid_gap"], shard=SHARD)
+        if self.latest["lag_seconds"] is not None:
+            replica_lag_seconds.set(self.latest["lag_seconds"], shard=SHARD)
+        return self.latest
+
+    def replica_is_fresh(self, max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS, max_gtid_gap: int = REPLICA_MAX_GTID_GAP) -> bool:
+        """Whether reads can go to the replica given the latest sample."""
+        latest = self.latest
+        if not latest or not latest["running"] or latest["lag_seconds"] is None:
+            return False
+        if time.time() - latest["sampled_at"] > 3 * self.interval:
+            return False
+        return latest["lag_seconds"] <= max_lag_seconds and latest["gtid_gap"] <= max_gtid_gap
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as exc:
+                logger.warning("Replication sample failed: %s", exc)
+                self.latest = {}
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        # Only MySQL replicas report replication status; the SQLite test harness has none
+        if self._task is None and replica_engine.dialect.name == "mysql":
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+replication_monitor = ReplicationMonitor()
+
+
+def row_checksum(table):
+    """BIT_XOR of a CRC32 over every column, including NULL markers."""
+    columns = list(table.columns)
+    parts = [func.coalesce(cast(column, CHAR), "") for column in columns]
+    parts += [func.isnull(column) for column in columns]
+    return func.coalesce(func.bit_xor(func.crc32(func.concat_ws("#", *parts))), 0)
+
+
+async def _checksum_range(db_engine: AsyncEngine, table, start: int, end: int) -> Tuple[int, int]:
+    async with db_engine.connect() as conn:
+        row = (await conn.execute(
+            select(func.count(), row_checksum(table))
+            .where(table.c.id >= start, table.c.id < end)
+        )).one()
+    return int(row[0]), int(row[1])
+
+
+async def find_drift(table_names: Optional[List[str]] = None, chunk_size: int = CHECKSUM_CHUNK_SIZE) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Compare master and replica checksums over primary-key ranges.
+
+    Each range is a short indexed scan run on both hosts concurrently, so no
+    query holds a long full-table scan. Ranges that differ are re-checked
+    once after a sampling interval to rule out ordinary replication lag.
+
+    Returns:
+        Mapping of table name to mismatched [start, end) id ranges
+    """
+    drift = {}
+    if table_names is None:
+        # Only tables keyed by an integer id can be split into ranges
+        table_names = [name for name, table in Base.metadata.tables.items() if "id" in table.c]
+    tables = [Base.metadata.tables[name] for name in table_names]
+    for table in tables:
+        async with engine.connect() as conn:
+            max_id = (await conn.execute(select(func.max(table.c.id)))).scalar() or 0
+
+        mismatched = []
+        for start in range(0, max_id + 1, chunk_size):
+            master, replica = await asyncio.gather(
+                _checksum_range(engine, table, start, start + chunk_size),
+                _checksum_range(replica_engine, table, start, start + chunk_size),
+            )
+            if master != replica:
+                mismatched.append((start, start + chunk_size))
+
+        if mismatched:
+            await asyncio.sleep(REPLICATION_SAMPLE_SECONDS)
+            confirmed = []
+            for start, end in mismatched:
+                master, replica = await asyncio.gather(
+                    _checksum_range(engine, table, start, end),
+                    _checksum_range(replica_engine, table, start, end),
+                )
+                if master != replica:
+                    confirmed.append((start, end))
+            if confirmed:
+                drift[table.name] = confirmed
+    return drift
+
+
+async def main(command: str):
+    try:
+        if command == "setup":
+            await configure_replica(force=True)
+        elif command == "status":
+            print(await sample())
+        elif command == "check":
+            drift = await find_drift()
+            if drift:
+                for table, ranges in drift.items():
+                    print(f"WARNING: shard {SHARD} table {table} differs in id ranges {ranges}")
+                raise SystemExit(1)
+            print(f"Shard {SHARD} master and replica are in sync")
+    finally:
+        await asyncio.gather(engine.dispose(), replica_engine.dispose())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage replication for this shard (SHARD env).")
+    parser.add_argument("command", choices=["setup", "status", "check"])
+    asyncio.run(main(parser.parse_args().command))
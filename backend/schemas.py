@@ -50,6 +50,11 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductSearchResult(ProductBase):
+    """Schema for a product search hit, served from the in-memory index."""
+    id: int
+    score: float
+
 class ProductUpdate(BaseModel):
     """Schema for updating a product. All fields are optional."""
     name: Optional[str] = None
@@ -109,6 +114,13 @@ class Order(OrderBase):
     class Config:
         from_attributes = True
 
+class QueuedOrder(BaseModel):
+    """Schema for an order accepted into the write-ahead queue."""
+    reference: str
+    status: str
+    order_id: Optional[int] = None
+    error: Optional[str] = None
+
 class OrderUpdate(BaseModel):
     """Schema for updating an order. All fields are optional."""
     total_amount: Optional[float] = None
@@ -141,3 +153,13 @@ class User(UserBase):
 
     class Config:
         from_attributes = True
+
+class UserOrderSummary(BaseModel):
+    """Schema for a user's order aggregates, served from user_order_stats."""
+    user_id: int
+    order_count: int
+    total_spent: float
+    item_count: int
+    last_order_id: Optional[int] = None
+    last_order_status: Optional[OrderStatus] = None
+    updated_at: Optional[datetime] = None
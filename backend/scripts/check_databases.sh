@@ -1,25 +1,12 @@
 #!/bin/bash
 echo "Checking databases..."
 
-check_databases() {
-    host=$1
-    result=$(mysql -h "$host" -uroot -prootpassword -e "SELECT COUNT(*) FROM users;" --skip-column-names)
-    echo "$result"
-}
-
-master_a=$(check_databases "mysql-master-a")
-replica_a=$(check_databases "mysql-replica-a")
-master_b=$(check_databases "mysql-master-b")
-replica_b=$(check_databases "mysql-replica-b")
-
-if [ "$master_a" != "$replica_a" ]; then
-    echo "WARNING: Master A ($master_a) and Replica A ($replica_a) are out of sync!"
-    exit 1
-fi
-
-if [ "$master_b" != "$replica_b" ]; then
-    echo "WARNING: Master B ($master_b) and Replica B ($replica_b) are out of sync!"
-    exit 1
-fi
+# Compare master and replica checksums over primary-key ranges for each shard
+for shard in a b; do
+    if ! SHARD=$shard DB_HOST=mysql-master-$shard python /app/replication.py check; then
+        echo "WARNING: Master ${shard^^} and Replica ${shard^^} are out of sync!"
+        exit 1
+    fi
+done
 
 echo "All databases are in sync"
\ No newline at end of file
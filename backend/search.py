@@ -0,0 +1,235 @@
+import asyncio
+import bisect
+import logging
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "300"))  # 0 disables
+SEARCH_NAME_WEIGHT = float(os.getenv("SEARCH_NAME_WEIGHT", "2.0"))
+SEARCH_MAX_PREFIX_EXPANSIONS = int(os.getenv("SEARCH_MAX_PREFIX_EXPANSIONS", "50"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Score multiplier for terms matched by prefix rather than exactly
+PREFIX_MATCH_WEIGHT = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase alphanumeric tokens."""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+@dataclass
+class IndexedProduct:
+    """Product fields kept in memory so results are served without MySQL."""
+    id: int
+    name: str
+    description: Optional[str]
+    price: float
+    category_id: int
+    length: float
+    terms: Dict[str, float]
+
+
+class ProductSearchIndex:
+    """
+    In-memory inverted index over product names and descriptions.
+
+    Documents are scored with BM25, with name terms weighted by
+    SEARCH_NAME_WEIGHT. Query terms also match indexed terms they are a prefix
+    of, at reduced weight. A sorted term list makes prefix expansion a binary
+    search.
+    """
+
+    def __init__(self):
+        self.docs: Dict[int, IndexedProduct] = {}
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.sorted_terms: List[str] = []
+        self.total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, product):
+        """Add or replace a product."""
+        self.remove(product.id)
+        terms = Counter()
+        for token in tokenize(product.name):
+            terms[token] += SEARCH_NAME_WEIGHT
+        for token in tokenize(product.description):
+            terms[token] += 1.0
+        length = sum(terms.values())
+
+        self.docs[product.id] = IndexedProduct(
+            id=product.id,
+            name=product.name,
+            description=product.description,
+            price=product.price,
+            category_id=product.category_id,
+            length=length,
+            terms=dict(terms),
+        )
+        self.total_length += length
+        for term, frequency in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                bisect.insort(self.sorted_terms, term)
+            postings[product.id] = frequency
+
+    def remove(self, product_id: int):
+        """Remove a product if it is indexed."""
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc.length
+        for term in doc.terms:
+            postings = self.postings[term]
+            del postings[product_id]
+            if not postings:
+                del self.postings[term]
+                del self.sorted_terms[bisect.bisect_left(self.sorted_terms, term)]
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Get indexed terms matching token exactly or by prefix, with their weights."""
+        matches = []
+        if token in self.postings:
+            matches.append((token, 1.0))
+        start = bisect.bisect_right(self.sorted_terms, token)
+        for term in self.sorted_terms[start:start + SEARCH_MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            matches.append((term, PREFIX_MATCH_WEIGHT))
+        return matches
+
+    def search(self, query: str, category_id: Optional[int] = None, limit: int = 20) -> List[Tuple[IndexedProduct, float]]:
+        """
+        Search products.
+
+        Args:
+            query: Free text query
+            category_id: Only return products in this category
+            limit: Maximum number of results
+
+        Returns:
+            List of (product, score) sorted by descending score
+        """
+        if not self.docs:
+            return []
+        doc_count = len(self.docs)
+        average_length = self.total_length / doc_count or 1.0
+        scores: Dict[int, float] = {}
+
+        for token in set(tokenize(query)):
+            for term, weight in self._expand(token):
+                postings = self.postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for product_id, frequency in postings.items():
+                    doc = self.docs[product_id]
+                    if category_id is not None and doc.category_id != category_id:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc.length / average_length)
+                    score = weight * idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    scores[product_id] = scores.get(product_id, 0.0) + score
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self.docs[product_id], score) for product_id, score in best]
+
+
+async def build_index(session_factory, batch_size: int = 1000) -> ProductSearchIndex:
+    """Build a new index from a streaming scan of the products table."""
+    index = ProductSearchIndex()
+    async with session_factory() as session:
+        result = await session.stream_scalars(
+            select(models.Product).execution_options(yield_per=batch_size)
+        )
+        async for product in result:
+            index.add(product)
+    return index
+
+
+class SearchIndexManager:
+    """
+    Owns the live index: the initial build, write hooks and periodic refresh.
+
+    Write hooks only reach the index of the worker that handled the write, so
+    a periodic rebuild (SEARCH_INDEX_REFRESH_SECONDS) converges the other
+    workers. Rebuilds happen off to the side and are swapped in atomically.
+    """
+
+    def __init__(self, refresh_interval: float = SEARCH_INDEX_REFRESH_SECONDS):
+        self.index = ProductSearchIndex()
+        self.refresh_interval = refresh_interval
+        self._task: Optional[asyncio.Task] = None
+        # Writes seen while a rebuild is scanning, replayed onto the new index
+        self._replay: Optional[list] = None
+
+    async def rebuild(self, session_factory):
+        self._replay = []
+        try:
+            index = await build_index(session_factory)
+            for product_id, product in self._replay:
+                if product is None:
+                    index.remove(product_id)
+                else:
+                    index.add(product)
+            self.index = index
+        finally:
+            self._replay = None
+        logger.info("Product search index built with %d products", len(index))
+
+    def product_saved(self, product):
+        self.index.add(product)
+        if self._replay is not None:
+            self._replay.append((product.id, product))
+
+    def product_deleted(self, product_id: int):
+        self.index.remove(product_id)
+        if self._replay is not None:
+            self._replay.append((product_id, None))
+
+    def search(self, query: str, category_id: Optional[int] = None, limit: int = 20):
+        return self.index.search(query, category_id, limit)
+
+    async def _run(self, session_factory):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.rebuild(session_factory)
+            except Exception:
+                logger.exception("Product search index refresh failed")
+
+    async def start(self, session_factory):
+        """Build the index and start periodic refreshes."""
+        try:
+            await self.rebuild(session_factory)
+        except Exception:
+            logger.exception("Product search index build failed")
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+search_index = SearchIndexManager()
@@ -0,0 +1,57 @@
+"""
+Pytest fixtures for the in-process harness (see harness.py).
+
+The stack is built once per session from fresh database files; tests that
+write should use users and products of their own rather than assume the
+seeded counts stay fixed.
+"""
+import pytest
+
+import harness
+
+# Script run against the Docker stack, not a pytest module
+collect_ignore = ["simple_register_test.py"]
+
+# Every test logs in from the same client address; the per-IP login budget
+# is exercised by its own stack in test_rate_limit.py
+STACK_AUTH_ENV = {"LOGIN_IP_BURST": "10000"}
+# Likewise for the per-user budgets on the shards; the seeded users are
+# shared by every test in the session
+STACK_BACKEND_ENV = {"USER_BURST": "10000", "ORDER_WRITE_BURST": "10000"}
+
+
+@pytest.fixture(scope="session")
+def seed() -> harness.Seed:
+    return harness.Seed()
+
+
+@pytest.fixture(scope="session")
+def stack(tmp_path_factory, seed):
+    with harness.stack(tmp_path_factory.mktemp("harness"), seed=seed, auth_env=STACK_AUTH_ENV, backend_env=STACK_BACKEND_ENV) as running:
+        yield running
+
+
+@pytest.fixture(scope="session")
+def auth(stack):
+    return stack.auth
+
+
+@pytest.fixture(scope="session")
+def shards(stack):
+    return stack.shards
+
+
+@pytest.fixture(scope="session")
+def router(stack) -> harness.ShardRouter:
+    return stack.router
+
+
+@pytest.fixture(scope="session")
+def user_token(stack) -> str:
+    """Token of the first seeded user who is not an admin."""
+    return stack.token(stack.seed.admins + 1)
+
+
+@pytest.fixture(scope="session")
+def admin_token(stack) -> str:
+    return stack.token(1)
@@ -0,0 +1,426 @@
+"""
+In-process test harness for the auth service and the backend shards.
+
+Runs the ASGI apps in this process against aiosqlite database files instead
+of the MySQL containers, so correctness and performance checks of the APIs
+run in seconds without Docker. ShardRouter stands in for nginx: it verifies
+the token with the auth service and forwards the request, with the user
+headers, to the shard the user id maps to.
+
+The auth and backend services share module names (database, models, crud,
+metrics, ...) and read their configuration from the environment at import
+time. load_service() therefore imports each service with its own
+environment and removes its modules from sys.modules afterwards; every
+shard is a separate copy of the backend modules.
+
+Install the harness requirements with
+`pip install -r tests/requirements-harness.txt`.
+"""
+import asyncio
+import importlib
+import os
+import random
+import re
+import sys
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.testclient import TestClient
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SHARDS = ("a", "b")
+
+# Password of every seeded user
+SEED_PASSWORD = "Harness-Passw0rd!"
+
+# Environment shared by every service; background tasks that only make
+# sense against MySQL or across processes are off, and responses report
+# their SQL statements (see statement_count())
+BASE_ENV = {
+    "DB_ECHO": "false",
+    "DB_POOL_PRE_PING": "off",
+    "JOBS_ENABLED": "false",
+    "QUERY_PROFILE_SERVER_TIMING": "true",
+}
+
+
+# Modules imported with each service besides main: command-line tools that
+# the app itself does not import
+SERVICE_MODULES = {
+    "auth": ("main", "bulk_import"),
+    "backend": ("main", "export", "cdc", "bootstrap"),
+}
+
+
+@dataclass
+class Service:
+    """An imported service: its ASGI app and its own copies of the service modules."""
+    name: str
+    modules: Dict[str, ModuleType]
+
+    @property
+    def app(self):
+        return self.modules["main"].app
+
+    def __getitem__(self, module: str) -> ModuleType:
+        return self.modules[module]
+
+
+@dataclass
+class Seed:
+    """Data volumes to seed; the same seed value always produces the same data."""
+    users: int = 200
+    admins: int = 1
+    categories: int = 10
+    products: int = 500
+    orders_per_user: int = 3
+    items_per_order: int = 3
+    seed: int = 0
+
+
+@contextmanager
+def environment(env: Dict[str, str]) -> Iterator[None]:
+    """Set environment variables for the duration of the block."""
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def load_service(name: str, env: Dict[str, str]) -> Service:
+    """
+    Import a service's `main` module and its SERVICE_MODULES with env set.
+
+    Args:
+        name: Service directory, "auth" or "backend"
+        env: Environment the service modules read their configuration from
+
+    Returns:
+        Service: The imported modules, no longer registered in sys.modules
+    """
+    directory = REPO_ROOT / name
+    before = set(sys.modules)
+    sys.path.insert(0, str(directory))
+    try:
+        with environment({**BASE_ENV, **env}):
+            for module_name in SERVICE_MODULES[name]:
+                importlib.import_module(module_name)
+    finally:
+        sys.path.remove(str(directory))
+        modules = {}
+        for module_name in set(sys.modules) - before:
+            module_file = getattr(sys.modules[module_name], "__file__", None) or ""
+            if Path(module_file).parent == directory:
+                modules[module_name] = sys.modules.pop(module_name)
+    return Service(name, modules)
+
+
+def sqlite_url(path: Path) -> str:
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def engines(service: Service) -> List[AsyncEngine]:
+    """Every engine a service's modules hold, directly or in a dict such as provisioning's shard engines."""
+    found = {}
+    for module in service.modules.values():
+        for value in list(vars(module).values()):
+            for candidate in value.values() if isinstance(value, dict) else [value]:
+                if isinstance(candidate, AsyncEngine):
+                    found[id(candidate)] = candidate
+    return list(found.values())
+
+
+async def dispose(service: Service):
+    for engine in engines(service):
+        await engine.dispose()
+
+
+def run(service: Service, coro):
+    """
+    Run a coroutine against a service outside its app, then close its connections.
+
+    Pooled aiosqlite connections are bound to the event loop that opened
+    them and each keeps a non-daemon thread alive, so none may outlive the loop.
+    """
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await dispose(service)
+    return asyncio.run(runner())
+
+
+async def create_schema(service: Service):
+    database = service["database"]
+    async with database.engine.begin() as conn:
+        await conn.run_sync(service["models"].Base.metadata.create_all)
+
+
+def seed_user_ids(seed: Seed) -> List[int]:
+    return list(range(1, seed.users + 1))
+
+
+async def seed_auth(service: Service, seed: Seed):
+    """Insert the seeded users into the auth database with a single shared password hash."""
+    hashed_password = service["password"].pwd_context.hash(SEED_PASSWORD)
+    rows = [
+        {
+            "id": user_id,
+            "email": f"user{user_id}@example.com",
+            "hashed_password": hashed_password,
+            "is_active": True,
+            "is_admin": user_id <= seed.admins,
+        }
+        for user_id in seed_user_ids(seed)
+    ]
+    async with service["database"].engine.begin() as conn:
+        await conn.execute(insert(service["models"].AuthUser), rows)
+
+
+async def seed_shard(service: Service, shard: str, seed: Seed, shard_for_user):
+    """
+    Insert the catalog and the shard's users with their orders, then build order stats.
+
+    Every shard gets the same catalog. Users and their orders go to the shard
+    shard_for_user maps them to, as provisioning and the router do.
+    """
+    models = service["models"]
+    rng = random.Random(f"{seed.seed}:{shard}")
+    catalog_rng = random.Random(seed.seed)
+    now = datetime.utcnow()
+
+    categories = [{"id": i, "name": f"Category {i}"} for i in range(1, seed.categories + 1)]
+    products = [
+        {
+            "id": i,
+            "name": f"Product {i} {catalog_rng.choice(['red', 'blue', 'green', 'black'])}",
+            "description": f"Description of product {i}",
+            "price": round(catalog_rng.uniform(1, 500), 2),
+            "category_id": catalog_rng.randint(1, seed.categories),
+        }
+        for i in range(1, seed.products + 1)
+    ]
+    prices = {product["id"]: product["price"] for product in products}
+
+    users, orders, items = [], [], []
+    for user_id in seed_user_ids(seed):
+        if shard_for_user(user_id) != shard:
+            continue
+        users.append({
+            "id": user_id,
+            "email": f"user{user_id}@example.com",
+            "is_active": True,
+            "is_admin": user_id <= seed.admins,
+            "created_at": now - timedelta(days=rng.randint(0, 365)),
+        })
+        for _ in range(seed.orders_per_user):
+            order_id = len(orders) + 1
+            order_items = [
+                {
+                    "id": len(items) + n + 1,
+                    "order_id": order_id,
+                    "product_id": product_id,
+                    "quantity": rng.randint(1, 5),
+                    "price": prices[product_id],
+                }
+                for n, product_id in enumerate(rng.sample(sorted(prices), min(seed.items_per_order, len(prices))))
+            ]
+            items += order_items
+            orders.append({
+                "id": order_id,
+                "user_id": user_id,
+                "total_amount": round(sum(item["quantity"] * item["price"] for item in order_items), 2),
+                "status": rng.choice(list(models.OrderStatus)),
+            })
+
+    async with service["database"].engine.begin() as conn:
+        for model, rows in (
+            (models.ProductCategory, categories),
+            (models.Product, products),
+            (models.User, users),
+            (models.Order, orders),
+            (models.OrderItem, items),
+        ):
+            if rows:
+                await conn.execute(insert(model), rows)
+    await service["order_stats"].rebuild()
+
+
+def statement_count(response) -> int:
+    """Number of SQL statements a response's Server-Timing header reports."""
+    match = re.search(r'db;dur=[\d.]+;desc="(\d+) statements"', response.headers.get("server-timing", ""))
+    if match is None:
+        raise ValueError("Response has no database Server-Timing entry")
+    return int(match.group(1))
+
+
+class RecordingMailSender:
+    """Mail sender for the auth service's mailer that keeps what it sends; addresses in failing are refused."""
+
+    def __init__(self, on_send=None, failing=()):
+        self.sent = []
+        self.on_send = on_send
+        self.failing = set(failing)
+
+    def send(self, to_address: str, subject: str, body: str):
+        if self.on_send is not None:
+            self.on_send(to_address)
+        if to_address in self.failing:
+            raise OSError("Relay refused the message")
+        self.sent.append((to_address, subject, body))
+
+
+class ShardRouter:
+    """
+    Client routing requests the way router/nginx.conf does.
+
+    Paths under /authentication/ go to the auth service. Paths under
+    /backend/ are authenticated with /auth/verify first; the X-User-*
+    headers it returns are forwarded to the shard picked by the first
+    digit of the user id.
+    """
+
+    def __init__(self, auth: TestClient, shards: Dict[str, TestClient], shard_for_user):
+        self.auth = auth
+        self.shards = shards
+        self.shard_for_user = shard_for_user
+
+    def request(self, method: str, path: str, token: Optional[str] = None, headers: Optional[dict] = None, **kwargs):
+        headers = dict(headers or {})
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        if path.startswith("/authentication/"):
+            return self.auth.request(method, path[len("/authentication"):], headers=headers, **kwargs)
+        if not path.startswith("/backend/"):
+            raise ValueError(f"No route for {path}")
+
+        verified = self.auth.get("/auth/verify", headers={"Authorization": headers.get("Authorization", "")})
+        if verified.status_code != 200:
+            return verified
+        user_id = verified.headers["x-user-id"]
+        headers.pop("Authorization", None)
+        headers.update({
+            "X-User-Id": user_id,
+            "X-User-Roles": verified.headers["x-user-roles"],
+            "X-User-Scopes": verified.headers["x-user-scopes"],
+            "X-Forwarded-Prefix": "/backend",
+        })
+        shard = self.shards[self.shard_for_user(int(user_id))]
+        return shard.request(method, path[len("/backend"):], headers=headers, **kwargs)
+
+    def get(self, path: str, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def login(self, email: str, password: str = SEED_PASSWORD) -> str:
+        response = self.auth.post("/auth/token", data={"username": email, "password": password})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+@dataclass
+class Stack:
+    """The auth service and the backend shards, seeded and serving."""
+    auth: Service
+    shards: Dict[str, Service]
+    router: ShardRouter
+    seed: Seed
+    clients: Dict[str, TestClient] = field(default_factory=dict)
+    tokens: Dict[int, str] = field(default_factory=dict)
+
+    def call(self, client: str, func, *args):
+        """Run a coroutine function on the event loop serving a client's app, e.g. to use its engine."""
+        return self.clients[client].portal.call(func, *args)
+
+    def token(self, user_id: int) -> str:
+        """Token of a seeded user, logging in once per stack."""
+        if user_id not in self.tokens:
+            self.tokens[user_id] = self.router.login(f"user{user_id}@example.com")
+        return self.tokens[user_id]
+
+
+@contextmanager
+def stack(
+    directory: Path,
+    seed: Optional[Seed] = None,
+    auth_env: Optional[Dict[str, str]] = None,
+    backend_env: Optional[Dict[str, str]] = None,
+    provisioning: bool = False
+) -> Iterator[Stack]:
+    """
+    Create, seed and start the auth service and one backend per shard.
+
+    Each service gets its own database file in directory. With provisioning
+    on, users registered through the auth service are delivered to the
+    shard databases by its provisioning worker.
+
+    Args:
+        directory: Directory for the database files
+        seed: Data volumes; defaults to Seed()
+        auth_env: Extra environment for the auth service
+        backend_env: Extra environment for every shard
+        provisioning: Run the auth service's provisioning worker
+    """
+    seed = seed or Seed()
+    directory = Path(directory)
+    shard_urls = {f"SHARD_{shard.upper()}_DB_URL": sqlite_url(directory / f"shard_{shard}.db") for shard in SHARDS}
+
+    # provisioning reads the shard URLs when it first connects, not at import
+    with environment(shard_urls), ExitStack() as exit_stack:
+        auth_url = sqlite_url(directory / "auth.db")
+        auth = load_service("auth", {
+            "DATABASE_URL": auth_url,
+            "PROVISIONING_ENABLED": str(provisioning).lower(),
+            # Cheapest hashes passlib accepts; calibration is skipped when pinned
+            "BCRYPT_ROUNDS": "4",
+            "PASSWORD_SCHEMES": "bcrypt",
+            **(auth_env or {}),
+        })
+        shards = {}
+        for shard in SHARDS:
+            url = shard_urls[f"SHARD_{shard.upper()}_DB_URL"]
+            shards[shard] = load_service("backend", {
+                "SHARD": shard,
+                "DATABASE_URL": url,
+                "REPLICA_DATABASE_URL": url,
+                "ORDER_INGEST_MODE": "sync",
+                "ORDER_QUEUE_PATH": str(directory / f"order_queue_{shard}.db"),
+                **(backend_env or {}),
+            })
+
+        shard_for_user = auth["provisioning"].shard_for_user
+
+        async def prepare_auth():
+            await create_schema(auth)
+            await seed_auth(auth, seed)
+        run(auth, prepare_auth())
+        for shard, service in shards.items():
+            async def prepare_shard(service=service, shard=shard):
+                await create_schema(service)
+                await seed_shard(service, shard, seed, shard_for_user)
+            run(service, prepare_shard())
+
+        # Registered first so it runs after every client has shut its app down
+        for service in (auth, *shards.values()):
+            exit_stack.callback(run, service, asyncio.sleep(0))
+
+        # Server errors come back as 500 responses, as they do through nginx
+        clients = {"auth": exit_stack.enter_context(TestClient(auth.app, raise_server_exceptions=False))}
+        for shard, service in shards.items():
+            clients[shard] = exit_stack.enter_context(TestClient(service.app, raise_server_exceptions=False))
+        router = ShardRouter(clients["auth"], {shard: clients[shard] for shard in SHARDS}, shard_for_user)
+        yield Stack(auth, shards, router, seed, clients)
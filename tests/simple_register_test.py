@@ -2,6 +2,7 @@ import requests
 import json
 import random
 import string
+import time
 
 def test_register(email: str, password: str, BASE_URL: str):
 
@@ -18,11 +19,13 @@ def test_register(email: str, password: str, BASE_URL: str):
         # Print results
         print(f"\nStatus Code: {response.status_code}")
         print("Response:", json.dumps(response.json(), indent=2))
+        return response.json().get("id")
         
     except requests.exceptions.ConnectionError:
         print("Error: Could not connect to the auth service")
     except Exception as e:
         print(f"Error: {str(e)}")
+    return None
 
 def get_token(email: str, password: str, BASE_URL: str) -> str:
     print(f"\nGetting token for user: {email}")
@@ -84,29 +87,27 @@ def generate_test_credentials() -> dict:
     
     return email, password
 
-def test_backend(email: str, token: str, BASE_URL: str):
+def test_backend(email: str, user_id: int, token: str, BASE_URL: str):
     print(f"\nTesting backend with token for user: {email}")
-    url = f"{BASE_URL}/api/users"
+    # The auth service provisions the user on its home shard; creating users
+    # directly needs the users:write scope, so read the own record instead
+    url = f"{BASE_URL}/api/users/{user_id}"
     print(f"Making request to: {url}")
 
     try:
-        # Create user in backend
+        # Read the provisioned user from the backend
         headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
+            "Authorization": f"Bearer {token}"
         }
         print(f"Headers: {headers}")
         
-        response = requests.post(
-            url,
-            headers=headers,
-            json={
-                "email": email,
-                "is_active": True,
-                "password": "dummy_password"
-            }
-        )
-        print(f"User creation status code: {response.status_code}")
+        # Provisioning runs in the background, so give it a few seconds
+        for _ in range(5):
+            response = requests.get(url, headers=headers)
+            if response.status_code != 404:
+                break
+            time.sleep(1)
+        print(f"User lookup status code: {response.status_code}")
         print(f"Response headers: {dict(response.headers)}")
         try:
             print("Response:", json.dumps(response.json(), indent=2))
@@ -128,12 +129,12 @@ if __name__ == "__main__":
     print("Test credentials generated")
     print("Email: ", test_email)
     print("Password: ", test_password)
-    test_register(test_email, test_password, BASE_AUTH_URL)
+    user_id = test_register(test_email, test_password, BASE_AUTH_URL)
     # Example of getting a token
     token = get_token(test_email, test_password, BASE_AUTH_URL)
     if token:
         print(f"\nToken: {token}")
-        test_backend(test_email, token, BASE_BACKEND_URL)
+        test_backend(test_email, user_id, token, BASE_BACKEND_URL)
         print("Backend test completed")
     else:
         print("Failed to get token")
@@ -0,0 +1,77 @@
+from fastapi.routing import APIRoute
+
+PRODUCT_ID = 1
+
+
+def first_order_id(router, token: str, user_id: int) -> int:
+    response = router.get(f"/backend/api/users/{user_id}/orders", token=token)
+    assert response.status_code == 200, response.text
+    return response.json()[0]["id"]
+
+
+def test_users_read_their_own_orders_but_not_other_users(router, stack, user_token):
+    user_id = stack.seed.admins + 1
+    # Same shard as user_id, so the order ids overlap
+    other_id = user_id + 2
+    own_order = first_order_id(router, user_token, user_id)
+    other_order = first_order_id(router, stack.token(other_id), other_id)
+
+    assert router.get(f"/backend/api/orders/{own_order}", token=user_token).status_code == 200
+    assert router.get(f"/backend/api/orders/{other_order}", token=user_token).status_code == 404
+    assert router.get(f"/backend/api/users/{other_id}/orders", token=user_token).status_code == 403
+
+
+def test_admins_read_any_order_on_their_shard(router, stack, admin_token):
+    other_id = 3
+    other_order = first_order_id(router, stack.token(other_id), other_id)
+
+    response = router.get(f"/backend/api/orders/{other_order}", token=admin_token)
+    assert response.status_code == 200, response.text
+    assert response.json()["user_id"] == other_id
+
+
+def test_items_can_only_be_added_to_own_orders(router, stack, user_token):
+    user_id = stack.seed.admins + 1
+    other_id = user_id + 2
+    own_order = first_order_id(router, user_token, user_id)
+    other_order = first_order_id(router, stack.token(other_id), other_id)
+    item = {"product_id": PRODUCT_ID, "quantity": 1, "price": 1.0}
+
+    response = router.post(f"/backend/api/orders/{other_order}/items", token=user_token, json=item)
+    assert response.status_code == 404
+    response = router.post(f"/backend/api/orders/{own_order}/items", token=user_token, json=item)
+    assert response.status_code == 200, response.text
+    assert response.json()["order_id"] == own_order
+
+
+def test_user_management_needs_admin_scopes(router, stack, user_token):
+    user_id = stack.seed.admins + 1
+
+    assert router.get(f"/backend/api/users/{user_id}", token=user_token).status_code == 200
+    assert router.get("/backend/api/users", token=user_token).status_code == 403
+    assert router.get("/backend/api/orders", token=user_token).status_code == 403
+    response = router.post(
+        "/backend/api/users", token=user_token, json={"email": "new@example.com", "is_active": True, "password": "unused"}
+    )
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Missing scope: users:write"
+
+
+def test_every_api_route_has_an_authorization_rule(stack):
+    service = stack.shards["a"]
+    rules = service["authorization"].ROUTE_SCOPES
+    routes = [route for route in service.app.routes if isinstance(route, APIRoute) and route.path.startswith("/api/")]
+
+    assert routes
+    missing = [(method, route.path) for route in routes for method in route.methods if (method, route.path) not in rules]
+    assert missing == []
+
+
+def test_routes_without_a_rule_are_denied(router, stack, user_token, monkeypatch):
+    user_id = stack.seed.admins + 1
+    rules = stack.shards[stack.router.shard_for_user(user_id)]["authorization"].ROUTE_SCOPES
+    monkeypatch.delitem(rules, ("GET", "/api/users/{user_id}"))
+
+    response = router.get(f"/backend/api/users/{user_id}", token=user_token)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Route has no authorization rule"
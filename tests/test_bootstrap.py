@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import harness
+
+
+def test_tables_from_older_models_get_new_columns_and_indexes(shards, tmp_path):
+    bootstrap = shards["a"]["bootstrap"]
+    models = shards["a"]["models"]
+    engine = create_async_engine(harness.sqlite_url(tmp_path / "old_shard.db"))
+
+    async def upgrade():
+        async with engine.begin() as conn:
+            # orders as created before ingest_ref existed
+            await conn.execute(text(
+                "CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, total_amount FLOAT, status VARCHAR(9))"
+            ))
+            await conn.execute(text("INSERT INTO orders (id, user_id, total_amount, status) VALUES (1, 2, 5.0, 'PENDING')"))
+            await conn.run_sync(models.Base.metadata.create_all)
+            first = await conn.run_sync(bootstrap.upgrade_tables)
+            second = await conn.run_sync(bootstrap.upgrade_tables)
+            columns = await conn.run_sync(lambda sync_conn: [c["name"] for c in inspect(sync_conn).get_columns("orders")])
+        async with engine.connect() as conn:
+            await conn.execute(text("UPDATE orders SET ingest_ref = 'ref-1' WHERE id = 1"))
+            with pytest.raises(IntegrityError):
+                await conn.execute(text("INSERT INTO orders (id, user_id, ingest_ref) VALUES (2, 2, 'ref-1')"))
+        await engine.dispose()
+        return first, second, columns
+
+    first, second, columns = asyncio.run(upgrade())
+    assert "ingest_ref" in columns
+    assert any("ADD COLUMN ingest_ref" in statement for statement in first)
+    assert any(statement.startswith("CREATE UNIQUE INDEX uq_orders_ingest_ref") for statement in first)
+    assert second == []
@@ -0,0 +1,60 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import harness
+
+PASSWORD = "Import-Passw0rd!"
+
+
+def run_import(stack, tmp_path, lines):
+    bulk_import = stack.auth["bulk_import"]
+    source = tmp_path / "users.ndjson"
+    source.write_text("\n".join(lines) + "\n")
+    report_path = tmp_path / "errors.ndjson"
+
+    async def run():
+        # Threads instead of processes: the service modules are not importable by name here
+        with ThreadPoolExecutor(2) as pool, open(report_path, "w") as report:
+            importer = bulk_import.BulkImporter(pool, report, str(tmp_path / "checkpoint.json"), batch_size=100)
+            await importer.run(bulk_import.iter_records(str(source), "ndjson"))
+            return importer.checkpoint
+
+    checkpoint = stack.call("auth", run)
+    errors = {entry["record"]: entry["error"] for entry in map(json.loads, report_path.read_text().splitlines())}
+    return checkpoint, errors
+
+
+def test_bulk_import(stack, tmp_path):
+    checkpoint, errors = run_import(stack, tmp_path, [
+        json.dumps({"email": "Imported.One@Example.com", "password": PASSWORD}),
+        json.dumps({"email": "imported.one@example.com", "password": PASSWORD}),
+        json.dumps({"email": "USER5@example.com", "password": PASSWORD}),
+        json.dumps(["not", "an", "object"]),
+        "{not json",
+        json.dumps({"email": "imported.two@example.com", "password": "weak"}),
+        json.dumps({"email": "imported.three@example.com", "password": PASSWORD, "is_active": "false"}),
+    ])
+
+    assert checkpoint == {"record": 7, "imported": 2, "rejected": 5}
+    assert errors[2] == "Duplicate email in input"
+    assert errors[3] == "Email already registered"
+    assert errors[4] == "Record is not a JSON object"
+    assert errors[5].startswith("Invalid JSON")
+    assert 6 in errors
+
+    assert stack.router.login("imported.one@example.com", PASSWORD)
+    inactive = stack.clients["auth"].post(
+        "/auth/token", data={"username": "imported.three@example.com", "password": PASSWORD}
+    )
+    assert inactive.status_code == 401
+
+
+def test_bulk_import_resumes_from_checkpoint(stack, tmp_path):
+    lines = [json.dumps({"email": f"resume{n}@example.com", "password": PASSWORD}) for n in range(3)]
+    checkpoint, _ = run_import(stack, tmp_path, lines[:2])
+    assert checkpoint["imported"] == 2
+
+    checkpoint, errors = run_import(stack, tmp_path, lines)
+    assert checkpoint == {"record": 3, "imported": 3, "rejected": 0}
+    assert not errors
+    assert harness.SEED_PASSWORD != PASSWORD and stack.router.login("resume2@example.com", PASSWORD)
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+UUID = "3e11fa47-71ca-11e1-9e33-c80aa9429562"
+
+
+def write_binlog(path, transactions):
+    with open(path, "w") as f:
+        for number, rows in transactions:
+            f.write(json.dumps({"gtid": f"{UUID}:{number}", "committed_at": 1700000000 + number, "rows": rows}) + "\n")
+
+
+def order_insert(order_id):
+    return {"table": "orders", "op": "insert", "after": {"id": order_id, "user_id": 1}}
+
+
+def test_checkpoint_covers_transactions_without_cdc_rows(shards, tmp_path):
+    cdc = shards["a"]["cdc"]
+    binlog = tmp_path / "binlog.ndjson"
+    write_binlog(binlog, [
+        (1, [order_insert(1)]),
+        (2, [{"table": "idempotency_keys", "op": "insert", "after": {"key_hash": "k"}}]),
+        (3, []),
+        (4, [order_insert(2), {"table": "users", "op": "update",
+                               "before": {"id": 1, "hashed_password": "x"}, "after": {"id": 1, "hashed_password": "y"}}]),
+        (5, [{"table": "catalog_versions", "op": "update", "after": {"version": 2}}]),
+    ])
+    sink = cdc.QueueSink()
+    checkpoint_path = tmp_path / "checkpoint.json"
+    reader = cdc.CDCReader(cdc.FileSource(str(binlog), follow=False), sink, str(checkpoint_path), batch_size=2)
+    asyncio.run(reader.run())
+
+    checkpoint = json.loads(checkpoint_path.read_text())
+    assert checkpoint == {"gtid_set": f"{UUID}:1-5", "events": 3}
+    events = [sink.queue.get_nowait() for _ in range(sink.queue.qsize())]
+    assert [(event.gtid.rpartition(":")[2], event.table, event.seq) for event in events] == [
+        ("1", "orders", 0), ("4", "orders", 0), ("4", "users", 1)
+    ]
+    assert "hashed_password" not in events[2].after
+
+    # A restart skips everything already in the checkpoint
+    resumed = cdc.QueueSink()
+    asyncio.run(cdc.CDCReader(cdc.FileSource(str(binlog), follow=False), resumed, str(checkpoint_path)).run())
+    assert resumed.queue.empty()
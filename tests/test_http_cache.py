@@ -0,0 +1,34 @@
+def test_catalog_reads_revalidate_with_etags(router, admin_token):
+    first = router.get("/backend/api/products", token=admin_token, params={"limit": 5})
+    assert first.status_code == 200, first.text
+    etag = first.headers["etag"]
+    # Only the router's micro-cache may share catalog responses between users
+    assert first.headers["cache-control"].startswith("private")
+
+    revalidated = router.get(
+        "/backend/api/products", token=admin_token, params={"limit": 5}, headers={"If-None-Match": etag}
+    )
+    assert revalidated.status_code == 304
+    # The compressed response carries the weak form of the same tag
+    assert revalidated.headers["etag"] == etag.removeprefix("W/")
+    assert revalidated.content == b""
+
+    created = router.post(
+        "/backend/api/products", token=admin_token,
+        json={"name": "Cached product", "description": "ETag test", "price": 3.5, "category_id": 1}
+    )
+    assert created.status_code == 200, created.text
+    assert created.json()["category"]["id"] == 1
+    changed = router.get(
+        "/backend/api/products", token=admin_token, params={"limit": 5}, headers={"If-None-Match": etag}
+    )
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_etags_differ_per_page(router, user_token):
+    first = router.get("/backend/api/categories", token=user_token, params={"limit": 2})
+    second = router.get("/backend/api/categories", token=user_token, params={"limit": 3})
+    assert first.status_code == second.status_code == 200, first.text
+    assert len(first.json()) == 2
+    assert first.headers["etag"] != second.headers["etag"]
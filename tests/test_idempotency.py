@@ -0,0 +1,63 @@
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+ORDER = {"total_amount": 20.0, "status": "pending"}
+
+
+def create_order(router, token, key, json=ORDER):
+    return router.post("/backend/api/orders", token=token, json=json, headers={"Idempotency-Key": key})
+
+
+def test_retries_are_replayed(router, user_token):
+    key = uuid.uuid4().hex
+    first = create_order(router, user_token, key)
+    assert first.status_code == 200, first.text
+    retry = create_order(router, user_token, key)
+    assert retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json()["id"] == first.json()["id"]
+
+
+def test_reusing_a_key_with_another_body_is_rejected(router, user_token):
+    key = uuid.uuid4().hex
+    assert create_order(router, user_token, key).status_code == 200
+    assert create_order(router, user_token, key, json={**ORDER, "total_amount": 21.0}).status_code == 422
+
+
+def test_expired_keys_are_claimed_again(stack, router, user_token):
+    user_id = stack.seed.admins + 1
+    shard = router.shard_for_user(user_id)
+    idempotency = stack.shards[shard]["idempotency"]
+    models = stack.shards[shard]["models"]
+    key = uuid.uuid4().hex
+    key_hash = hashlib.sha256(f"{user_id}:{key}".encode()).hexdigest()
+    first = create_order(router, user_token, key)
+
+    async def expire():
+        # Expired but not yet purged, and no longer in the front cache
+        idempotency.idempotency_store._cache.pop(key_hash, None)
+        async with idempotency.async_session() as db:
+            await db.execute(
+                update(models.IdempotencyRecord)
+                .where(models.IdempotencyRecord.key_hash == key_hash)
+                .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+            )
+            await db.commit()
+    stack.call(shard, expire)
+
+    retry = create_order(router, user_token, key)
+    assert retry.status_code == 200
+    assert "idempotent-replayed" not in retry.headers
+    assert retry.json()["id"] != first.json()["id"]
+    assert create_order(router, user_token, key).headers["idempotent-replayed"] == "true"
+
+
+def test_responses_too_large_to_store_are_not_run_again(stack, router, user_token, monkeypatch):
+    shard = router.shard_for_user(stack.seed.admins + 1)
+    monkeypatch.setattr(stack.shards[shard]["idempotency"], "IDEMPOTENCY_MAX_BODY_BYTES", 10)
+    key = uuid.uuid4().hex
+    assert create_order(router, user_token, key).status_code == 200
+    assert create_order(router, user_token, key).status_code == 409
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+USER_ID = 11
+
+
+def test_logins_between_flushes_collapse_into_one_update(stack, auth):
+    last_login = auth["last_login"]
+    models = auth["models"]
+    first = datetime(2024, 1, 1, 12, 0, 0)
+    latest = first + timedelta(minutes=5)
+
+    async def record_and_flush():
+        buffer = last_login.LastLoginBuffer(session_factory=auth["database"].AsyncSessionLocal)
+        buffer.record(USER_ID, first)
+        buffer.record(USER_ID, latest)
+        updated = await buffer.flush()
+        async with auth["database"].AsyncSessionLocal() as db:
+            stored = await db.scalar(select(models.AuthUser.last_login).filter(models.AuthUser.id == USER_ID))
+        return updated, stored, await buffer.flush()
+
+    assert stack.call("auth", record_and_flush) == (1, latest, 0)
+
+
+def test_logins_are_written_on_flush(stack, auth):
+    user_id = USER_ID + 1
+    stack.token(user_id)
+
+    async def flush_and_read():
+        await auth["last_login"].last_login_buffer.flush()
+        async with auth["database"].AsyncSessionLocal() as db:
+            return await db.scalar(
+                select(auth["models"].AuthUser.last_login).filter(auth["models"].AuthUser.id == user_id)
+            )
+
+    assert stack.call("auth", flush_and_read) is not None
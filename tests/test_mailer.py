@@ -0,0 +1,106 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from harness import RecordingMailSender
+
+
+@pytest.fixture
+def mail(stack, auth, monkeypatch):
+    """Helpers queueing and delivering mail addressed to this test only."""
+    crud, models, mailer = auth["crud"], auth["models"], auth["mailer"]
+    session = auth["database"].AsyncSessionLocal
+    tag = uuid.uuid4().hex[:8]
+
+    class Helpers:
+        def address(self, n):
+            return f"mail-{tag}-{n}@example.com"
+
+        def queue(self, count):
+            async def queue():
+                async with session() as db:
+                    for n in range(count):
+                        crud.queue_mail(db, self.address(n), "Subject", f"Body {n}")
+                    await db.commit()
+            stack.call("auth", queue)
+
+        def deliver(self, sender):
+            monkeypatch.setattr(mailer, "mail_sender", sender)
+            return stack.call("auth", mailer.deliver_mail)
+
+        def rows(self):
+            async def rows():
+                async with session() as db:
+                    result = await db.execute(
+                        select(models.MailOutbox)
+                        .filter(models.MailOutbox.to_address.like(f"mail-{tag}-%"))
+                        .order_by(models.MailOutbox.id)
+                    )
+                    return result.scalars().all()
+            return stack.call("auth", rows)
+
+        def claim(self):
+            async def claim():
+                async with session() as db:
+                    return [row.to_address for row in await crud.claim_pending_mail(db, 1000)]
+            return stack.call("auth", claim)
+
+        def age_claims(self, seconds):
+            async def age():
+                async with session() as db:
+                    await db.execute(
+                        update(models.MailOutbox)
+                        .where(models.MailOutbox.to_address.like(f"mail-{tag}-%"))
+                        .values(claimed_at=datetime.utcnow() - timedelta(seconds=seconds))
+                    )
+                    await db.commit()
+            stack.call("auth", age)
+
+    return Helpers()
+
+
+def test_delivery_sends_and_marks_each_email(mail):
+    mail.queue(3)
+    sender = RecordingMailSender(failing={mail.address(1)})
+    mail.deliver(sender)
+    assert [to for to, _, _ in sender.sent] == [mail.address(0), mail.address(2)]
+    rows = mail.rows()
+    assert [row.sent_at is not None for row in rows] == [True, False, True]
+    assert rows[1].attempts == 1
+    assert rows[1].claimed_at is None
+    assert "refused" in rows[1].last_error
+
+    retry = RecordingMailSender()
+    mail.deliver(retry)
+    assert [to for to, _, _ in retry.sent] == [mail.address(1)]
+
+
+def test_mail_is_claimed_while_it_is_sent(mail):
+    mail.queue(2)
+    # While the first email is being sent, another run finds nothing left to claim
+    claimed_during_send = []
+    done = threading.Event()
+
+    def on_send(to_address):
+        if not done.is_set():
+            done.set()
+            claimed_during_send.extend(set(mail.claim()) & {mail.address(0), mail.address(1)})
+
+    mail.deliver(RecordingMailSender(on_send=on_send))
+    assert done.is_set()
+    assert claimed_during_send == []
+    assert all(row.sent_at is not None for row in mail.rows())
+
+
+def test_stale_claims_are_taken_over(mail, auth):
+    mail.queue(1)
+    timeout = auth["mailer"].MAIL_CLAIM_TIMEOUT_SECONDS
+    assert mail.address(0) in mail.claim()
+    assert mail.address(0) not in mail.claim()
+    mail.age_claims(timeout + 1)
+    sender = RecordingMailSender()
+    mail.deliver(sender)
+    assert [to for to, _, _ in sender.sent] == [mail.address(0)]
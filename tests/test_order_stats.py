@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import event
+
+USER_ID = 7
+
+
+@pytest.fixture
+def owner(stack):
+    """A seeded user's token and the shard service holding their orders."""
+    return stack.token(USER_ID), stack.shards[stack.router.shard_for_user(USER_ID)], stack.router.shard_for_user(USER_ID)
+
+
+def summary(router, token):
+    response = router.get(f"/backend/api/users/{USER_ID}/summary", token=token)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_summary_follows_every_order_mutation(stack, router, owner):
+    token, service, shard = owner
+    crud = service["crud"]
+    schemas = service["schemas"]
+
+    def call(func, *args):
+        async def run():
+            async with service["database"].async_session() as db:
+                return await func(db, *args)
+        return stack.call(shard, run)
+
+    before = summary(router, token)
+
+    created = router.post("/backend/api/orders", token=token, json={"total_amount": 40.0, "status": "pending"})
+    assert created.status_code == 200, created.text
+    order_id = created.json()["id"]
+    after = summary(router, token)
+    assert after["order_count"] == before["order_count"] + 1
+    assert after["total_spent"] == pytest.approx(before["total_spent"] + 40.0)
+    assert after["last_order_id"] == order_id
+    assert after["last_order_status"] == "pending"
+
+    item = router.post(
+        f"/backend/api/orders/{order_id}/items", token=token, json={"product_id": 1, "quantity": 3, "price": 10.0}
+    )
+    assert item.status_code == 200, item.text
+    assert item.json()["product"]["id"] == 1
+    item_id = item.json()["id"]
+    assert summary(router, token)["item_count"] == before["item_count"] + 3
+
+    updated = call(crud.update_order_item, order_id, item_id, schemas.OrderItemUpdate(quantity=5))
+    assert updated.quantity == 5
+    assert summary(router, token)["item_count"] == before["item_count"] + 5
+
+    call(crud.update_order_status, order_id, service["models"].OrderStatus.CANCELLED)
+    after = summary(router, token)
+    assert after["total_spent"] == pytest.approx(before["total_spent"])
+    assert after["last_order_status"] == "cancelled"
+
+    order = call(crud.update_order, order_id, schemas.OrderUpdate(status="shipped", total_amount=50.0))
+    assert [item.id for item in order.order_items] == [item_id]
+    assert summary(router, token)["total_spent"] == pytest.approx(before["total_spent"] + 50.0)
+
+    assert call(crud.delete_order_item, order_id, item_id)
+    assert summary(router, token)["item_count"] == before["item_count"]
+
+    assert call(crud.delete_order, order_id)
+    after = summary(router, token)
+    assert after["order_count"] == before["order_count"]
+    assert after["total_spent"] == pytest.approx(before["total_spent"])
+    assert after["item_count"] == before["item_count"]
+
+    # The incrementally maintained stats match a rebuild from the orders tables
+    call(service["order_stats"].rebuild_range, USER_ID, USER_ID + 1)
+    rebuilt = summary(router, token)
+    for field in ("order_count", "item_count", "last_order_id", "last_order_status"):
+        assert rebuilt[field] == after[field]
+    assert rebuilt["total_spent"] == pytest.approx(after["total_spent"])
+
+
+def test_order_reads(router, owner):
+    token = owner[0]
+    orders = router.get(f"/backend/api/users/{USER_ID}/orders", token=token)
+    assert orders.status_code == 200, orders.text
+    assert orders.json()
+    order = orders.json()[0]
+    assert order["user_id"] == USER_ID
+    assert order["order_items"][0]["product"]["category"]["id"]
+
+    single = router.get(f"/backend/api/orders/{order['id']}", token=token)
+    assert single.status_code == 200, single.text
+    assert single.json() == order
+
+
+def test_the_stats_row_is_locked_before_the_order_is_written(stack, router, owner):
+    token, service, shard = owner
+    sync_engine = service["database"].engine.sync_engine
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split("(")[0].split()[:3]).upper())
+
+    event.listen(sync_engine, "before_cursor_execute", capture)
+    try:
+        created = router.post("/backend/api/orders", token=token, json={"total_amount": 5.0, "status": "pending"})
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", capture)
+    assert created.status_code == 200, created.text
+    writes = [statement for statement in statements if statement.startswith(("INSERT", "UPDATE"))]
+    assert writes[:3] == ["INSERT INTO USER_ORDER_STATS", "INSERT INTO ORDERS", "UPDATE USER_ORDER_STATS SET"]
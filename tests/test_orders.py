@@ -0,0 +1,27 @@
+import asyncio
+
+PRODUCT_ID = 1
+
+
+def test_create_order_returns_the_order_with_its_items(router, user_token, stack):
+    response = router.post(
+        "/backend/api/orders", token=user_token, json={"total_amount": 12.5, "status": "pending"}
+    )
+    assert response.status_code == 200, response.text
+    order = response.json()
+    assert order["user_id"] == stack.seed.admins + 1
+    assert order["total_amount"] == 12.5
+    assert order["order_items"] == []
+
+
+def test_queued_orders_reject_a_reused_idempotency_key_with_another_payload(shards, tmp_path):
+    order_queue = shards["a"]["order_queue"]
+    queue = order_queue.OrderQueue(str(tmp_path / "order_queue.db"))
+    payload = {"total_amount": 10.0, "status": "pending"}
+
+    first = asyncio.run(queue.enqueue(7, payload, "key-1"))
+    assert first["status"] == "queued"
+    assert asyncio.run(queue.enqueue(7, dict(payload), "key-1"))["ref"] == first["ref"]
+    assert asyncio.run(queue.enqueue(7, {**payload, "total_amount": 99.0}, "key-1")) is None
+    # Keys are scoped per user
+    assert asyncio.run(queue.enqueue(8, {**payload, "total_amount": 99.0}, "key-1"))["ref"] != first["ref"]
@@ -0,0 +1,38 @@
+from passlib.context import CryptContext
+
+
+def bcrypt_hash(rounds):
+    return CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash("Some-Passw0rd!")
+
+
+def test_only_weaker_bcrypt_hashes_are_rehashed(auth):
+    password = auth["password"]
+    context = password.HashingPolicy(schemes=["bcrypt"], bcrypt_rounds=5).context()
+    assert context.needs_update(bcrypt_hash(4))
+    assert not context.needs_update(bcrypt_hash(5))
+    assert not context.needs_update(bcrypt_hash(7))
+    assert context.hash("Some-Passw0rd!").startswith("$2b$05$")
+
+
+def test_calibration_never_goes_below_the_floor(auth):
+    password = auth["password"]
+    assert password.BCRYPT_MIN_ROUNDS == 12
+    # A budget far below one hash at the floor cost still gets the floor
+    assert password.calibrate_bcrypt_rounds(0.001) == password.BCRYPT_MIN_ROUNDS
+
+
+def test_registration_hashes_off_the_event_loop(router, auth, monkeypatch):
+    crud = auth["crud"]
+    hashed_in = []
+    hash_async = crud.get_password_hash_async
+
+    async def recording_hash(password):
+        hashed_in.append(password)
+        return await hash_async(password)
+    monkeypatch.setattr(crud, "get_password_hash_async", recording_hash)
+
+    response = router.post(
+        "/authentication/auth/register", json={"email": "offloop@example.com", "password": "Off-L00p-Passw0rd!"}
+    )
+    assert response.status_code == 200, response.text
+    assert hashed_in == ["Off-L00p-Passw0rd!"]
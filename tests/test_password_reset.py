@@ -0,0 +1,82 @@
+import re
+import uuid
+
+from sqlalchemy import select
+
+from harness import RecordingMailSender
+
+NEW_PASSWORD = "Brand-New-Passw0rd!"
+
+
+def request_reset(auth_client, email):
+    return auth_client.post("/auth/password-reset", json={"email": email})
+
+
+def deliver(stack, monkeypatch, sender):
+    mailer = stack.auth["mailer"]
+    monkeypatch.setattr(mailer, "mail_sender", sender)
+    return stack.call("auth", mailer.deliver_mail)
+
+
+def outbox(stack, email):
+    auth = stack.auth
+    mail = auth["models"].MailOutbox
+
+    async def rows():
+        async with auth["database"].AsyncSessionLocal() as db:
+            result = await db.execute(select(mail).filter(mail.to_address == email).order_by(mail.id))
+            return result.scalars().all()
+    return stack.call("auth", rows)
+
+
+def register(stack, email):
+    response = stack.router.post("/authentication/auth/register", json={"email": email, "password": "Old-Passw0rd!"})
+    assert response.status_code == 200, response.text
+
+
+def test_reset_link_sets_a_new_password_once(stack, monkeypatch):
+    client = stack.clients["auth"]
+    email = f"reset-{uuid.uuid4().hex[:8]}@example.com"
+    register(stack, email)
+    assert request_reset(client, email).status_code == 200
+
+    sender = RecordingMailSender()
+    deliver(stack, monkeypatch, sender)
+    [(to_address, _, body)] = [sent for sent in sender.sent if sent[0] == email]
+    token = re.search(r"token=(\S+)", body).group(1)
+    # Once sent, the outbox no longer holds the link
+    [row] = outbox(stack, email)
+    assert row.sent_at is not None
+    assert token not in row.body
+
+    confirm = {"token": token, "new_password": NEW_PASSWORD}
+    assert client.post("/auth/password-reset/confirm", json=confirm).status_code == 200
+    assert client.post("/auth/password-reset/confirm", json=confirm).status_code == 400
+    assert stack.router.login(email, NEW_PASSWORD)
+
+
+def test_unknown_emails_get_the_same_answer(stack):
+    response = request_reset(stack.clients["auth"], f"nobody-{uuid.uuid4().hex[:8]}@example.com")
+    assert response.status_code == 200
+    assert "If the email exists" in response.json()["message"]
+
+
+def test_reset_requests_are_limited_per_email(stack):
+    client = stack.clients["auth"]
+    email = f"flood-{uuid.uuid4().hex[:8]}@example.com"
+    burst = stack.auth["rate_limit"].PASSWORD_RESET_EMAIL_BURST
+    statuses = [request_reset(client, email.upper() if n % 2 else email).status_code for n in range(burst + 1)]
+    assert statuses == [200] * burst + [429]
+
+
+def test_bodies_of_mail_that_gives_up_are_dropped(stack, monkeypatch):
+    email = f"bounce-{uuid.uuid4().hex[:8]}@example.com"
+    register(stack, email)
+    request_reset(stack.clients["auth"], email)
+    max_attempts = stack.auth["mailer"].MAIL_MAX_ATTEMPTS
+    for _ in range(max_attempts):
+        deliver(stack, monkeypatch, RecordingMailSender(failing={email}))
+    [row] = outbox(stack, email)
+    assert row.attempts == max_attempts
+    assert row.sent_at is None
+    assert row.body == ""
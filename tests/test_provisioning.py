@@ -0,0 +1,139 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, insert, select
+
+import harness
+
+PASSWORD = "Provision-Passw0rd!"
+
+
+@pytest.fixture(scope="module")
+def provisioned(tmp_path_factory):
+    with harness.stack(
+        tmp_path_factory.mktemp("provisioning"),
+        seed=harness.Seed(users=10, products=20, orders_per_user=1),
+        auth_env={"PROVISIONING_POLL_SECONDS": "0.05"},
+        provisioning=True,
+    ) as running:
+        yield running
+
+
+def add_shard_user(stack, shard, user_id, email):
+    service = stack.shards[shard]
+
+    async def add():
+        async with service["database"].async_session() as db:
+            await db.execute(insert(service["models"].User).values(id=user_id, email=email, is_active=True))
+            await db.commit()
+    stack.call(shard, add)
+
+
+def shard_user(stack, shard, user_id):
+    service = stack.shards[shard]
+
+    async def get():
+        async with service["database"].async_session() as db:
+            return await db.get(service["models"].User, user_id)
+    return stack.call(shard, get)
+
+
+def outbox_row(stack, user_id, timeout=5.0):
+    """The user's outbox row once the worker has delivered or failed it."""
+    auth = stack.auth
+    outbox = auth["models"].ProvisioningOutbox
+
+    async def get():
+        async with auth["database"].AsyncSessionLocal() as db:
+            result = await db.execute(select(outbox).filter(outbox.user_id == user_id))
+            return result.scalars().first()
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        row = stack.call("auth", get)
+        if row is not None and (row.delivered_at is not None or row.last_error):
+            return row
+        time.sleep(0.05)
+    raise AssertionError(f"Outbox row of user {user_id} was not processed")
+
+
+def register(stack, email):
+    response = stack.router.post("/authentication/auth/register", json={"email": email, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def test_delivers_new_users_to_their_shard(provisioned):
+    user_id = register(provisioned, "provisioned@example.com")
+    shard = provisioned.router.shard_for_user(user_id)
+    assert outbox_row(provisioned, user_id).delivered_at is not None
+    assert shard_user(provisioned, shard, user_id).email == "provisioned@example.com"
+
+
+def test_conflicting_shard_rows_are_not_overwritten(provisioned):
+    max_attempts = provisioned.auth["provisioning"].PROVISIONING_MAX_ATTEMPTS
+    next_id = provisioned.seed.users + 2
+    # A user created directly on the shard took the id auth assigns next
+    shard = provisioned.router.shard_for_user(next_id)
+    add_shard_user(provisioned, shard, next_id, "squatter@example.com")
+    # and another one holds an email under an id of its own
+    other_shard = provisioned.router.shard_for_user(next_id + 1)
+    add_shard_user(provisioned, other_shard, 5000 + next_id, "taken@example.com")
+
+    assert register(provisioned, "victim@example.com") == next_id
+    row = outbox_row(provisioned, next_id)
+    assert row.delivered_at is None
+    assert row.attempts == max_attempts
+    assert "squatter@example.com" in row.last_error
+    assert shard_user(provisioned, shard, next_id).email == "squatter@example.com"
+
+    assert register(provisioned, "taken@example.com") == next_id + 1
+    row = outbox_row(provisioned, next_id + 1)
+    assert row.delivered_at is None
+    assert "belongs to shard user" in row.last_error
+    assert shard_user(provisioned, other_shard, next_id + 1) is None
+
+
+def test_failed_rows_back_off_and_stop_at_the_attempt_cap(provisioned):
+    auth = provisioned.auth
+    provisioning = auth["provisioning"]
+    crud = auth["crud"]
+    outbox = auth["models"].ProvisioningOutbox
+
+    assert provisioning.retry_at(1) < provisioning.retry_at(3)
+    assert provisioning.retry_at(100) <= datetime.utcnow() + timedelta(
+        seconds=provisioning.PROVISIONING_RETRY_MAX_SECONDS + 1
+    )
+
+    # Runs last in this module: the worker would claim the rows first
+    provisioned.call("auth", provisioning.provisioning_worker.stop)
+
+    async def claimed_user_ids():
+        async with auth["database"].AsyncSessionLocal() as db:
+            later = datetime.utcnow() + timedelta(hours=1)
+            await db.execute(insert(outbox).values([
+                {"user_id": 1, "email": "user1@example.com", "attempts": 1, "next_attempt_at": later},
+                {"user_id": 2, "email": "user2@example.com", "attempts": provisioning.PROVISIONING_MAX_ATTEMPTS,
+                 "next_attempt_at": None},
+                {"user_id": 3, "email": "user3@example.com", "attempts": 0, "next_attempt_at": None},
+            ]))
+            await db.commit()
+            try:
+                claims = [
+                    {row.user_id for row in await crud.claim_pending_provisioning(
+                        db, 100, provisioning.PROVISIONING_MAX_ATTEMPTS
+                    )}
+                    for _ in range(2)
+                ]
+            finally:
+                await db.execute(delete(outbox).where(outbox.user_id.in_([1, 2, 3])))
+                await db.commit()
+            return claims
+
+    first, second = provisioned.call("auth", claimed_user_ids)
+    assert 1 not in first
+    assert 2 not in first
+    assert 3 in first
+    # Claimed rows wait for their lease to run out
+    assert 3 not in second
@@ -0,0 +1,31 @@
+import asyncio
+
+import harness
+
+
+def test_requests_report_their_statements(router, user_token):
+    response = router.get("/backend/api/users/2/summary", token=user_token)
+    assert response.status_code == 200, response.text
+    assert harness.statement_count(response) >= 1
+
+
+def test_jobs_scheduled_by_a_request_are_not_profiled_with_it(stack, auth):
+    jobs = auth["jobs"]
+    query_profile = auth["query_profile"]
+    seen = []
+
+    async def job():
+        seen.append(query_profile.current_queries())
+
+    async def schedule_during_request():
+        scheduler = jobs.JobScheduler(jobs.LeaderLock())
+        scheduler._started = True
+        token = query_profile._current.set(query_profile.RequestQueries())
+        try:
+            scheduler.once(job)
+        finally:
+            query_profile._current.reset(token)
+        await asyncio.gather(*scheduler._tasks)
+
+    stack.call("auth", schedule_during_request)
+    assert seen == [None]
@@ -0,0 +1,133 @@
+import ast
+import asyncio
+from pathlib import Path
+
+import pytest
+
+import harness
+
+
+@pytest.fixture(scope="module")
+def limited(tmp_path_factory):
+    """A small stack with tight budgets, so limits are reached in a few requests."""
+    with harness.stack(
+        tmp_path_factory.mktemp("rate_limit"),
+        seed=harness.Seed(users=10, products=20, orders_per_user=1),
+        auth_env={
+            "LOGIN_IP_RATE": "0.001",
+            "LOGIN_IP_BURST": "30",
+            "LOGIN_ACCOUNT_RATE": "0.001",
+            "LOGIN_ACCOUNT_BURST": "2",
+            "PASSWORD_RESET_IP_RATE": "0.001",
+            "PASSWORD_RESET_IP_BURST": "3",
+        },
+        backend_env={"ORDER_WRITE_RATE": "0.001", "ORDER_WRITE_BURST": "3"},
+    ) as running:
+        yield running
+
+
+def login(stack, email, password, **kwargs):
+    return stack.clients["auth"].post("/auth/token", data={"username": email, "password": password}, **kwargs)
+
+
+def test_successful_logins_do_not_use_up_the_account_budget(limited):
+    for _ in range(5):
+        assert login(limited, "user2@example.com", harness.SEED_PASSWORD).status_code == 200
+
+
+def test_failed_logins_exhaust_the_account_budget(limited):
+    assert login(limited, "user3@example.com", "wrong").status_code == 401
+    assert login(limited, "user3@example.com", "wrong").status_code == 401
+    response = login(limited, "USER3@example.com", "wrong")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    # Other accounts are unaffected
+    assert login(limited, "user4@example.com", harness.SEED_PASSWORD).status_code == 200
+
+
+def test_trusted_proxies(limited):
+    rate_limit = limited.auth["rate_limit"]
+    proxies = rate_limit.TrustedProxies(["10.0.0.0/8", "127.0.0.1"])
+    assert asyncio.run(proxies.contains("10.1.2.3"))
+    assert asyncio.run(proxies.contains("127.0.0.1"))
+    assert not asyncio.run(proxies.contains("192.168.1.1"))
+    assert not asyncio.run(proxies.contains("testclient"))
+    assert not asyncio.run(rate_limit.TrustedProxies([]).contains("10.1.2.3"))
+
+
+def test_password_reset_requests_are_limited_per_ip(limited):
+    statuses = [
+        limited.clients["auth"].post("/auth/password-reset", json={"email": f"reset{n}@example.com"}).status_code
+        for n in range(4)
+    ]
+    assert statuses == [200, 200, 200, 429]
+
+
+def test_the_account_budget_is_shared_across_client_addresses(limited, monkeypatch):
+    rate_limit = limited.auth["rate_limit"]
+    addresses = iter(f"198.51.100.{n}" for n in range(10))
+
+    async def rotating_ip(request):
+        return next(addresses)
+    monkeypatch.setattr(rate_limit, "get_client_ip", rotating_ip)
+    statuses = [login(limited, "user5@example.com", "wrong").status_code for _ in range(3)]
+    assert statuses == [401, 401, 429]
+
+
+def test_auth_memory_buckets_hold_each_workers_share_of_the_budget(limited):
+    store = limited.auth["rate_limit"].MemoryRateLimitStore(workers=2)
+
+    async def taken():
+        return [(await store.take("account:user6@example.com", 0.001, 4))[0] for _ in range(3)]
+    assert asyncio.run(taken()) == [True, True, False]
+
+
+def class_source(module, name: str) -> str:
+    source = Path(module.__file__).read_text()
+    node = next(node for node in ast.parse(source).body if isinstance(node, ast.ClassDef) and node.name == name)
+    return ast.get_source_segment(source, node)
+
+
+def test_auth_and_shard_memory_stores_are_identical(limited):
+    auth_store = class_source(limited.auth["rate_limit"], "MemoryRateLimitStore")
+    assert auth_store == class_source(limited.shards["a"]["rate_limit"], "MemoryRateLimitStore")
+
+
+def test_rotating_x_real_ip_does_not_bypass_the_ip_budget(limited):
+    # Runs last in this module: it spends the client's whole IP budget
+    statuses = [
+        login(limited, f"nobody{n}@example.com", "wrong", headers={"X-Real-IP": f"203.0.113.{n}"}).status_code
+        for n in range(40)
+    ]
+    assert 429 in statuses
+    assert statuses[-1] == 429
+
+
+def test_memory_buckets_hold_each_workers_share_of_the_budget(limited):
+    rate_limit = limited.shards["a"]["rate_limit"]
+    single = rate_limit.MemoryRateLimitStore(workers=1)
+    shared = rate_limit.MemoryRateLimitStore(workers=4)
+
+    async def taken(store):
+        return [(await store.take("user:1", 0.001, 8))[0] for _ in range(9)]
+    assert asyncio.run(taken(single)) == [True] * 8 + [False]
+    assert asyncio.run(taken(shared)) == [True] * 2 + [False] * 7
+
+
+def test_tracked_keys_are_only_exported_by_the_memory_store(limited, monkeypatch):
+    rate_limit = limited.shards["a"]["rate_limit"]
+    assert any(name == "backend_rate_limit_tracked_keys" for name, _, _ in rate_limit._rate_limit_samples())
+    monkeypatch.setattr(rate_limit, "store", rate_limit.RedisRateLimitStore(client=None))
+    assert not any(name == "backend_rate_limit_tracked_keys" for name, _, _ in rate_limit._rate_limit_samples())
+
+
+def test_order_writes_over_the_route_budget_are_rejected(limited):
+    user_id = 5
+    shard = limited.router.shard_for_user(user_id)
+    headers = {"X-User-Id": str(user_id), "X-User-Scopes": "orders:write"}
+    order = {"total_amount": 1.0, "status": "pending"}
+    statuses = [
+        limited.clients[shard].post("/api/orders", json=order, headers=headers).status_code
+        for _ in range(4)
+    ]
+    assert statuses == [200, 200, 200, 429]
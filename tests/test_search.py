@@ -0,0 +1,28 @@
+def search(router, token, q, **params):
+    response = router.get("/backend/api/products/search", token=token, params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_results_match_every_query_term(router, user_token):
+    results = search(router, user_token, "blue product")
+    assert results
+    assert all("blue" in result["name"].lower() for result in results)
+    assert [result["score"] for result in results] == sorted((result["score"] for result in results), reverse=True)
+
+
+def test_results_can_be_filtered_by_category(router, user_token):
+    results = search(router, user_token, "product", category_id=1, limit=100)
+    assert results
+    assert {result["category_id"] for result in results} == {1}
+
+
+def test_new_products_are_searchable_right_away(router, admin_token):
+    response = router.post(
+        "/backend/api/products",
+        token=admin_token,
+        json={"name": "Zanzibar lantern", "description": "Brass", "price": 30.0, "category_id": 1},
+    )
+    assert response.status_code == 200, response.text
+    # Prefixes match too
+    assert [result["id"] for result in search(router, admin_token, "zanzi")] == [response.json()["id"]]
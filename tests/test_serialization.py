@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/backend/api/products", "/backend/api/users"])
+def test_fast_lists_match_the_response_model_path(router, admin_token, stack, monkeypatch, path):
+    api = stack.shards[router.shard_for_user(1)]["api"]
+    params = {"skip": 3, "limit": 20}
+    expected = router.get(path, token=admin_token, params=params)
+    assert expected.status_code == 200, expected.text
+
+    monkeypatch.setattr(api, "FAST_JSON_LISTS", True)
+    fast = router.get(path, token=admin_token, params=params)
+    assert fast.status_code == 200, fast.text
+    assert fast.json() == expected.json()